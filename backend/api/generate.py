@@ -12,6 +12,9 @@ from typing import Optional, List
 from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Request
 from pydantic import BaseModel
 from mathvideo.utils import make_slug
+from mathvideo.stream_events import parse_stream_event
+from mathvideo.render_pool import arender_scene
+from backend.api.refiner import update_final_video
 
 router = APIRouter()
 
@@ -133,6 +136,24 @@ async def broadcast_status(task_id: str, status: str, data: dict = None):
     await _safe_broadcast(task_id, status_data)
 
 
+async def broadcast_stream(task_id: str, event: dict):
+    """
+    向所有订阅该任务的 WebSocket 客户端广播 LLM 流式增量
+
+    参数:
+        task_id: 任务 ID
+        event: CLI 输出的流式事件（stage / section / delta / done）
+    """
+    stream_data = json.dumps({
+        "type": "stream",
+        "stage": event.get("stage"),
+        "section": event.get("section"),
+        "delta": event.get("delta", ""),
+        "done": bool(event.get("done")),
+    })
+    await _safe_broadcast(task_id, stream_data)
+
+
 async def run_generation(task_id: str, prompt: str, render: bool, image_paths: Optional[List[str]] = None):
     """
     异步执行视频生成流程
@@ -176,6 +197,8 @@ async def run_generation(task_id: str, prompt: str, render: bool, image_paths: O
             cmd_parts.extend(["--image", img_path])
         if render:
             cmd_parts.append("--render")
+        # 让 CLI 输出分镜/代码的流式增量，前端可实时查看正在生成的代码
+        cmd_parts.append("--stream-events")
         
         await broadcast_log(task_id, f"📂 输出目录: output/{task_id}")
         
@@ -202,6 +225,11 @@ async def run_generation(task_id: str, prompt: str, render: bool, image_paths: O
                 break
             
             decoded_line = line.decode("utf-8", errors="replace").strip()
+            # 流式增量事件单独转发，不写入日志
+            stream_event = parse_stream_event(decoded_line)
+            if stream_event is not None:
+                await broadcast_stream(task_id, stream_event)
+                continue
             if decoded_line:
                 # 根据内容判断日志级别
                 level = "info"
@@ -474,13 +502,15 @@ async def regenerate_section(slug: str, section_id: str):
                 previous_code = f.read()
     
     try:
-        # 调用 Coder 重新生成代码
-        from mathvideo.agents.coder import generate_code
-        code, class_name = generate_code(
-            section,
-            previous_code=previous_code,
-            task_type=task_type,
-        )
+        # 调用 Coder 重新生成代码（异步版本，等待 LLM 期间不阻塞事件循环）
+        from mathvideo.agents.coder import agenerate_code
+        from mathvideo.metrics import metrics_project
+        with metrics_project(project_dir):
+            code, class_name = await agenerate_code(
+                section,
+                previous_code=previous_code,
+                task_type=task_type,
+            )
         
         if not code:
             raise HTTPException(status_code=500, detail="代码生成失败")
@@ -491,32 +521,24 @@ async def regenerate_section(slug: str, section_id: str):
         with open(script_path, "w", encoding="utf-8") as f:
             f.write(code)
         
-        # 渲染
-        env = os.environ.copy()
-        env["PYTHONPATH"] = PROJECT_ROOT
-        cmd = [sys.executable, "-m", "manim", "-ql", "--media_dir", media_dir, script_path, class_name]
-        
-        render_result = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            cwd=PROJECT_ROOT,
-            env=env,
-        )
-        stdout, stderr = await render_result.communicate()
+        # 渲染（优先使用常驻渲染进程，进程池不可用时回退为 manim 子进程）
+        render_result = await arender_scene(script_path, class_name, media_dir, cwd=PROJECT_ROOT)
         
-        if render_result.returncode == 0:
+        if render_result["ok"]:
             return {
                 "success": True,
                 "message": f"章节 '{section_id}' 重新生成且渲染成功",
                 "class_name": class_name,
                 "section": section,
+                "cache_hit": render_result.get("cache_hit", False),
+                "animation_cache": render_result.get("animation_cache"),
+                "final_video": await update_final_video(slug),
             }
         else:
             return {
                 "success": False,
                 "message": f"章节 '{section_id}' 代码已重新生成，但渲染失败",
-                "error": stderr.decode("utf-8", errors="replace")[-500:] if stderr else "未知错误",
+                "error": (render_result.get("error") or "未知错误")[-500:],
                 "class_name": class_name,
                 "section": section,
             }
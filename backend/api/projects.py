@@ -12,6 +12,9 @@ from datetime import datetime
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from mathvideo.metrics import load_metrics, summarize
+from mathvideo.segment_manifest import load_manifest
+
 router = APIRouter()
 
 # 项目输出目录（相对于项目根目录）
@@ -175,6 +178,30 @@ async def update_storyboard(slug: str, storyboard: dict):
         raise HTTPException(status_code=500, detail=f"保存 Storyboard 失败: {str(e)}")
 
 
+@router.get("/{slug}/metrics")
+async def get_metrics(slug: str, records: bool = False):
+    """
+    获取项目的 LLM / 视觉调用统计
+    
+    参数:
+        slug: 项目标识符
+        records: 是否同时返回逐条调用记录
+    
+    返回:
+        按阶段汇总的调用次数、耗时、token 用量和估算成本
+    """
+    project_dir = os.path.join(OUTPUT_DIR, slug)
+    
+    if not os.path.isdir(project_dir):
+        raise HTTPException(status_code=404, detail=f"项目 '{slug}' 不存在")
+    
+    entries = load_metrics(project_dir)
+    result = {"slug": slug, "summary": summarize(entries)}
+    if records:
+        result["records"] = entries
+    return result
+
+
 @router.get("/{slug}/videos")
 async def list_videos(slug: str):
     """
@@ -220,6 +247,26 @@ async def list_videos(slug: str):
     return {"videos": videos}
 
 
+@router.get("/{slug}/segments")
+async def get_segments(slug: str):
+    """
+    获取完整视频的分镜清单（每个章节在 final_video.mp4 中的起点、时长和内容哈希）
+
+    参数:
+        slug: 项目标识符
+
+    返回:
+        分镜清单
+    """
+    project_dir = os.path.join(OUTPUT_DIR, slug)
+    if not os.path.isdir(project_dir):
+        raise HTTPException(status_code=404, detail=f"项目 '{slug}' 不存在")
+    manifest = load_manifest(project_dir)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="该项目还没有合并后的完整视频")
+    return manifest
+
+
 @router.get("/{slug}/scripts")
 async def list_scripts(slug: str):
     """
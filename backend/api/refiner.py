@@ -12,7 +12,10 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
 from mathvideo.agents.critic import VisualCritic
-from mathvideo.agents.coder import refine_code
+from mathvideo.agents.coder import arefine_code
+from mathvideo.metrics import metrics_project
+from mathvideo.render_pool import arender_scene
+from mathvideo.segment_manifest import sync_final_video
 
 router = APIRouter()
 
@@ -91,6 +94,48 @@ def get_script_path(slug: str, section_id: str) -> Optional[str]:
     return script_path if os.path.exists(script_path) else None
 
 
+async def update_final_video(slug: str) -> Optional[dict]:
+    """
+    章节重新渲染后同步 final_video.mp4
+
+    按故事板顺序收集各章节当前的视频，分镜清单有效时只把内容变化的分镜替换进完整视频，
+    否则重新合并全部分镜。
+
+    参数:
+        slug: 项目标识符
+
+    返回:
+        {"path", "strategy", "sections", "elapsed"}，没有可合并的视频或合并失败时返回 None
+    """
+    project_dir = os.path.join(OUTPUT_DIR, slug)
+    storyboard_path = os.path.join(project_dir, "storyboard.json")
+    if not os.path.exists(storyboard_path):
+        return None
+    with open(storyboard_path, "r", encoding="utf-8") as f:
+        storyboard = json.load(f)
+
+    section_videos = []
+    for section in storyboard.get("sections", []):
+        section_id = section.get("id", "")
+        video_path = find_video_for_section(slug, section_id)
+        if video_path:
+            section_videos.append((section_id, video_path))
+
+    try:
+        result = await asyncio.to_thread(sync_final_video, project_dir, section_videos)
+    except Exception as e:
+        print(f"⚠️ 更新完整视频失败: {e}")
+        return None
+    if not result:
+        return None
+    return {
+        "path": f"/static/{slug}/{os.path.basename(result['path'])}",
+        "strategy": result["strategy"],
+        "sections": result["sections"],
+        "elapsed": round(result["elapsed"], 3),
+    }
+
+
 @router.post("/{slug}/critique/{section_id}", response_model=CritiqueResponse)
 async def critique_section(slug: str, section_id: str):
     """
@@ -130,9 +175,12 @@ async def critique_section(slug: str, section_id: str):
         raise HTTPException(status_code=404, detail=f"章节 '{section_id}' 不存在")
     
     try:
-        # 执行视觉分析
+        # 执行视觉分析（异步版本，不阻塞事件循环和 WebSocket 日志推送）
         critic = VisualCritic()
-        suggestion = critic.critique(video_path, section)
+        with metrics_project(os.path.join(OUTPUT_DIR, slug)):
+            suggestion = await critic.acritique(
+                video_path, section, script_path=get_script_path(slug, section_id)
+            )
         
         return CritiqueResponse(
             success=True,
@@ -187,7 +235,8 @@ async def refine_section(slug: str, request: RefineRequest):
             if section:
                 try:
                     critic = VisualCritic()
-                    suggestion = critic.critique(video_path, section)
+                    with metrics_project(os.path.join(OUTPUT_DIR, slug)):
+                        suggestion = await critic.acritique(video_path, section, script_path=script_path)
                 except Exception:
                     pass
     
@@ -205,7 +254,8 @@ async def refine_section(slug: str, request: RefineRequest):
             current_code = f.read()
         
         # 调用优化函数
-        refined_code = refine_code(current_code, suggestion)
+        with metrics_project(os.path.join(OUTPUT_DIR, slug)):
+            refined_code = await arefine_code(current_code, suggestion)
         
         if refined_code:
             # 保存优化后的代码
@@ -270,37 +320,32 @@ async def render_section(slug: str, section_id: str):
         venv_python = os.path.join(PROJECT_ROOT, ".venv", "bin", "python")
     python_exe = venv_python if os.path.isfile(venv_python) else sys.executable
     
-    cmd = [
-        python_exe, "-m", "manim", "-ql",
-        "--media_dir", media_dir,
-        script_path, class_name
-    ]
-    
-    env = os.environ.copy()
-    env["PYTHONPATH"] = PROJECT_ROOT
-    
     try:
-        result = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
+        # 优先在常驻渲染进程中渲染，进程池不可用时回退为 manim 子进程
+        result = await arender_scene(
+            script_path,
+            class_name,
+            media_dir,
+            python_exe=python_exe,
             cwd=PROJECT_ROOT,
-            env=env
         )
-        
-        stdout, stderr = await result.communicate()
-        
-        if result.returncode == 0:
+
+        if result["ok"]:
             return {
                 "success": True,
                 "message": f"章节 '{section_id}' 渲染成功",
-                "class_name": class_name
+                "class_name": class_name,
+                "cache_hit": result.get("cache_hit", False),
+                # 每个动画是否复用了已有的 partial movie 片段
+                "animation_cache": result.get("animation_cache"),
+                # 只把这个章节替换进完整视频
+                "final_video": await update_final_video(slug),
             }
         else:
             return {
                 "success": False,
                 "message": f"渲染失败",
-                "error": stderr.decode("utf-8")[-500:]  # 只返回最后500字符
+                "error": result["error"][-500:]  # 只返回最后500字符
             }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"渲染执行失败: {str(e)}")
@@ -18,6 +18,9 @@ from fastapi.staticfiles import StaticFiles
 from backend.api.projects import router as projects_router
 from backend.api.generate import router as generate_router
 from backend.api.refiner import router as refiner_router
+from mathvideo.circuit_breaker import circuit_states
+from mathvideo.http_pool import aclose_clients
+from mathvideo.render_pool import get_render_pool, shutdown_render_pool
 
 # 创建 FastAPI 应用实例
 app = FastAPI(
@@ -50,6 +53,24 @@ if os.path.exists(output_dir):
     app.mount("/static", StaticFiles(directory=output_dir), name="static")
 
 
+@app.on_event("startup")
+async def warm_render_pool():
+    """启动常驻 Manim 渲染进程，首次重新渲染章节时无需等待导入 manim"""
+    get_render_pool()
+
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    """关闭共享的异步 HTTP 客户端，释放 keep-alive 连接"""
+    await aclose_clients()
+
+
+@app.on_event("shutdown")
+async def close_render_pool():
+    """结束常驻渲染进程"""
+    shutdown_render_pool()
+
+
 @app.get("/")
 async def root():
     """根路由，返回 API 基本信息"""
@@ -62,8 +83,8 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """健康检查接口"""
-    return {"status": "healthy"}
+    """健康检查接口（附带视觉模型各接口的熔断器状态）"""
+    return {"status": "healthy", "circuits": circuit_states()}
 
 
 if __name__ == "__main__":
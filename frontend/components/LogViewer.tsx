@@ -1,11 +1,11 @@
 'use client';
 
-import { useEffect, useRef, useMemo } from 'react';
+import { useEffect, useRef, useMemo, useState } from 'react';
 import { Terminal, ClipboardList, ImageIcon, Code2, Film, Sparkles } from 'lucide-react';
 import { Card } from '@/components/ui/card';
 import { ScrollArea } from '@/components/ui/scroll-area';
 import { getWebSocketBaseUrl } from '@/lib/api';
-import type { LogMessage, GenerateStatus, CompletionData } from '@/lib/types';
+import type { LogMessage, GenerateStatus, CompletionData, StreamMessage } from '@/lib/types';
 
 interface LogViewerProps {
   taskId: string | null;
@@ -21,6 +21,8 @@ export default function LogViewer({ taskId, logs, status, rendered, onLog, onSta
   const wsRef = useRef<WebSocket | null>(null);
   const heartbeatRef = useRef<NodeJS.Timeout | null>(null);
   const connectedTaskIdRef = useRef<string | null>(null);
+  // 正在生成的代码（流式增量拼接）
+  const [liveCode, setLiveCode] = useState<{ section: string | null; text: string; done: boolean } | null>(null);
 
   // 自动滚动
   useEffect(() => {
@@ -57,6 +59,14 @@ export default function LogViewer({ taskId, logs, status, rendered, onLog, onSta
         const data = JSON.parse(event.data);
         if (data.type === 'log') {
           onLogRef.current(data.level || 'info', data.message);
+        } else if (data.type === 'stream') {
+          const msg = data as StreamMessage;
+          if (msg.stage !== 'code') return;
+          setLiveCode(prev => {
+            // 新章节开始时清空之前的代码
+            const base = prev && prev.section === msg.section ? prev.text : '';
+            return { section: msg.section, text: base + msg.delta, done: msg.done };
+          });
         } else if (data.type === 'status') {
           onStatusChangeRef.current(data.status, data.data);
           if (data.status === 'completed') {
@@ -189,6 +199,19 @@ export default function LogViewer({ taskId, logs, status, rendered, onLog, onSta
         </div>
       </ScrollArea>
     </Card>
+
+      {/* 实时代码预览：显示 LLM 正在生成的章节代码 */}
+      {liveCode && status === 'running' && (
+        <Card className="overflow-hidden">
+          <div className="px-4 py-2 border-b border-border flex items-center gap-2 text-sm text-muted-foreground">
+            <Code2 className={`h-3.5 w-3.5 ${liveCode.done ? '' : 'animate-pulse'}`} />
+            <span>{liveCode.section ?? '代码'} {liveCode.done ? '生成完成' : '生成中...'}</span>
+          </div>
+          <ScrollArea className="h-60">
+            <pre className="p-4 font-mono text-xs whitespace-pre-wrap break-all bg-card">{liveCode.text}</pre>
+          </ScrollArea>
+        </Card>
+      )}
     </div>
   );
 }
@@ -9,9 +9,12 @@ import type {
   Storyboard,
   VideoInfo,
   ScriptInfo,
+  ProjectMetrics,
   GenerateResponse,
   CritiqueResponse,
   RefineResponse,
+  RenderSectionResponse,
+  SegmentManifest,
 } from './types';
 
 /**
@@ -121,6 +124,14 @@ export async function getScripts(slug: string): Promise<{ scripts: ScriptInfo[]
   return apiRequest<{ scripts: ScriptInfo[] }>(`/projects/${slug}/scripts`);
 }
 
+export async function getSegments(slug: string): Promise<SegmentManifest> {
+  return apiRequest<SegmentManifest>(`/projects/${slug}/segments`);
+}
+
+export async function getProjectMetrics(slug: string, records = false): Promise<ProjectMetrics> {
+  return apiRequest<ProjectMetrics>(`/projects/${slug}/metrics${records ? '?records=true' : ''}`);
+}
+
 // ============ 生成 API ============
 
 export async function startGeneration(
@@ -169,7 +180,7 @@ export async function refineSection(
 export async function renderSection(
   slug: string,
   sectionId: string
-): Promise<{ success: boolean; message: string }> {
+): Promise<RenderSectionResponse> {
   return apiRequest(`/refiner/${slug}/render/${sectionId}`, {
     method: 'POST',
   });
@@ -47,6 +47,39 @@ export interface ScriptInfo {
   content: string;
 }
 
+// ============ 调用统计 ============
+
+export interface MetricsBucket {
+  calls: number;
+  errors: number;
+  cache_hits: number;
+  retries: number;
+  latency_ms: number;
+  max_latency_ms: number;
+  input_tokens: number;
+  output_tokens: number;
+  cache_creation_input_tokens: number;
+  cache_read_input_tokens: number;
+  cost_usd: number;
+}
+
+export interface HedgeStats {
+  requests: number;
+  hedged: number;
+  wins: Record<string, number>;
+  saved_ms: number;
+}
+
+export interface ProjectMetrics {
+  slug: string;
+  summary: {
+    total: MetricsBucket;
+    stages: Record<string, MetricsBucket>;
+    hedges?: Record<string, HedgeStats>;
+  };
+  records?: Record<string, unknown>[];
+}
+
 // ============ 生成相关 ============
 
 export interface GenerateRequest {
@@ -72,6 +105,15 @@ export interface LogMessage {
 
 export type GenerateStatus = 'idle' | 'running' | 'completed' | 'failed';
 
+/** WebSocket 流式增量事件（LLM 正在生成的分镜/代码） */
+export interface StreamMessage {
+  type: 'stream';
+  stage: 'storyboard' | 'code';
+  section: string | null;
+  delta: string;
+  done: boolean;
+}
+
 /** WebSocket 完成状态附带的数据 */
 export interface CompletionData {
   slug?: string;
@@ -100,6 +142,42 @@ export interface RefineResponse {
   refined: boolean;
 }
 
+export interface RenderSectionResponse {
+  success: boolean;
+  message: string;
+  cache_hit?: boolean;
+  /** 每个动画是否复用了 manim 的 partial movie 缓存 */
+  animation_cache?: boolean[] | null;
+  /** 重新渲染后同步的完整视频，合并失败时为 null */
+  final_video?: FinalVideoUpdate | null;
+}
+
+export interface FinalVideoUpdate {
+  path: string;
+  /** unchanged / splice（只替换变化的章节）/ remux / transcode / ffmpeg（重新合并） */
+  strategy: string;
+  sections: string[];
+  elapsed: number;
+}
+
+export interface SegmentInfo {
+  section_id: string;
+  path: string;
+  sha256: string;
+  start: number | null;
+  duration: number | null;
+  transcoded: boolean;
+}
+
+export interface SegmentManifest {
+  version: number;
+  video: string;
+  strategy: string;
+  video_sha256: string;
+  updated_at: number;
+  segments: SegmentInfo[];
+}
+
 // ============ Tab 相关 ============
 
 export type TabType = 'videos' | 'storyboard' | 'scripts';
@@ -1,7 +1,14 @@
 """Agent modules for MathVideo."""
 
 from .planner import generate_storyboard, describe_images
-from .coder import generate_code, fix_code, refine_code
+from .coder import (
+    generate_code,
+    fix_code,
+    refine_code,
+    agenerate_code,
+    afix_code,
+    arefine_code,
+)
 from .critic import VisualCritic
 from .asset_manager import AssetManager
 from .router import classify_task, get_section_mode
@@ -13,6 +20,9 @@ __all__ = [
     "generate_code",
     "fix_code",
     "refine_code",
+    "agenerate_code",
+    "afix_code",
+    "arefine_code",
     "VisualCritic",
     "AssetManager",
     "classify_task",
@@ -37,7 +37,7 @@ class AssetManager:
         return storyboard_data
 
     def _analyze_needs(self, storyboard):
-        llm = get_llm(temperature=0.3)
+        llm = get_llm(temperature=0.3, stage="assets")
         prompt = ChatPromptTemplate.from_template(ASSET_PROMPT)
         chain = prompt | llm | JsonOutputParser()
         
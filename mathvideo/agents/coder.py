@@ -7,84 +7,193 @@ from langchain_core.output_parsers import StrOutputParser
 # 从llm_client模块导入get_llm函数，用于创建LLM客户端
 from mathvideo.llm_client import get_llm
 # 从prompts模块导入代码生成和修复的提示模板
-from mathvideo.agents.prompts import CODER_PROMPT, CODER_SEQUENTIAL_PROMPT, FIX_CODE_PROMPT, REFINE_CODE_PROMPT
+from mathvideo.agents.prompts import (
+    CODER_PROMPT,
+    CODER_SEQUENTIAL_PROMPT,
+    CODER_INPUT_PROMPT,
+    CODER_SEQUENTIAL_INPUT_PROMPT,
+    FIX_CODE_PROMPT,
+    REFINE_CODE_PROMPT,
+)
 from mathvideo.agents.skill_manager import load_skills
+from mathvideo.config import LLM_STREAMING
 
-def generate_code(section_data: dict, previous_code: str = "", task_type: str = "knowledge"):
+def _code_fence_closed(text: str) -> bool:
     """
-    为特定章节生成Manim Python代码
-    
-    功能说明：
-    本函数使用LLM根据章节的故事板数据生成完整的Manim动画代码。
-    对于递进式任务（geometry/proof），会将前序 Section 的完整代码作为上下文传入。
-    
-    参数:
-        section_data (dict): 章节数据字典
-        previous_code (str): 前序 Section 的完整代码（仅递进模式使用）
-        task_type (str): 任务类型，用于选择 Prompt 模板和加载 Skill
-    
+    检测输出中的 Markdown 代码块是否已闭合
+
+    代码块闭合后模型通常只会输出解释性文字，可以提前终止流式生成。
+    结束 fence 必须位于行首，避免误判代码字符串中的反引号。
+    """
+    start = text.find("```")
+    if start == -1:
+        return False
+    return text.find("\n```", start + 3) != -1
+
+
+def _run_code_chain(chain, params: dict, on_token=None) -> str:
+    """
+    执行代码生成链，返回 LLM 输出文本
+
+    启用流式输出时逐块回调 on_token，并在 Python 代码块闭合后提前终止；
+    否则一次性调用。
+    """
+    if not (LLM_STREAMING or on_token):
+        return chain.invoke(params)
+
+    text = ""
+    stream = chain.stream(params)
+    try:
+        for chunk in stream:
+            text += chunk
+            if on_token:
+                on_token(chunk)
+            if _code_fence_closed(text):
+                break
+    finally:
+        # 关闭生成器会关闭底层 HTTP 响应，服务端随即停止生成
+        stream.close()
+    return text
+
+
+async def _arun_code_chain(chain, params: dict, on_token=None) -> str:
+    """
+    _run_code_chain 的异步版本
+    """
+    if not (LLM_STREAMING or on_token):
+        return await chain.ainvoke(params)
+
+    text = ""
+    stream = chain.astream(params)
+    try:
+        async for chunk in stream:
+            text += chunk
+            if on_token:
+                on_token(chunk)
+            if _code_fence_closed(text):
+                break
+    finally:
+        await stream.aclose()
+    return text
+
+
+def _build_code_chain(section_data: dict, previous_code: str, task_type: str):
+    """
+    构建代码生成链和调用参数（generate_code / agenerate_code 共用）
+
     返回:
-        tuple: (code, class_name) 元组
+        tuple: (chain, invoke_params)
     """
     # 创建LLM客户端实例
     # max_tokens=16384：代码生成任务需要充足的输出空间，避免代码被截断
-    llm = get_llm(temperature=0.5, max_tokens=16384)
+    llm = get_llm(temperature=0.5, max_tokens=16384, stage="coder")
     
     # 根据任务类型和是否有前序代码选择 Prompt 模板
     is_sequential = (task_type in ("geometry", "proof")) and bool(previous_code)
     base_prompt = CODER_SEQUENTIAL_PROMPT if is_sequential else CODER_PROMPT
+    input_prompt = CODER_SEQUENTIAL_INPUT_PROMPT if is_sequential else CODER_INPUT_PROMPT
     
     # 加载对应类型的 Skill 并追加到 Prompt
     skills_text = load_skills(task_type)
     if skills_text:
         base_prompt = base_prompt + "\n" + skills_text
     
-    prompt = ChatPromptTemplate.from_template(base_prompt)
+    # 静态指令 + Skill 作为 system 消息（可缓存前缀），章节数据作为 human 消息
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", base_prompt),
+        ("human", input_prompt),
+    ])
     chain = prompt | llm | StrOutputParser()
     
     # 打印开始生成代码的信息
     mode_label = "递进模式" if is_sequential else "独立模式"
     print(f"Generating code for section: {section_data['title']} [{mode_label}]...")
     
+    # 构建调用参数
+    invoke_params = {
+        "title": section_data['title'],
+        "lecture_lines": section_data['lecture_lines'],
+        "animations": section_data['animations'],
+    }
+    
+    # 递进模式额外传入前序代码和对象信息
+    if is_sequential:
+        invoke_params["previous_code"] = previous_code
+        invoke_params["inherited_objects"] = section_data.get("inherited_objects", [])
+        invoke_params["new_objects"] = section_data.get("new_objects", [])
+    
+    return chain, invoke_params
+
+
+def _finalize_code(code: str, section_data: dict):
+    """
+    清理 LLM 输出并按章节 ID 重命名场景类
+
+    返回:
+        tuple: (code, class_name) 元组
+    """
+    # 清理代码：移除markdown代码块标记（```python和```）
+    code = clean_code(code)
+    
+    # 确保类名唯一且正确
+    # 虽然可以信任LLM生成的类名，但为了确保唯一性，我们基于章节ID重命名
+    # 提示中要求生成"SectionScene"，但我们希望类名基于章节ID，如"Section1Scene"
+    
+    # 生成基于章节ID的类名
+    # 例如："section_1" -> "Section1Scene"
+    # 步骤：移除下划线 -> 首字母大写 -> 添加"Scene"后缀
+    class_name = section_data['id'].replace("_", "").title() + "Scene"
+    # 在代码中将"SectionScene"替换为新的类名
+    code = code.replace("class SectionScene", f"class {class_name}")
+    
+    # 返回清理后的代码和类名
+    return code, class_name
+
+
+def generate_code(section_data: dict, previous_code: str = "", task_type: str = "knowledge", on_token=None):
+    """
+    为特定章节生成Manim Python代码
+    
+    功能说明：
+    本函数使用LLM根据章节的故事板数据生成完整的Manim动画代码。
+    对于递进式任务（geometry/proof），会将前序 Section 的完整代码作为上下文传入。
+    
+    参数:
+        section_data (dict): 章节数据字典
+        previous_code (str): 前序 Section 的完整代码（仅递进模式使用）
+        task_type (str): 任务类型，用于选择 Prompt 模板和加载 Skill
+        on_token (callable, 可选): 流式输出回调，每收到一段文本增量调用一次
+    
+    返回:
+        tuple: (code, class_name) 元组
+    """
+    chain, invoke_params = _build_code_chain(section_data, previous_code, task_type)
     try:
-        # 构建调用参数
-        invoke_params = {
-            "title": section_data['title'],
-            "lecture_lines": section_data['lecture_lines'],
-            "animations": section_data['animations'],
-        }
-        
-        # 递进模式额外传入前序代码和对象信息
-        if is_sequential:
-            invoke_params["previous_code"] = previous_code
-            invoke_params["inherited_objects"] = section_data.get("inherited_objects", [])
-            invoke_params["new_objects"] = section_data.get("new_objects", [])
-        
-        # 调用处理链
-        code = chain.invoke(invoke_params)
-        
-        # 清理代码：移除markdown代码块标记（```python和```）
-        code = clean_code(code)
-        
-        # 确保类名唯一且正确
-        # 虽然可以信任LLM生成的类名，但为了确保唯一性，我们基于章节ID重命名
-        # 提示中要求生成"SectionScene"，但我们希望类名基于章节ID，如"Section1Scene"
-        
-        # 生成基于章节ID的类名
-        # 例如："section_1" -> "Section1Scene"
-        # 步骤：移除下划线 -> 首字母大写 -> 添加"Scene"后缀
-        class_name = section_data['id'].replace("_", "").title() + "Scene"
-        # 在代码中将"SectionScene"替换为新的类名
-        code = code.replace("class SectionScene", f"class {class_name}")
-        
-        # 返回清理后的代码和类名
-        return code, class_name
+        # 调用处理链（流式输出时代码块闭合即停止）
+        code = _run_code_chain(chain, invoke_params, on_token=on_token)
+        return _finalize_code(code, section_data)
     except Exception as e:
         # 如果生成过程中出现任何异常，捕获并打印错误信息
         print(f"Error generating code: {e}")
         # 返回None表示生成失败
         return None, None
 
+
+async def agenerate_code(section_data: dict, previous_code: str = "", task_type: str = "knowledge", on_token=None):
+    """
+    generate_code 的异步版本
+
+    通过 ClaudeDirectChat._agenerate 原生异步调用 API，
+    在 FastAPI 路由中 await 时不会阻塞事件循环。参数与返回值同 generate_code。
+    """
+    chain, invoke_params = _build_code_chain(section_data, previous_code, task_type)
+    try:
+        code = await _arun_code_chain(chain, invoke_params, on_token=on_token)
+        return _finalize_code(code, section_data)
+    except Exception as e:
+        print(f"Error generating code: {e}")
+        return None, None
+
 def fix_code(code: str, error_message: str):
     """
     根据错误信息修复生成的代码
@@ -129,7 +238,7 @@ def fix_code(code: str, error_message: str):
     # temperature=0.2：极低温度，确保修复的准确性和一致性
     # 代码修复需要精确性，所以使用极低温度
     # max_tokens=16384：修复后的代码可能与原始代码等长，需要足够空间
-    llm = get_llm(temperature=0.2, max_tokens=16384)
+    llm = get_llm(temperature=0.2, max_tokens=16384, stage="fixer")
     # 从代码修复提示模板创建聊天提示模板
     # FIX_CODE_PROMPT包含错误修复的详细指令和格式要求
     prompt = ChatPromptTemplate.from_template(FIX_CODE_PROMPT)
@@ -142,8 +251,8 @@ def fix_code(code: str, error_message: str):
     
     try:
         # 调用处理链，传入原始代码和错误信息
-        # invoke()方法会执行整个链：格式化提示 -> 调用LLM -> 提取字符串
-        fixed_code = chain.invoke({
+        # 执行整个链：格式化提示 -> 调用LLM -> 提取字符串（流式时代码块闭合即停止）
+        fixed_code = _run_code_chain(chain, {
             "code": code,  # 原始代码
             "error": error_message  # 错误信息
         })
@@ -156,6 +265,26 @@ def fix_code(code: str, error_message: str):
         # 返回None表示修复失败
         return None
 
+async def afix_code(code: str, error_message: str):
+    """
+    fix_code 的异步版本，参数与返回值同 fix_code。
+    """
+    llm = get_llm(temperature=0.2, max_tokens=16384, stage="fixer")
+    prompt = ChatPromptTemplate.from_template(FIX_CODE_PROMPT)
+    chain = prompt | llm | StrOutputParser()
+    
+    print(f"🔧 Attempting to fix code...")
+    
+    try:
+        fixed_code = await _arun_code_chain(chain, {
+            "code": code,
+            "error": error_message
+        })
+        return clean_code(fixed_code)
+    except Exception as e:
+        print(f"Error fixing code: {e}")
+        return None
+
 def refine_code(code: str, feedback: str):
     """
     根据视觉反馈优化代码
@@ -174,7 +303,7 @@ def refine_code(code: str, feedback: str):
     # 创建LLM客户端
     # temperature=0.3：适中的温度，允许一点灵活性来调整布局，但保持逻辑
     # max_tokens=16384：优化后的代码需要完整输出
-    llm = get_llm(temperature=0.3, max_tokens=16384)
+    llm = get_llm(temperature=0.3, max_tokens=16384, stage="refiner")
     
     # 创建提示模板
     prompt = ChatPromptTemplate.from_template(REFINE_CODE_PROMPT)
@@ -186,7 +315,7 @@ def refine_code(code: str, feedback: str):
     
     try:
         # 调用LLM
-        refined_code = chain.invoke({
+        refined_code = _run_code_chain(chain, {
             "code": code,
             "feedback": feedback
         })
@@ -197,6 +326,26 @@ def refine_code(code: str, feedback: str):
         print(f"Error refining code: {e}")
         return None
 
+async def arefine_code(code: str, feedback: str):
+    """
+    refine_code 的异步版本，参数与返回值同 refine_code。
+    """
+    llm = get_llm(temperature=0.3, max_tokens=16384, stage="refiner")
+    prompt = ChatPromptTemplate.from_template(REFINE_CODE_PROMPT)
+    chain = prompt | llm | StrOutputParser()
+    
+    print(f"✨ Refining code based on specific feedback...")
+    
+    try:
+        refined_code = await _arun_code_chain(chain, {
+            "code": code,
+            "feedback": feedback
+        })
+        return clean_code(refined_code)
+    except Exception as e:
+        print(f"Error refining code: {e}")
+        return None
+
 def clean_code(code_str):
     """
     清理代码字符串，移除markdown代码块标记
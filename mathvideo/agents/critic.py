@@ -1,15 +1,32 @@
-import base64
+import asyncio
+import hashlib
 import json
-import requests
-from mathvideo.agents.prompts import CRITIC_PROMPT
+import time
+from mathvideo.agents.prompts import CRITIC_BATCH_PROMPT, CRITIC_PROMPT
+from mathvideo.circuit_breaker import CircuitOpenError
+from mathvideo.critique_cache import frame_hashes, get_critique_cache, section_fingerprint
+from mathvideo.frame_sampler import sample_frames
+from mathvideo.hedging import ahedged_call, hedged_call
+from mathvideo.image_payload import build_image_contents
+from mathvideo.layout_check import format_findings, load_layout_report
 from mathvideo.config import (
     USE_VISUAL_FEEDBACK,
+    CRITIC_BATCH_MAX_SECTIONS,
+    LAYOUT_CHECK,
+    VISION_CONTACT_SHEET,
     GEMINI_API_KEY,
     CLAUDE_API_KEY,
     CLAUDE_BASE_URL,
-    CLAUDE_MODEL_NAME,
+    get_stage_model,
 )
-from mathvideo.gemini_native import generate_content_from_parts, messages_content_to_parts
+from mathvideo.gemini_native import (
+    generate_content_from_parts,
+    agenerate_content_from_parts,
+    messages_content_to_parts,
+)
+from mathvideo.metrics import record_call
+from mathvideo.retry import post_with_retry, apost_with_retry
+from mathvideo.segment_manifest import file_sha256
 
 class VisualCritic:
     """
@@ -21,28 +38,61 @@ class VisualCritic:
         self.claude_enabled = USE_VISUAL_FEEDBACK and bool(CLAUDE_API_KEY)
         self.enabled = self.gemini_enabled or self.claude_enabled
 
-    def _call_gemini_vision(self, messages_content):
+    def _call_gemini_vision(self, messages_content, stage="critic"):
         """
         调用 Gemini 原生 API 进行视觉分析。
+
+        stage 为写入调用指标的阶段（批量评估为 "critic_batch"）。
         """
         try:
             parts = messages_content_to_parts(messages_content)
-            content = generate_content_from_parts(parts, timeout=120)
+            content = generate_content_from_parts(
+                parts,
+                model=get_stage_model("critic", provider="gemini")[1],
+                timeout=120,
+                stage=stage,
+            )
             if not content:
                 print("   ⚠️ Gemini 返回空内容，将尝试回退到 Claude。")
                 return None
             return content if isinstance(content, str) else str(content)
+        except CircuitOpenError as e:
+            print(f"   ⏭️ 跳过 Gemini: {e}")
+            return None
         except Exception as e:
             print(f"   ⚠️ Gemini 视觉调用失败: {e}")
             return None
 
-    def _call_claude_vision(self, messages_content):
+    async def _acall_gemini_vision(self, messages_content, stage="critic"):
         """
-        调用 Claude 进行视觉分析（Anthropic Messages API）。
+        _call_gemini_vision 的异步版本。
         """
-        if not self.claude_enabled:
+        try:
+            parts = messages_content_to_parts(messages_content)
+            content = await agenerate_content_from_parts(
+                parts,
+                model=get_stage_model("critic", provider="gemini")[1],
+                timeout=120,
+                stage=stage,
+            )
+            if not content:
+                print("   ⚠️ Gemini 返回空内容，将尝试回退到 Claude。")
+                return None
+            return content if isinstance(content, str) else str(content)
+        except CircuitOpenError as e:
+            print(f"   ⏭️ 跳过 Gemini: {e}")
+            return None
+        except Exception as e:
+            print(f"   ⚠️ Gemini 视觉调用失败: {e}")
             return None
 
+    def _build_claude_request(self, messages_content, max_tokens=4096):
+        """
+        构建 Claude 视觉分析请求（Anthropic Messages API），返回 (headers, payload)。
+        messages_content 的第一项是评估提示词（CRITIC_PROMPT / CRITIC_BATCH_PROMPT），作为 system 消息传入。
+        """
+        first = messages_content[0] if messages_content else {}
+        prompt = first.get("text") if first.get("type") == "text" else CRITIC_PROMPT
         def _to_claude_blocks(items):
             blocks = []
             for item in items:
@@ -74,30 +124,89 @@ class VisualCritic:
             "content-type": "application/json",
         }
         payload = {
-            "model": CLAUDE_MODEL_NAME,
-            "max_tokens": 4096,  # Critic 需要足够空间输出详细的视觉分析反馈
-            "system": CRITIC_PROMPT,
-            # Claude 的 system 已包含 CRITIC_PROMPT，
-            # 用户消息中过滤掉重复的 CRITIC_PROMPT 文本
+            "model": get_stage_model("critic", provider="claude")[1],
+            "max_tokens": max_tokens,  # Critic 需要足够空间输出详细的视觉分析反馈
+            "system": prompt,
+            # Claude 的 system 已包含评估提示词，
+            # 用户消息中过滤掉重复的提示词文本
             "messages": [{"role": "user", "content": [
-                b for b in blocks if not (b.get("type") == "text" and b.get("text") == CRITIC_PROMPT)
+                b for b in blocks if not (b.get("type") == "text" and b.get("text") == prompt)
             ] or blocks}],
         }
+        return headers, payload
+
+    @staticmethod
+    def _extract_claude_text(response, model, started, stage="critic"):
+        """解析 Claude 响应文本，并记录调用指标"""
+        retries = getattr(response, "retries", 0)
+        if response.status_code != 200:
+            error = f"Claude API error {response.status_code}: {response.text[:200]}"
+            record_call(stage, "claude", model, started, retries=retries, ok=False, error=error)
+            raise RuntimeError(error)
+        data = response.json()
+        record_call(stage, "claude", model, started, usage=data.get("usage"), retries=retries)
+        content_blocks = data.get("content", [])
+        text = "".join(
+            block.get("text", "") for block in content_blocks if block.get("type") == "text"
+        )
+        return text.strip() if text else None
+
+    def _call_claude_vision(self, messages_content, max_tokens=4096, stage="critic"):
+        """
+        调用 Claude 进行视觉分析（Anthropic Messages API）。
+
+        stage 为写入调用指标的阶段（批量评估为 "critic_batch"）。
+        """
+        if not self.claude_enabled:
+            return None
+
+        request = self._build_claude_request(messages_content, max_tokens)
+        if request is None:
+            return None
+        headers, payload = request
+        started = time.perf_counter()
         try:
-            response = requests.post(
+            response = post_with_retry(
+                "claude",
                 f"{CLAUDE_BASE_URL}/messages",
+                json_body=payload,
                 headers=headers,
-                json=payload,
                 timeout=120,
+                circuit=f"messages/{payload['model']}",
             )
-            if response.status_code != 200:
-                raise RuntimeError(f"Claude API error {response.status_code}: {response.text[:200]}")
-            data = response.json()
-            content_blocks = data.get("content", [])
-            text = "".join(
-                block.get("text", "") for block in content_blocks if block.get("type") == "text"
+            return self._extract_claude_text(response, payload["model"], started, stage)
+        except CircuitOpenError as e:
+            print(f"   ⏭️ 跳过 Claude: {e}")
+            return None
+        except Exception as e:
+            print(f"   ⚠️ Claude 视觉调用失败: {e}")
+            return None
+
+    async def _acall_claude_vision(self, messages_content, max_tokens=4096, stage="critic"):
+        """
+        _call_claude_vision 的异步版本。
+        """
+        if not self.claude_enabled:
+            return None
+
+        request = self._build_claude_request(messages_content, max_tokens)
+        if request is None:
+            return None
+        headers, payload = request
+        started = time.perf_counter()
+        try:
+            response = await apost_with_retry(
+                "claude",
+                f"{CLAUDE_BASE_URL}/messages",
+                json_body=payload,
+                headers=headers,
+                timeout=120,
+                circuit=f"messages/{payload['model']}",
             )
-            return text.strip() if text else None
+            return self._extract_claude_text(response, payload["model"], started, stage)
+        except CircuitOpenError as e:
+            print(f"   ⏭️ 跳过 Claude: {e}")
+            return None
         except Exception as e:
             print(f"   ⚠️ Claude 视觉调用失败: {e}")
             return None
@@ -114,110 +223,394 @@ class VisualCritic:
             print(f"   ⚠️ 视觉反馈解析失败: {e}")
             return None
 
-    def critique(self, video_path, storyboard_section):
+    def _provider_order(self):
         """
-        Analyze the video (or frames from it) and return feedback.
-        使用 Gemini 3 Pro 进行视觉分析。
+        按 critic 阶段配置的提供商返回已启用视觉模型的调用顺序
         """
+        provider, _ = get_stage_model("critic")
+        order = ["claude", "gemini"] if provider == "claude" else ["gemini", "claude"]
+        enabled = {"gemini": self.gemini_enabled, "claude": self.claude_enabled}
+        return [p for p in order if enabled[p]]
+
+    def _check_enabled(self):
         if not self.enabled:
             if USE_VISUAL_FEEDBACK and not GEMINI_API_KEY and not CLAUDE_API_KEY:
                 print("   ⚠️ GEMINI_API_KEY / CLAUDE_API_KEY 未设置，跳过视觉分析。")
+            return False
+        return True
+
+    def _build_messages(self, frames):
+        """
+        用采样得到的关键帧构建视觉分析的消息内容。
+
+        返回:
+            list: OpenAI 兼容的 messages_content
+        """
+        # 构建视觉分析的消息格式（内存中编码为 JPEG/WebP，可拼成一张联系表）
+        # 注意: CRITIC_PROMPT 在 Gemini 中作为文本消息传入，
+        # 在 Claude 中作为 system 消息传入（Claude _call_claude_vision 中处理）
+        messages_content = [
+            {"type": "text", "text": CRITIC_PROMPT}
+        ]
+        tiled = VISION_CONTACT_SHEET and len(frames) > 1
+        if tiled:
+            messages_content.append({
+                "type": "text",
+                "text": f"以下 {len(frames)} 个关键帧已按时间顺序拼成一张图（从左到右、从上到下，左上角标有序号）。",
+            })
+        images, _stats = build_image_contents(frames, tile=tiled, label="关键帧")
+        messages_content.extend(images)
+        return messages_content
+
+    def _cache_variant(self, batch=False):
+        """
+        评估配置指纹（提示词和各提供商的视觉模型），配置变化后缓存的结论不再使用
+
+        单章节评估（CRITIC_PROMPT）和批量评估（CRITIC_BATCH_PROMPT，多个章节放在同一次请求中）
+        的结论分开缓存，互不复用。
+        """
+        prompt = f"batch|{CRITIC_BATCH_PROMPT}" if batch else CRITIC_PROMPT
+        models = ",".join(f"{p}:{get_stage_model('critic', provider=p)[1]}" for p in self._provider_order())
+        return hashlib.sha256(f"{prompt}|{models}".encode("utf-8")).hexdigest()
+
+    def _cache_keys(self, cache, basis, batch):
+        """由 (视频哈希, 视频路径, 章节指纹) 计算评估缓存的内容键和章节槽位键"""
+        video_sha, video_path, section_fp = basis
+        variant = self._cache_variant(batch)
+        return cache.make_key(video_sha, section_fp, variant), cache.slot_key(video_path, section_fp, variant)
+
+    def _lookup(self, video_path, storyboard_section, batch=False):
+        """
+        采样关键帧并查询评估缓存（文件哈希和解码都是阻塞操作，异步版本在线程中调用）
+
+        依次尝试: 视频内容命中 → 关键帧与该章节上次评估的渲染感知哈希一致 → 未命中；
+        batch=True 时查询批量评估的结论（见 _cache_variant）
+
+        返回:
+            tuple: (缓存的 feedback 或 None, 状态 dict: frames / cache / key / slot / frame_hashes)
+        """
+        cache = get_critique_cache()
+        state = {"cache": cache, "frames": None}
+        stage = "critic_batch" if batch else "critic"
+        started = time.perf_counter()
+        if cache is not None:
+            state["basis"] = (file_sha256(video_path), video_path, section_fingerprint(storyboard_section))
+            state["key"], state["slot"] = self._cache_keys(cache, state["basis"], batch)
+            entry = cache.get(state["key"])
+            if entry is not None:
+                print("   ♻️ 命中视觉评估缓存（视频内容未变化），跳过视觉模型调用。")
+                record_call(stage, entry.get("provider") or "gemini", entry.get("model"), started, cache_hit=True)
+                return entry["feedback"], state
+
+        # 按容器元数据算出采样时间点，seek 到关键帧后只解码这几帧（内存中完成，不写磁盘）
+        state["frames"] = sample_frames(video_path)
+        if cache is not None and state["frames"]:
+            state["frame_hashes"] = frame_hashes(state["frames"])
+            matched = cache.match_last(state["slot"], state["frame_hashes"])
+            if matched is not None:
+                entry, distance = matched
+                print(f"   ♻️ 关键帧与上次评估的渲染一致（dHash 最大差异 {distance[0]}/256 位，颜色差 {distance[1]}），复用上次结论。")
+                record_call(stage, entry.get("provider") or "gemini", entry.get("model"), started, cache_hit=True)
+                # 以新视频的内容键保存，下次直接内容命中
+                cache.put(state["key"], state["slot"], dict(entry, frame_hashes=state["frame_hashes"]))
+                return entry["feedback"], state
+        return None, state
+
+    def _store(self, state, feedback, provider, batch=False):
+        """把视觉模型的结论写入评估缓存（解析失败的结果不缓存；batch 表示结论来自批量评估）"""
+        cache = state.get("cache")
+        if cache is None or feedback is None or provider is None or not state.get("frame_hashes"):
+            return
+        try:
+            key, slot = self._cache_keys(cache, state["basis"], batch)
+            cache.put(key, slot, {
+                "feedback": feedback,
+                "provider": provider,
+                "model": get_stage_model("critic", provider=provider)[1],
+                "frame_hashes": state["frame_hashes"],
+            })
+        except OSError as e:
+            print(f"   ⚠️ 视觉评估缓存写入失败: {e}")
+
+    @staticmethod
+    def _check_layout(video_path, script_path):
+        """
+        读取渲染时写出的本地布局报告（见 mathvideo.layout_check）
+
+        返回:
+            tuple: (是否跳过远程视觉评估, 布局问题描述)；
+            没有可用报告（未开启、非 TeachingScene、脚本已修改）时为 (False, None)
+        """
+        if not LAYOUT_CHECK or not script_path:
+            return False, None
+        report = load_layout_report(video_path, script_path)
+        if report is None:
+            return False, None
+        objects = len({obj["id"] for step in report["steps"] for obj in step["objects"]})
+        if report["clean"]:
+            print(f"   📐 本地布局检查通过（{len(report['steps'])} 步，{objects} 个对象），跳过远程视觉评估。")
+            return True, None
+        print(f"   📐 本地布局检查发现 {len(report['findings'])} 个问题（{len(report['steps'])} 步，{objects} 个对象）。")
+        return False, format_findings(report)
+
+    @staticmethod
+    def _merge_suggestions(layout_findings, suggestion):
+        """合并本地布局问题和视觉模型的建议（布局问题在前，更具体）"""
+        if layout_findings and suggestion:
+            return f"{layout_findings}\n\n视觉模型的建议:\n{suggestion}"
+        return layout_findings or suggestion
+
+    @staticmethod
+    def _to_suggestion(feedback):
+        if feedback is None:
+            return None
+
+        if feedback.get("has_issues"):
+            print(f"   ⚠️ Issues found: {feedback.get('issues')}")
+            return feedback.get("suggestion") or None
+        else:
+            print("   ✅ Visual check passed.")
+            return None
+
+    def critique(self, video_path, storyboard_section, script_path=None):
+        """
+        Analyze the video (or frames from it) and return feedback.
+        使用 Gemini 3 Pro 进行视觉分析。
+
+        提供 script_path 时先读取本地布局报告：没有问题则直接返回 None，不调用视觉模型；
+        有问题时把具体问题与视觉模型的建议合并返回（视觉模型不可用时只返回布局问题）。
+        视觉模型的结论按视频内容和关键帧感知哈希缓存（见 mathvideo.critique_cache）。
+        """
+        skip, layout_findings = self._check_layout(video_path, script_path)
+        if skip:
+            return None
+        return self._merge_suggestions(layout_findings, self._remote_critique(video_path, storyboard_section))
+
+    def _remote_critique(self, video_path, storyboard_section):
+        """调用视觉模型分析视频关键帧（优先使用缓存的结论），返回修改建议（无问题或失败时返回 None）"""
+        if not self._check_enabled():
             return None
 
         print(f"🧐 Critiquing video: {video_path}")
-        
-        # 1. 使用 PyAV 提取帧（无需系统安装 ffmpeg CLI）
-        import av
-        import glob
-        import os
-        from PIL import Image
-        
-        frames_dir = os.path.join(os.path.dirname(video_path), "frames")
-        os.makedirs(frames_dir, exist_ok=True)
-        
-        # 清理旧帧
-        for f in glob.glob(os.path.join(frames_dir, "frame_*.png")):
-            os.remove(f)
-            
-        try:
-            # 用 PyAV 打开视频，每秒提取 1 帧，缩放到 320px 宽度以减少 token 消耗
-            container = av.open(video_path)
-            stream = container.streams.video[0]
-            fps = float(stream.average_rate)  # 视频帧率
-            frame_interval = max(1, int(fps))  # 每秒取 1 帧
-            
-            frame_idx = 0
-            saved_count = 0
-            for frame in container.decode(video=0):
-                if frame_idx % frame_interval == 0:
-                    img = frame.to_image()  # PIL Image
-                    # 缩放到 320px 宽度，保持宽高比
-                    w, h = img.size
-                    new_w = 320
-                    new_h = int(h * new_w / w)
-                    img = img.resize((new_w, new_h), Image.LANCZOS)
-                    save_path = os.path.join(frames_dir, f"frame_{saved_count:03d}.png")
-                    img.save(save_path)
-                    saved_count += 1
-                frame_idx += 1
-            container.close()
-            
-            # 2. 选取最多 4 帧代表帧（首、中、中、尾），节省 token 和时间
-            frame_files = sorted(glob.glob(os.path.join(frames_dir, "frame_*.png")))
-            
-            if len(frame_files) > 4:
-                indices = [0, len(frame_files)//3, 2*len(frame_files)//3, len(frame_files)-1]
-                selected_frames = [frame_files[i] for i in indices]
-            else:
-                selected_frames = frame_files
 
-            if not selected_frames:
+        try:
+            feedback, state = self._lookup(video_path, storyboard_section)
+            if feedback is not None:
+                return self._to_suggestion(feedback)
+            if not state["frames"]:
                 print("   ⚠️ 未能提取到任何帧，跳过视觉分析。")
                 return None
+            return self._to_suggestion(self._critique_frames(state))
 
-            # 3. 构建视觉分析的消息格式
-            # 注意: CRITIC_PROMPT 在 Gemini 中作为文本消息传入，
-            # 在 Claude 中作为 system 消息传入（Claude _call_claude_vision 中处理）
-            messages_content = [
-                {"type": "text", "text": CRITIC_PROMPT}
-            ]
+        except Exception as e:
+            print(f"   Visual critique failed (soft fail): {e}")
+            return None
 
-            for img_path in selected_frames:
-                with open(img_path, "rb") as image_file:
-                    b64_data = base64.b64encode(image_file.read()).decode("utf-8")
-                    messages_content.append({
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{b64_data}"
-                        }
-                    })
+    def _critique_frames(self, state):
+        """用 _lookup 已采样的关键帧调用视觉模型，结论写入评估缓存，返回 feedback（失败时为 None）"""
+        messages_content = self._build_messages(state["frames"])
 
-            # 4. 调用 Gemini Vision API（失败则回退 Claude）
-            content = None
-            source = None
-            if self.gemini_enabled:
-                content = self._call_gemini_vision(messages_content)
-                source = "gemini" if content else None
-            if not content and self.claude_enabled:
-                print("   🔁 Gemini 无法使用，切换到 Claude 视觉模型。")
-                content = self._call_claude_vision(messages_content)
-                source = "claude" if content else None
-
-            feedback = self._parse_feedback(content)
-            if feedback is None and source != "claude" and self.claude_enabled:
-                print("   🔁 解析失败，尝试 Claude 视觉模型。")
-                content = self._call_claude_vision(messages_content)
-                feedback = self._parse_feedback(content)
-            if feedback is None:
-                return None
-            
-            if feedback.get("has_issues"):
-                print(f"   ⚠️ Issues found: {feedback['issues']}")
-                return feedback['suggestion']
+        # 按阶段配置的顺序调用视觉模型（默认 Gemini 优先）；主提供商超过对冲等待时间未返回时
+        # 并行请求备用提供商，先给出可解析结论的一方胜出（见 mathvideo.hedging）
+        calls = {"gemini": self._call_gemini_vision, "claude": self._call_claude_vision}
+        attempts = [
+            (provider, lambda call=calls[provider]: call(messages_content))
+            for provider in self._provider_order()
+        ]
+        feedback, info = hedged_call("critic", attempts, self._parse_feedback)
+        self._store(state, feedback, info.get("winner"))
+        return feedback
+
+    def critique_batch(self, items):
+        """
+        批量评估多个章节，把 N 次视觉请求合并为一次（每次最多 CRITIC_BATCH_MAX_SECTIONS 个章节）
+
+        每个章节先做本地布局检查和评估缓存查询（与 critique 相同，但只复用批量评估的结论）；仍需视觉模型的章节
+        按章节标注后放进同一次请求（同样经过对冲和熔断），返回的 JSON 数组按 section_id 拆回各章节，
+        结论按章节分别写入评估缓存。批量结果中缺少的章节单独评估（结论按单章节评估缓存）。
+
+        参数:
+            items: [(video_path, storyboard_section, script_path)]
+
+        返回:
+            list: 与 items 顺序一致的修改建议（无问题时为 None）
+        """
+        results = [None] * len(items)
+        layout = [None] * len(items)
+        pending = []
+        remote = self._check_enabled()
+        for index, (video_path, section, script_path) in enumerate(items):
+            skip, layout[index] = self._check_layout(video_path, script_path)
+            if skip:
+                continue
+            results[index] = layout[index]
+            if not remote:
+                continue
+            print(f"🧐 Critiquing video: {video_path}")
+            try:
+                feedback, state = self._lookup(video_path, section, batch=True)
+                if feedback is not None:
+                    results[index] = self._merge_suggestions(layout[index], self._to_suggestion(feedback))
+            except Exception as e:
+                print(f"   Visual critique failed (soft fail): {e}")
+                continue
+            if feedback is not None:
+                continue
+            if not state["frames"]:
+                print("   ⚠️ 未能提取到任何帧，跳过视觉分析。")
+            else:
+                pending.append((index, str(section.get("id") or f"section_{index + 1}"), state))
+
+        for start in range(0, len(pending), CRITIC_BATCH_MAX_SECTIONS):
+            chunk = pending[start:start + CRITIC_BATCH_MAX_SECTIONS]
+            verdicts = {}
+            winner = None
+            if len(chunk) > 1:
+                try:
+                    verdicts, winner = self._batch_request(chunk, [items[index][1] for index, _, _ in chunk])
+                except Exception as e:
+                    print(f"   批量视觉评估失败，改为逐个评估 (soft fail): {e}")
+            for index, section_id, state in chunk:
+                feedback = verdicts.get(section_id)
+                try:
+                    if feedback is None:
+                        if len(chunk) > 1:
+                            print(f"   🔁 批量结果中缺少 {section_id}，单独评估。")
+                        feedback = self._critique_frames(state)
+                    else:
+                        self._store(state, feedback, winner, batch=True)
+                    print(f"   📋 {section_id}:")
+                    results[index] = self._merge_suggestions(layout[index], self._to_suggestion(feedback))
+                except Exception as e:
+                    print(f"   Visual critique failed (soft fail): {e}")
+        return results
+
+    def _build_batch_messages(self, batch):
+        """
+        构建批量评估的消息内容：CRITIC_BATCH_PROMPT，之后每个章节一行标注 + 该章节的关键帧
+
+        参数:
+            batch: [(section_id, storyboard_section, frames)]
+        """
+        messages_content = [{"type": "text", "text": CRITIC_BATCH_PROMPT}]
+        for number, (section_id, section, frames) in enumerate(batch, 1):
+            tiled = VISION_CONTACT_SHEET and len(frames) > 1
+            label = f"### 章节 {number}/{len(batch)}: section_id = {section_id}，标题: {section.get('title') or '无'}"
+            if tiled:
+                label += f"\n以下 {len(frames)} 个关键帧已按时间顺序拼成一张图（从左到右、从上到下，左上角标有序号）。"
             else:
-                print("   ✅ Visual check passed.")
+                label += f"\n以下 {len(frames)} 个关键帧按时间顺序排列。"
+            messages_content.append({"type": "text", "text": label})
+            images, _stats = build_image_contents(frames, tile=tiled, label=f"关键帧 {section_id}")
+            messages_content.extend(images)
+        return messages_content
+
+    def _batch_request(self, chunk, sections):
+        """
+        发出一次批量评估请求
+
+        参数:
+            chunk: [(序号, section_id, _lookup 的状态)]
+            sections: 与 chunk 对应的章节描述
+
+        返回:
+            tuple: ({section_id: feedback}, 胜出的提供商)；请求或解析失败时为 ({}, None)
+        """
+        section_ids = [section_id for _, section_id, _ in chunk]
+        messages_content = self._build_batch_messages([
+            (section_id, section, state["frames"]) for (_, section_id, state), section in zip(chunk, sections)
+        ])
+        # 每个章节的结论都需要输出空间
+        max_tokens = min(16384, 2048 + 1024 * len(chunk))
+        # 批量请求携带多个章节的关键帧，耗时远高于单章节评估，单独记录耗时并计算对冲等待时间
+        calls = {
+            "gemini": lambda: self._call_gemini_vision(messages_content, stage="critic_batch"),
+            "claude": lambda: self._call_claude_vision(messages_content, max_tokens, stage="critic_batch"),
+        }
+        print(f"🧐 批量评估 {len(chunk)} 个章节（一次视觉请求）: {', '.join(section_ids)}")
+        verdicts, info = hedged_call(
+            "critic_batch",
+            [(provider, calls[provider]) for provider in self._provider_order()],
+            lambda content: self._parse_batch_feedback(content, section_ids),
+        )
+        return verdicts or {}, info.get("winner")
+
+    @staticmethod
+    def _parse_batch_feedback(content, section_ids):
+        """
+        解析批量评估结果（JSON 数组）
+
+        section_id 与标注不符但条目数与章节数相同时按顺序对应；has_issues 为真但缺少
+        issues / suggestion 的条目视为不完整而丢弃（不写入缓存，该章节改为单独评估）
+
+        返回:
+            dict: {section_id: feedback}；无法解析或没有任何可用条目时返回 None
+        """
+        if not content:
+            return None
+        try:
+            text = content.replace("```json", "").replace("```", "").strip()
+            if "[" in text and "]" in text:
+                text = text[text.find("["):text.rfind("]") + 1]
+            entries = json.loads(text)
+        except Exception as e:
+            print(f"   ⚠️ 批量视觉反馈解析失败: {e}")
+            return None
+        if isinstance(entries, dict):
+            entries = entries.get("sections") or [entries]
+        if not isinstance(entries, list):
+            return None
+        verdicts = {}
+        for position, entry in enumerate(entries):
+            if not isinstance(entry, dict) or "has_issues" not in entry:
+                continue
+            if entry.get("has_issues") and not (entry.get("issues") and entry.get("suggestion")):
+                print(f"   ⚠️ 批量结果中 {entry.get('section_id') or f'第 {position + 1} 项'} 缺少 issues / suggestion，忽略。")
+                continue
+            section_id = str(entry.get("section_id") or "")
+            if section_id not in section_ids and len(entries) == len(section_ids):
+                section_id = section_ids[position]
+            if section_id in section_ids and section_id not in verdicts:
+                verdicts[section_id] = {k: v for k, v in entry.items() if k != "section_id"}
+        return verdicts or None
+
+    async def acritique(self, video_path, storyboard_section, script_path=None):
+        """
+        critique 的异步版本，供 FastAPI 路由直接 await。
+
+        帧提取和视频哈希是 CPU / IO 密集操作，放到线程池执行；视觉模型调用使用原生异步传输，
+        等待期间不会阻塞事件循环。
+        """
+        skip, layout_findings = self._check_layout(video_path, script_path)
+        if skip:
+            return None
+        return self._merge_suggestions(layout_findings, await self._aremote_critique(video_path, storyboard_section))
+
+    async def _aremote_critique(self, video_path, storyboard_section):
+        """_remote_critique 的异步版本"""
+        if not self._check_enabled():
+            return None
+
+        print(f"🧐 Critiquing video: {video_path}")
+
+        try:
+            feedback, state = await asyncio.to_thread(self._lookup, video_path, storyboard_section)
+            if feedback is not None:
+                return self._to_suggestion(feedback)
+            if not state["frames"]:
+                print("   ⚠️ 未能提取到任何帧，跳过视觉分析。")
                 return None
-                
+            messages_content = await asyncio.to_thread(self._build_messages, state["frames"])
+
+            calls = {"gemini": self._acall_gemini_vision, "claude": self._acall_claude_vision}
+            attempts = [
+                (provider, lambda call=calls[provider]: call(messages_content))
+                for provider in self._provider_order()
+            ]
+            feedback, info = await ahedged_call("critic", attempts, self._parse_feedback)
+            self._store(state, feedback, info.get("winner"))
+            return self._to_suggestion(feedback)
+
         except Exception as e:
             print(f"   Visual critique failed (soft fail): {e}")
             return None
@@ -1,9 +1,10 @@
 # 导入JSON处理模块，用于处理故事板数据结构（虽然本文件不直接使用，但保留以备将来扩展）
-import base64
+import hashlib
 import json
 import os
+import threading
+import time
 from typing import List, Optional
-import requests
 import json5
 
 # 导入LangChain的聊天提示模板类，用于构建LLM提示
@@ -17,15 +18,21 @@ from mathvideo.agents.prompts import (
     PLANNER_PROMPT,
     PLANNER_GEOMETRY_PROMPT,
     PLANNER_PROOF_PROMPT,
+    PLANNER_INPUT_PROMPT,
 )
 from mathvideo.agents.skill_manager import load_skills
 from mathvideo.config import (
     GEMINI_API_KEY,
     CLAUDE_API_KEY,
     CLAUDE_BASE_URL,
-    CLAUDE_MODEL_NAME,
+    get_stage_model,
 )
+from mathvideo.circuit_breaker import CircuitOpenError
 from mathvideo.gemini_native import generate_content_from_parts, messages_content_to_parts
+from mathvideo.hedging import hedged_call
+from mathvideo.image_payload import build_image_contents, load_image
+from mathvideo.metrics import record_call
+from mathvideo.retry import post_with_retry
 
 
 def _extract_json_block(text: str) -> str:
@@ -102,12 +109,100 @@ def _parse_storyboard_json(raw_text: str, llm=None) -> Optional[dict]:
             pass
     return None
 
-def describe_images(image_paths: List[str]) -> Optional[str]:
+# 图片描述缓存文件（位于项目目录下），键为图片内容哈希
+IMAGE_CONTEXT_FILENAME = "image_context.json"
+
+# 单次最多描述的图片数量，避免 token 过高
+MAX_DESCRIBE_IMAGES = 3
+
+# 进程内的图片描述缓存（同一进程内路由和分镜复用同一份描述）
+_image_context_memo = {}
+_image_context_lock = threading.Lock()
+
+
+def image_context_key(image_paths: List[str]) -> Optional[str]:
+    """
+    按图片内容计算描述缓存的键（与文件名、路径无关）
+
+    参数:
+        image_paths: 图片路径列表（只取前 MAX_DESCRIBE_IMAGES 张，与实际描述的图片一致）
+
+    返回:
+        str: 各图片内容 sha256 拼接后的哈希；没有可读取的图片时返回 None
+    """
+    digests = []
+    for img_path in image_paths[:MAX_DESCRIBE_IMAGES]:
+        try:
+            with open(img_path, "rb") as f:
+                digests.append(hashlib.sha256(f.read()).hexdigest())
+        except OSError:
+            continue
+    if not digests:
+        return None
+    return hashlib.sha256("\n".join(digests).encode("utf-8")).hexdigest()
+
+
+def _load_image_contexts(project_dir: str) -> dict:
+    path = os.path.join(project_dir, IMAGE_CONTEXT_FILENAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_image_context(project_dir: str, key: str, description: str, image_paths: List[str]):
+    """把图片描述写入项目目录的缓存文件（原子替换）"""
+    with _image_context_lock:
+        contexts = _load_image_contexts(project_dir)
+        contexts[key] = {
+            "description": description,
+            "images": [os.path.basename(p) for p in image_paths[:MAX_DESCRIBE_IMAGES]],
+            "created_at": round(time.time(), 3),
+        }
+        path = os.path.join(project_dir, IMAGE_CONTEXT_FILENAME)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(project_dir, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(contexts, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ 写入图片描述缓存失败: {e}")
+
+
+def describe_images(image_paths: List[str], project_dir: Optional[str] = None) -> Optional[str]:
     """
-    使用 Gemini 视觉模型对输入图片进行简要描述，便于生成故事板。
+    使用视觉模型对输入图片进行简要描述，便于任务路由和生成故事板。
+
+    描述按图片内容哈希缓存：同一进程内重复调用直接复用；
+    提供 project_dir 时还会持久化到 <project_dir>/image_context.json，
+    重复运行同一项目时不再发起多模态请求。
+
+    参数:
+        image_paths: 图片路径列表
+        project_dir: 项目目录（可选），用于持久化描述缓存
+
+    返回:
+        str: 图片描述；失败或未配置 API Key 时返回 None
     """
     if not image_paths:
         return None
+
+    key = image_context_key(image_paths)
+    if key:
+        stored = (_load_image_contexts(project_dir).get(key) or {}).get("description") if project_dir else None
+        with _image_context_lock:
+            cached = stored or _image_context_memo.get(key)
+            if cached:
+                _image_context_memo[key] = cached
+        if cached:
+            print("♻️ 复用已缓存的图片描述。")
+            if project_dir and not stored:
+                _save_image_context(project_dir, key, cached, image_paths)
+            return cached
+
     if not GEMINI_API_KEY and not CLAUDE_API_KEY:
         print("⚠️ GEMINI/CLAUDE API Key 未设置，跳过图片理解。")
         return None
@@ -122,30 +217,37 @@ def describe_images(image_paths: List[str]) -> Optional[str]:
         }
     ]
 
-    # 限制图片数量，避免 token 过高
-    for img_path in image_paths[:3]:
+    # 限制图片数量，避免 token 过高；超过像素预算的原图先缩小，再在内存中编码为 JPEG/WebP
+    images = []
+    source_bytes = 0
+    for img_path in image_paths[:MAX_DESCRIBE_IMAGES]:
         try:
-            with open(img_path, "rb") as image_file:
-                b64_data = base64.b64encode(image_file.read()).decode("utf-8")
-                messages_content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{b64_data}"
-                    }
-                })
+            images.append(load_image(img_path))
+            source_bytes += os.path.getsize(img_path)
         except Exception as e:
             print(f"⚠️ 读取图片失败: {img_path} ({e})")
+    if images:
+        contents, _stats = build_image_contents(images, source_bytes=source_bytes, label="输入")
+        messages_content.extend(contents)
 
     def _call_gemini():
         if not GEMINI_API_KEY:
             return None
         try:
             parts = messages_content_to_parts(messages_content)
-            content = generate_content_from_parts(parts, timeout=120)
+            content = generate_content_from_parts(
+                parts,
+                model=get_stage_model("describe_images", provider="gemini")[1],
+                timeout=120,
+                stage="describe_images",
+            )
             if not content:
                 print("⚠️ Gemini 返回空内容，尝试回退到 Claude。")
                 return None
             return content.strip()
+        except CircuitOpenError as e:
+            print(f"⏭️ 跳过 Gemini: {e}")
+            return None
         except Exception as e:
             print(f"⚠️ Gemini 图片理解失败: {e}")
             return None
@@ -185,38 +287,64 @@ def describe_images(image_paths: List[str]) -> Optional[str]:
             "content-type": "application/json",
         }
         payload = {
-            "model": CLAUDE_MODEL_NAME,
+            "model": get_stage_model("describe_images", provider="claude")[1],
             "max_tokens": 512,
             "system": "请用中文简要描述图片中的数学内容或题意，提取关键概念、图形关系、已知/未知量，100-200字。",
             "messages": [{"role": "user", "content": blocks}],
         }
+        started = time.perf_counter()
         try:
-            response = requests.post(
+            response = post_with_retry(
+                "claude",
                 f"{CLAUDE_BASE_URL}/messages",
+                json_body=payload,
                 headers=headers,
-                json=payload,
                 timeout=120,
+                circuit=f"messages/{payload['model']}",
             )
             if response.status_code != 200:
-                raise RuntimeError(f"Claude API error {response.status_code}: {response.text[:200]}")
+                error = f"Claude API error {response.status_code}: {response.text[:200]}"
+                record_call("describe_images", "claude", payload["model"], started,
+                            retries=response.retries, ok=False, error=error)
+                raise RuntimeError(error)
             data = response.json()
+            record_call("describe_images", "claude", payload["model"], started,
+                        usage=data.get("usage"), retries=response.retries)
             content_blocks = data.get("content", [])
             text = "".join(
                 block.get("text", "") for block in content_blocks if block.get("type") == "text"
             )
             return text.strip() if text else None
+        except CircuitOpenError as e:
+            print(f"⏭️ 跳过 Claude: {e}")
+            return None
         except Exception as e:
             print(f"⚠️ Claude 图片理解失败: {e}")
             return None
 
-    content = _call_gemini()
-    if not content and CLAUDE_API_KEY:
-        print("🔁 切换到 Claude 进行图片理解。")
-        content = _call_claude()
+    # 按阶段配置的提供商决定调用顺序；主提供商超过对冲等待时间未返回时并行请求另一家，
+    # 先返回非空描述的一方胜出（见 mathvideo.hedging）
+    provider, _ = get_stage_model("describe_images")
+    calls = {"gemini": (_call_gemini, GEMINI_API_KEY), "claude": (_call_claude, CLAUDE_API_KEY)}
+    order = ["claude", "gemini"] if provider == "claude" else ["gemini", "claude"]
+    attempts = [(name, calls[name][0]) for name in order if calls[name][1]]
+    content, _info = hedged_call("describe_images", attempts, lambda text: text or None)
+
+    if content and key:
+        with _image_context_lock:
+            _image_context_memo[key] = content
+        if project_dir:
+            _save_image_context(project_dir, key, content, image_paths)
     return content
 
 
-def generate_storyboard(prompt: str, image_paths: Optional[List[str]] = None, task_type: str = "knowledge"):
+def generate_storyboard(
+    prompt: str,
+    image_paths: Optional[List[str]] = None,
+    task_type: str = "knowledge",
+    on_token=None,
+    image_context: Optional[str] = None,
+):
     """
     为给定的输入生成故事板JSON结构
     
@@ -228,6 +356,9 @@ def generate_storyboard(prompt: str, image_paths: Optional[List[str]] = None, ta
         prompt (str): 用户输入文本
         image_paths (List[str], 可选): 输入图片路径列表
         task_type (str): 任务类型（knowledge/geometry/problem/proof）
+        on_token (callable, 可选): 流式输出回调，每收到一段分镜文本增量调用一次
+        image_context (str, 可选): 预先计算好的图片描述（如路由阶段已调用 describe_images），
+            提供时不再重复描述图片
     
     返回:
         dict: 故事板JSON结构，包含 task_type 字段
@@ -248,16 +379,21 @@ def generate_storyboard(prompt: str, image_paths: Optional[List[str]] = None, ta
     
     # 创建LLM客户端实例
     # max_tokens=16384：storyboard JSON 可能很长（多 section、详细描述），需要充足空间
-    llm = get_llm(temperature=0.7, max_tokens=16384)
+    llm = get_llm(temperature=0.7, max_tokens=16384, stage="planner")
     # 从提示模板创建聊天提示模板
-    prompt_template = ChatPromptTemplate.from_template(selected_prompt)
+    # 静态指令 + Skill 作为 system 消息（可缓存前缀），用户输入作为 human 消息
+    prompt_template = ChatPromptTemplate.from_messages([
+        ("system", selected_prompt),
+        ("human", PLANNER_INPUT_PROMPT),
+    ])
     # 构建处理链
     chain = prompt_template | llm | JsonOutputParser()
     
     # 打印开始生成故事板的信息
     print(f"Planning storyboard for: {prompt or '（仅图片输入）'} [type={task_type}]...")
     try:
-        image_context = describe_images(image_paths or []) if image_paths else None
+        if image_context is None and image_paths:
+            image_context = describe_images(image_paths)
         input_text = prompt.strip() if prompt else ""
         if not input_text and image_context:
             input_text = "用户仅提供了图片，请基于图像描述生成分镜。"
@@ -269,7 +405,16 @@ def generate_storyboard(prompt: str, image_paths: Optional[List[str]] = None, ta
 
         # 调用处理链，传入输入文本与图像描述
         # invoke()方法会执行整个链：格式化提示 -> 调用LLM -> 解析JSON
-        result = chain.invoke(payload)
+        if on_token:
+            # 流式模式：边生成边回调增量文本，结束后再整体解析 JSON
+            raw_text = ""
+            for chunk in (prompt_template | llm).stream(payload):
+                delta = chunk.content if isinstance(chunk.content, str) else ""
+                raw_text += delta
+                on_token(delta)
+            result = JsonOutputParser().parse(raw_text)
+        else:
+            result = chain.invoke(payload)
 
         # 附加元信息，便于回溯
         result["input_text"] = prompt
@@ -284,13 +429,15 @@ def generate_storyboard(prompt: str, image_paths: Optional[List[str]] = None, ta
         # 如果生成过程中出现任何异常，尝试回退解析
         print(f"Error generating storyboard: {e}")
         try:
-            raw_prompt = selected_prompt.format(
+            raw_messages = prompt_template.format_messages(
                 input_text=input_text,
                 image_context=image_context or "无",
             )
-            raw = llm.invoke(raw_prompt)
+            raw = llm.invoke(raw_messages)
             raw_text = getattr(raw, "content", None) or str(raw)
-            fixed = _parse_storyboard_json(raw_text, llm=llm)
+            # JSON 修复是机械性任务，交给快速模型
+            repair_llm = get_llm(temperature=0.0, max_tokens=16384, stage="json_repair")
+            fixed = _parse_storyboard_json(raw_text, llm=repair_llm)
             if fixed:
                 fixed["input_text"] = prompt
                 fixed["task_type"] = task_type
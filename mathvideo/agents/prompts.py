@@ -52,6 +52,16 @@ ROUTER_PROMPT = """
 # ============================================================================
 # 故事板提示模板
 # ============================================================================
+# PLANNER_*_PROMPT 只包含与输入无关的静态指令，作为 system 消息发送；
+# 用户输入通过 PLANNER_INPUT_PROMPT 作为 human 消息发送。
+# 这样同一任务类型的请求共享完全相同的前缀，可以命中 Anthropic 的提示缓存。
+
+# 故事板输入模板（所有任务类型共用）
+PLANNER_INPUT_PROMPT = """
+输入文本: {input_text}
+图像描述（如有）: {image_context}
+"""
+
 
 # 故事板生成提示模板（通用版，用于 knowledge 和 problem 类型）
 # 用于将数学主题转换为结构化的故事板JSON
@@ -59,10 +69,7 @@ PLANNER_PROMPT = """
 你是专业的教育解说员和动画师，擅长将数学教学大纲转换为适用于Manim动画系统的详细分镜脚本。
 
 ## 任务
-将以下输入转换为详细的逐步分镜脚本（输入可能是知识点、问题或一段描述）：
-
-输入文本: {input_text}
-图像描述（如有）: {image_context}
+将用户消息中的输入转换为详细的逐步分镜脚本（输入可能是知识点、问题或一段描述）。
 
 ## 分镜要求
 
@@ -106,10 +113,7 @@ PLANNER_GEOMETRY_PROMPT = """
 你是专业的几何动画策划师，擅长将几何构造题转换为 Manim 动画的分镜脚本。
 
 ## 任务
-将以下几何题目转换为**递进式**分镜脚本。每个 Section 必须在前一个 Section 的基础上**增量添加**新的几何对象。
-
-输入文本: {input_text}
-图像描述（如有）: {image_context}
+将用户消息中的几何题目转换为**递进式**分镜脚本。每个 Section 必须在前一个 Section 的基础上**增量添加**新的几何对象。
 
 ## 关键约束（CRITICAL）
 
@@ -169,10 +173,7 @@ PLANNER_PROOF_PROMPT = """
 你是专业的数学证明动画策划师，擅长将证明过程转换为 Manim 动画的分镜脚本。
 
 ## 任务
-将以下证明/推导题转换为**逻辑链式**分镜脚本。
-
-输入文本: {input_text}
-图像描述（如有）: {image_context}
+将用户消息中的证明/推导题转换为**逻辑链式**分镜脚本。
 
 ## 关键约束
 
@@ -206,19 +207,17 @@ PLANNER_PROOF_PROMPT = """
 
 # 代码生成提示模板
 # 用于将故事板章节转换为Manim Python代码
+# 与故事板模板相同，CODER_PROMPT / CODER_SEQUENTIAL_PROMPT 是静态 system 指令，
+# 章节数据通过 CODER_INPUT_PROMPT / CODER_SEQUENTIAL_INPUT_PROMPT 作为 human 消息发送，
+# 多个章节、多个项目之间共享同一个可缓存的前缀。
 CODER_PROMPT = """
 你是使用Manim社区版的专家级动画师。
-请根据以下教学脚本章节生成高质量的Manim类。
-
-## 输入数据
-章节标题: {title}
-讲义行: {lecture_lines}
-动画描述: {animations}
+请根据用户消息中的教学脚本章节（输入数据）生成高质量的Manim类。
 
 ## 要求
 1. **基类**: 必须继承自 `TeachingScene` (从 `mathvideo.manim_base` 导入)。
 2. **布局**:
-   - 在 `construct` 开头调用 `self.setup_layout("{title}", {lecture_lines})`。
+   - 在 `construct` 开头调用 `self.setup_layout(章节标题, 讲义行列表)`，参数原样使用输入数据中的章节标题和讲义行。
    - 这会处理左侧文本。不要自己创建讲义文本。
 3. **视觉锚点系统 (强制)**:
    - 右侧是 10x10 网格 (行A-J, 列1-10)。
@@ -295,11 +294,11 @@ from manim import *
 
 class SectionScene(TeachingScene):
     def construct(self):
-        # 数据
-        lines = {lecture_lines}
+        # 数据（输入数据中的讲义行）
+        lines = ["第1行", "第2行"]
         
         # 设置
-        self.setup_layout("{title}", lines)
+        self.setup_layout("章节标题", lines)
         
         # 步骤 1
         self.highlight_line(0)
@@ -321,27 +320,15 @@ class SectionScene(TeachingScene):
 # 核心区别: 传入前序 Section 的完整代码，要求后续 Section 继承已有对象
 CODER_SEQUENTIAL_PROMPT = """
 你是使用Manim社区版的专家级动画师。
-请根据以下教学脚本章节生成高质量的Manim类。
+请根据用户消息中的教学脚本章节（输入数据）生成高质量的Manim类。
 
 **重要**: 本 Section 是递进式构造的一部分。你必须在动画开始时**重建前序 Section 的所有几何对象**，
-然后在此基础上添加本 Section 的新内容。
-
-## 输入数据
-章节标题: {title}
-讲义行: {lecture_lines}
-动画描述: {animations}
-从前序 Section 继承的对象: {inherited_objects}
-本 Section 新增的对象: {new_objects}
-
-## 前序 Section 的完整代码（重要参考）
-```python
-{previous_code}
-```
+然后在此基础上添加本 Section 的新内容。用户消息中会给出前序 Section 的完整代码作为参考。
 
 ## 要求
 1. **基类**: 必须继承自 `TeachingScene` (从 `mathvideo.manim_base` 导入)。
 2. **布局**:
-   - 在 `construct` 开头调用 `self.setup_layout("{title}", {{lecture_lines}})`。
+   - 在 `construct` 开头调用 `self.setup_layout(章节标题, 讲义行列表)`，参数原样使用输入数据中的章节标题和讲义行。
    - 这会处理左侧文本。不要自己创建讲义文本。
 3. **继承前序几何对象 (CRITICAL)**:
    - 参考前序代码中几何对象的**创建方式和坐标参数**
@@ -380,8 +367,8 @@ from manim import *
 
 class SectionScene(TeachingScene):
     def construct(self):
-        lines = {lecture_lines}
-        self.setup_layout("{title}", lines)
+        lines = ["第1行", "第2行"]  # 输入数据中的讲义行
+        self.setup_layout("章节标题", lines)
         
         # === 继承前序对象（直接显示，不要动画） ===
         # 参考前序代码，重建所有几何对象
@@ -400,6 +387,29 @@ class SectionScene(TeachingScene):
 仅返回 Python 代码。尽可能不要 markdown 格式，或包裹在 ```python 块中。
 """
 
+# 代码生成输入模板（独立模式）
+CODER_INPUT_PROMPT = """
+## 输入数据
+章节标题: {title}
+讲义行: {lecture_lines}
+动画描述: {animations}
+"""
+
+# 代码生成输入模板（递进模式）
+CODER_SEQUENTIAL_INPUT_PROMPT = """
+## 输入数据
+章节标题: {title}
+讲义行: {lecture_lines}
+动画描述: {animations}
+从前序 Section 继承的对象: {inherited_objects}
+本 Section 新增的对象: {new_objects}
+
+## 前序 Section 的完整代码（重要参考）
+```python
+{previous_code}
+```
+"""
+
 # 代码修复提示模板
 # 用于根据错误信息自动修复生成的代码
 FIX_CODE_PROMPT = """
@@ -489,6 +499,50 @@ CRITIC_PROMPT = """
 如果没有重大问题，设置 "has_issues" 为 false。
 """
 
+# 批量视觉反馈提示模板
+# 用于在一次请求中评估多个章节的截图（每个章节的截图前有章节标注）
+CRITIC_BATCH_PROMPT = """
+你是针对教育视频的严苛视觉设计评论家。
+
+## 任务
+下面依次给出同一个视频中多个章节的关键帧截图。每个章节的截图之前有一行标注，例如
+"### 章节 2/5: section_id = section_2，标题: 勾股定理的证明"。
+逐个章节分析其关键帧截图序列（从开始到结束），评估视觉质量和几何正确性。
+每个章节独立评估，不要把一个章节的问题归到另一个章节。
+
+## 布局规则 (10x10网格系统)
+- 屏幕被分割：左侧（讲义笔记），右侧（网格区域）。
+- 内容 **绝不能** 与左侧文本栏重叠。
+- 文本必须清晰可读（不要太小，也不要太大，不要重叠）。
+- 物体应在网格区域内居中或保持平衡。
+
+## 几何与视觉完整性
+- **几何**: 检查几何图形是否绘制正确。
+  - 例如：对于勾股定理，边上的正方形必须是正方形且严格与三角形边对齐。
+  - 例如：直角三角形应看起来像90度。
+- **重叠**: 物体不应无意中相互重叠，除非这是动画效果。
+- **颜色**: 形状内的文本必须可读（有良好的对比度）。
+
+## 检查清单（每个章节）
+1. 是否有文字重叠？
+2. 物体是否越界？
+3. 几何形状是否数学上正确（如正方形看起来像正方形，线条连接正确）？
+4. 字体大小是否合适？
+5. 视觉内容是否匹配讲义行？
+
+## 输出
+返回一个 JSON 数组，每个章节一项，顺序与输入一致，section_id 与标注中的完全相同:
+[
+    {{
+        "section_id": "section_1",
+        "has_issues": true/false,
+        "issues": ["问题1描述", "问题2描述"],
+        "suggestion": "给该章节代码编写者的具体可行的修改建议，用于修复布局。"
+    }}
+]
+某个章节没有重大问题时，设置其 "has_issues" 为 false。
+"""
+
 # 代码优化提示模板
 # 用于根据视觉反馈优化代码
 REFINE_CODE_PROMPT = """
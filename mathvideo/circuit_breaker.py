@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+提供商熔断器
+
+Gemini 宕机或 Key 被限流时，每个章节的 critic 和每次图片理解都要先在 Gemini 上耗完一次
+带重试的失败请求，才轮到 Claude。熔断器按 (提供商, 接口) 记录最近的调用结果，
+在进程内共享（后端进程中跨请求保留）:
+
+    closed     正常放行；连续失败 CIRCUIT_FAILURE_THRESHOLD 次后转为 open
+    open       直接拒绝（抛出 CircuitOpenError，不发送请求），CIRCUIT_RESET_TIMEOUT 秒后转为 half-open
+    half-open  只放行一个探测请求：成功则回到 closed，失败则重新 open；探测期间其它调用仍被拒绝
+
+post_with_retry / apost_with_retry 传入 circuit=<接口名> 时使用熔断器。"失败" 指重试用尽后
+仍然失败的整次调用：网络错误、408 / 429 / 5xx / 529，以及 401 / 403 / 404（Key 或模型不可用）；
+其它 4xx 说明服务可达，按成功计。
+"""
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from mathvideo.config import CIRCUIT_BREAKER_ENABLED, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 计为失败的最终状态码（重试用尽后）
+FAILURE_STATUS_CODES = frozenset({401, 403, 404, 408, 429, 500, 502, 503, 504, 529})
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器处于 open / half-open 状态时拒绝调用"""
+
+    def __init__(self, name: str, retry_in: float):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"{name} 已熔断，约 {retry_in:.0f}s 后允许探测请求")
+
+
+class CircuitBreaker:
+    """
+    单个 (提供商, 接口) 的熔断器
+
+    参数:
+        name: 名称（日志和状态展示用），如 "gemini:generateContent/gemini-3-pro-preview"
+        failure_threshold: 连续失败多少次后熔断
+        reset_timeout: 熔断后多少秒放行探测请求
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 60):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """
+        申请发送一次请求；不允许时抛出 CircuitOpenError
+
+        open 状态超过 reset_timeout 后转为 half-open，并把本次调用作为探测请求放行
+
+        返回:
+            bool: 本次调用是否为探测请求
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return False
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == OPEN and retry_in <= 0:
+                self.state = HALF_OPEN
+                self.probing = True
+                print(f"🔌 {self.name} 熔断已到期，放行一个探测请求。")
+                return True
+            raise CircuitOpenError(self.name, max(0.0, retry_in))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                print(f"✅ {self.name} 探测成功，恢复调用。")
+            self.state = CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self, error: Optional[str] = None):
+        with self._lock:
+            self.last_error = (error or "")[:200] or None
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    print(f"⛔ {self.name} 连续失败 {self.failures} 次，熔断 {self.reset_timeout:.0f}s。")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def release(self, probe: bool):
+        """调用被取消、没有得出结论时归还探测名额（下一次调用重新探测）"""
+        with self._lock:
+            if probe and self.state == HALF_OPEN and self.probing:
+                self.state = OPEN
+                self.opened_at = time.monotonic() - self.reset_timeout
+                self.probing = False
+
+    def snapshot(self) -> dict:
+        """当前状态（供 /health 展示）"""
+        with self._lock:
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic() if self.state == OPEN else 0.0
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "retry_in_s": round(max(0.0, retry_in), 1),
+                "last_error": self.last_error,
+            }
+
+
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider: str, endpoint: str) -> Optional[CircuitBreaker]:
+    """
+    获取指定 (提供商, 接口) 在进程内共享的熔断器（CIRCUIT_BREAKER_ENABLED=false 时返回 None）
+
+    参数:
+        provider: 提供商名称（"claude" / "gemini"）
+        endpoint: 接口名，如 "generateContent/<模型>"、"messages/<模型>"
+    """
+    if not CIRCUIT_BREAKER_ENABLED:
+        return None
+    with _breakers_lock:
+        breaker = _breakers.get((provider, endpoint))
+        if breaker is None:
+            breaker = CircuitBreaker(f"{provider}:{endpoint}", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+            _breakers[(provider, endpoint)] = breaker
+        return breaker
+
+
+def circuit_states() -> Dict[str, dict]:
+    """所有已创建熔断器的状态"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
@@ -5,7 +5,9 @@ import json
 # 导入命令行参数解析模块，用于处理用户输入的命令行参数
 import argparse
 # 导入子进程模块，用于执行Manim渲染命令
-import subprocess
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 # 从agents模块导入故事板生成函数
 from mathvideo.agents.planner import generate_storyboard
 # 从agents模块导入代码生成和修复函数
@@ -14,8 +16,16 @@ from mathvideo.agents.asset_manager import AssetManager
 from mathvideo.agents.critic import VisualCritic
 # 导入任务类型路由器
 from mathvideo.agents.router import classify_task, get_section_mode
-from mathvideo.config import USE_VISUAL_FEEDBACK
+from mathvideo.config import USE_VISUAL_FEEDBACK, CRITIC_BATCH, CODEGEN_JOBS, RENDER_DRY_RUN
 from mathvideo.utils import make_slug, rename_project_dir
+from mathvideo.stream_events import StreamEmitter
+from mathvideo.llm_cache import get_llm_cache
+from mathvideo.metrics import set_metrics_project, load_metrics, summarize, format_summary
+from mathvideo.pipeline import SequentialCodePipeline
+from mathvideo.render_cache import get_render_cache
+from mathvideo.video_merge import merge_videos
+from mathvideo.segment_manifest import save_manifest
+from mathvideo.render_pool import render_scene, format_render_error, format_animation_cache, get_render_pool, shutdown_render_pool
 
 
 def main():
@@ -83,6 +93,28 @@ def main():
         default="",
         help="指定输出目录路径（由 Web 后端传入，跳过 slug 生成）",
     )
+    # Web 后端开启：把分镜/代码的流式增量输出为结构化事件行，供 WebSocket 实时转发
+    parser.add_argument(
+        "--stream-events",
+        action="store_true",
+        help="以 @@STREAM 事件行输出 LLM 流式增量（由 Web 后端传入）",
+    )
+    # 独立模式下并行生成章节代码的最大并发数
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=CODEGEN_JOBS,
+        help="独立模式（knowledge/problem）下并行生成章节代码的最大并发数；1 表示逐个生成，同时关闭递进模式的生成/渲染流水线",
+    )
+    # 视觉反馈：所有章节渲染完成后一次请求批量评估，再并行优化有问题的章节
+    parser.add_argument(
+        "--batch-critique",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="所有章节渲染后用一次视觉请求批量评估，并行优化有问题的章节；--no-batch-critique 为每个章节渲染后单独评估。"
+             "默认取 CRITIC_BATCH，但递进模式（sequential）下默认关闭",
+    )
     # 解析命令行参数并存储到args对象中
     args = parser.parse_args()
 
@@ -111,6 +143,14 @@ def main():
     # 创建媒体目录（如果不存在则创建，存在则不报错）
     os.makedirs(media_dir, exist_ok=True)
 
+    # 本次运行的所有 LLM / 视觉调用指标写入 <项目目录>/metrics.jsonl
+    run_started_at = time.time()
+    set_metrics_project(base_output_dir)
+
+    # 需要渲染时提前启动常驻渲染进程：预导入 manim 与分镜/代码生成并行进行
+    if args.render:
+        get_render_pool()
+
     # 打印项目启动信息
     print(f"🚀 Starting project: {args.prompt or '（仅图片输入）'}")
     # 打印输出目录路径
@@ -140,21 +180,27 @@ def main():
 
     # 步骤0.5：任务类型路由（在生成故事板之前先判断任务类型）
     # 先对图片进行理解（如果有的话），因为图片内容会影响任务分类
-    image_context_for_router = None
+    # 描述按图片内容哈希缓存在项目目录中，分镜生成和重复运行都直接复用
+    image_context = None
     if input_image_paths:
         from mathvideo.agents.planner import describe_images
-        image_context_for_router = describe_images(input_image_paths)
+        image_context = describe_images(input_image_paths, project_dir=base_output_dir)
     
-    task_type = classify_task(args.prompt.strip(), image_context=image_context_for_router)
+    task_type = classify_task(args.prompt.strip(), image_context=image_context)
     section_mode = get_section_mode(task_type)
     print(f"📊 Section 模式: {section_mode}")
 
     # 步骤1：生成故事板（根据任务类型选择不同的 Prompt 模板）
+    storyboard_emitter = StreamEmitter("storyboard") if args.stream_events else None
     storyboard = generate_storyboard(
         args.prompt.strip(),
         image_paths=input_image_paths,
         task_type=task_type,
+        on_token=storyboard_emitter,
+        image_context=image_context,
     )
+    if storyboard_emitter:
+        storyboard_emitter.close()
     # 检查故事板是否生成成功
     if not storyboard:
         # 如果生成失败，打印错误信息并退出程序
@@ -172,6 +218,7 @@ def main():
         if new_base_dir != base_output_dir:
             print(f"📁 项目重命名: {os.path.basename(base_output_dir)} → {os.path.basename(new_base_dir)}")
             base_output_dir = new_base_dir
+            set_metrics_project(base_output_dir)
             scripts_dir = os.path.join(base_output_dir, "scripts")
             media_dir = os.path.join(base_output_dir, "media")
             topic_slug = os.path.basename(base_output_dir)
@@ -198,159 +245,68 @@ def main():
     print("✅ Enhanced storyboard saved")
 
     # 步骤2：为每个章节生成代码
-    # 递进模式下，当前 Section 的代码会作为下一个 Section 的上下文
-    previous_section_code = ""  # 用于递进模式的上下文传递
-    rendered_videos = []  # 收集所有成功渲染的视频路径，用于最终合并
-    # 遍历故事板中的所有章节
-    for section in storyboard.get("sections", []):
-        # 打印当前正在处理的章节ID
-        print(f"\n🔄 Processing section: {section['id']}")
-        # 调用LLM生成该章节的Manim代码
-        # 递进模式下传入前序代码作为上下文
-        code, class_name = generate_code(
-            section,
-            previous_code=previous_section_code if section_mode == "sequential" else "",
-            task_type=task_type,
-        )
-
+    # 独立模式下并行生成所有章节的代码，按完成顺序依次送入渲染；
+    # 递进模式下当前 Section 的代码会作为下一个 Section 的上下文，只能逐个生成
+    # 递进模式下后台流水线沿章节链提前生成代码，与前序章节的渲染/评估/修复并行
+    sections = storyboard.get("sections", [])
+    pipeline = None
+    if section_mode == "independent" and args.jobs > 1 and len(sections) > 1:
+        generated = _generate_codes_parallel(sections, task_type, args.jobs, args.stream_events)
+    elif section_mode == "sequential" and args.jobs > 1 and len(sections) > 1:
+        pipeline = _start_sequential_pipeline(sections, task_type, args.stream_events)
+        generated = pipeline
+    else:
+        generated = _generate_codes_sequential(sections, task_type, section_mode, args.stream_events, scripts_dir)
+
+    rendered_by_index = {}  # 章节序号 -> 渲染成功的视频路径
+    rendered_scripts = {}  # 章节序号 -> (脚本路径, 场景类名)，批量评估时使用
+    batch_critique = args.render and USE_VISUAL_FEEDBACK and _use_batch_critique(args.batch_critique, section_mode)
+    for index, code, class_name in generated:
+        section = sections[index]
+        if pipeline:
+            print(f"\n🔄 Processing section: {section['id']}")
         # 检查代码是否生成成功
-        if code:
-            # 构建Python脚本文件的保存路径，使用章节ID作为文件名
-            filename = os.path.join(scripts_dir, f"{section['id']}.py")
-            # 以写入模式打开文件
-            with open(filename, "w", encoding="utf-8") as f:
-                # 将生成的代码写入文件
-                f.write(code)
-            # 打印代码保存成功的信息
-            print(f"💻 Code saved to {filename}")
-            
-            # 递进模式下，保存当前 Section 的代码供下一个 Section 使用
-            if section_mode == "sequential":
-                previous_section_code = code
-
-            # 步骤3：如果用户指定了--render参数，则渲染视频
-            if args.render:
-                # 打印开始渲染的信息
-                print(f"🎬 Rendering {class_name}...")
-                # 复制当前环境变量，以便修改PYTHONPATH而不影响原环境
-                env = os.environ.copy()
-                # 设置PYTHONPATH为当前工作目录，确保可以导入mathvideo.manim_base模块
-                env["PYTHONPATH"] = os.getcwd()
-
-                # 输出到指定的媒体目录
-                # 使用sys.executable -m manim确保使用正确的Python环境
-                import sys
-                # 构建Manim渲染命令：
-                # - sys.executable: 当前Python解释器
-                # - "-m manim": 以模块方式运行manim
-                # - "-ql": 低质量快速渲染（用于测试）
-                # - "--media_dir": 指定媒体输出目录
-                # - filename: 要渲染的Python脚本文件
-                # - class_name: 要渲染的场景类名
-                cmd = [sys.executable, "-m", "manim", "-ql", "--media_dir", media_dir, filename, class_name]
-
-                # 设置最大重试次数为3次（总共尝试4次：0, 1, 2, 3）
-                max_retries = 3
-                # 循环尝试渲染，最多重试max_retries次
-                for attempt in range(max_retries + 1):
-                    try:
-                        # 运行Manim渲染命令
-                        # check=True: 如果命令返回非零退出码则抛出异常
-                        # env=env: 使用修改后的环境变量
-                        # cwd=os.getcwd(): 设置工作目录为当前目录
-                        # capture_output=True: 捕获标准输出和标准错误
-                        # text=True: 以文本模式返回输出（而不是字节）
-                        result = subprocess.run(cmd, check=True, env=env, cwd=os.getcwd(), capture_output=True, text=True, encoding='utf-8', errors='replace')
-                        # 渲染成功，打印成功信息
-                        print(f"✨ Rendered {class_name} successfully.")
-
-                        # 步骤4: 视觉反馈与优化 (Refiner Loop)
-                        if USE_VISUAL_FEEDBACK:
-                            # 构造视频文件路径 (Manim默认结构: media/videos/脚本名/质量/类名.mp4)
-                            # -ql 对应 480p15
-                            script_name = os.path.splitext(os.path.basename(filename))[0]
-                            video_path = os.path.join(media_dir, "videos", script_name, "480p15", f"{class_name}.mp4")
-
-                            if os.path.exists(video_path):
-                                print(f"👁️ analyzing video frame: {video_path}")
-                                critic = VisualCritic()
-                                suggestion = critic.critique(video_path, section)
-
-                                if suggestion:
-                                    print(f"🎨 Suggestion: {suggestion}")
-                                    print("🔧 Refining code...")
-
-                                    # 读取当前代码
-                                    with open(filename, "r", encoding="utf-8") as f:
-                                        current_code = f.read()
-
-                                    # 调用优化代理
-                                    refined_code = refine_code(current_code, suggestion)
-
-                                    if refined_code:
-                                        # 保存并重试
-                                        with open(filename, "w", encoding="utf-8") as f:
-                                            f.write(refined_code)
-
-                                        print("♻️ Re-rendering refined code...")
-                                        try:
-                                            # 只重试一次渲染
-                                            subprocess.run(cmd, check=True, env=env, cwd=os.getcwd(), capture_output=True, text=True, encoding='utf-8', errors='replace')
-                                            print("✨ Refined render success!")
-                                        except subprocess.CalledProcessError as e:
-                                            print(f"❌ Refined render failed: {e.stderr}")
-                                else:
-                                    print("✅ Visual check passed!")
-                            else:
-                                print(f"⚠️ Video not found: {video_path}")
-
-                        # 记录成功渲染的视频路径
-                        script_name_for_path = os.path.splitext(os.path.basename(filename))[0]
-                        rendered_path = os.path.join(media_dir, "videos", script_name_for_path, "480p15", f"{class_name}.mp4")
-                        if os.path.exists(rendered_path):
-                            rendered_videos.append(rendered_path)
-
-                        # 跳出重试循环
-                        break  # Success!
-                    except subprocess.CalledProcessError as e:
-                        # 渲染失败，打印失败信息（包含尝试次数）
-                        print(f"❌ Failed to render {class_name} (Attempt {attempt + 1}/{max_retries + 1})")
-                        # 获取错误输出信息
-                        error_output = e.stderr or e.stdout or "（无错误输出）"
-                        # 打印错误详情（只显示最后500个字符，避免输出过长）
-                        print(f"Error details:\n{error_output[-500:]}...")
-
-                        # 如果还有重试机会
-                        if attempt < max_retries:
-                            # 打印尝试自动修复代码的信息
-                            print("🔧 Attempting to self-correct code...")
-
-                            # 读取当前出错的代码文件
-                            with open(filename, "r", encoding="utf-8") as f:
-                                current_code = f.read()
-
-                            # 调用LLM修复代码，传入当前代码和错误信息
-                            fixed_code = fix_code(current_code, error_output)
-
-                            # 检查是否成功生成修复后的代码
-                            if fixed_code:
-                                # 将修复后的代码写回文件
-                                with open(filename, "w", encoding="utf-8") as f:
-                                    f.write(fixed_code)
-                                # 打印修复成功信息，准备重试
-                                print(f"📝 Fixed code saved to {filename}. Retrying...")
-                            else:
-                                # 无法生成修复代码，停止重试
-                                print("❌ Could not generate fixed code. Stopping retries.")
-                                break
-                        else:
-                            # 已达到最大重试次数，放弃当前章节，继续处理下一个
-                            print("❌ Max retries reached. Moving to next section.")
+        if not code:
+            continue
+        # 构建Python脚本文件的保存路径，使用章节ID作为文件名
+        filename = os.path.join(scripts_dir, f"{section['id']}.py")
+        # 以写入模式打开文件
+        with open(filename, "w", encoding="utf-8") as f:
+            # 将生成的代码写入文件
+            f.write(code)
+        # 打印代码保存成功的信息
+        print(f"💻 Code saved to {filename}")
+
+        # 步骤3：如果用户指定了--render参数，则渲染视频
+        if args.render:
+            rendered_path = _render_section(section, filename, class_name, media_dir, critique=not batch_critique)
+            if rendered_path:
+                rendered_by_index[index] = rendered_path
+                rendered_scripts[index] = (filename, class_name)
+
+        # 修复/优化改动了代码时，让流水线以最终代码重新生成后续章节
+        if pipeline:
+            with open(filename, "r", encoding="utf-8") as f:
+                pipeline.update(index, f.read())
+
+    if pipeline:
+        pipeline.close()
+        if pipeline.discarded:
+            print(f"♻️ 流水线因上游代码修改作废了 {pipeline.discarded} 次提前生成的结果")
+
+    # 步骤4（批量模式）: 一次视觉请求评估所有章节，再并行优化有问题的章节
+    if batch_critique and rendered_by_index:
+        _batch_critique_and_refine(sections, rendered_by_index, rendered_scripts, media_dir, args.jobs)
+
+    # 收集所有成功渲染的视频路径，按故事板顺序排列用于最终合并
+    # （并行生成时章节的渲染顺序与故事板顺序不一定一致）
+    rendered_videos = [rendered_by_index[i] for i in sorted(rendered_by_index)]
+    rendered_sections = [sections[i]["id"] for i in sorted(rendered_by_index)]
 
     # 步骤5：合并所有分镜视频为一个完整视频
     if args.render and len(rendered_videos) > 1:
         print(f"\n🎬 正在合并 {len(rendered_videos)} 个分镜视频...")
-        final_video = _merge_videos(rendered_videos, base_output_dir)
+        final_video = _merge_videos(rendered_videos, base_output_dir, rendered_sections)
         if final_video:
             print(f"✨ 完整视频已生成: {final_video}")
         else:
@@ -360,114 +316,395 @@ def main():
         import shutil
         final_path = os.path.join(base_output_dir, "final_video.mp4")
         shutil.copy2(rendered_videos[0], final_path)
+        save_manifest(base_output_dir, list(zip(rendered_sections, rendered_videos)))
         print(f"✨ 最终视频: {final_path}")
 
+    # 汇总本次运行的调用指标（metrics.jsonl 可能包含之前运行/后端重新生成的记录）
+    run_records = [r for r in load_metrics(base_output_dir) if r.get("ts", 0) >= run_started_at]
+    if run_records:
+        print("\n📊 LLM 调用统计（本次运行）:")
+        print(format_summary(summarize(run_records)))
+
+    render_pool = get_render_pool() if args.render else None
+    if render_pool and render_pool.stats["jobs"]:
+        stats = render_pool.stats
+        print(
+            f"⚡ 渲染进程池: {stats['jobs']} 次渲染，共省去启动 {stats['startup_saved']:.1f}s"
+            f"（平均每次 {stats['startup_saved'] / stats['jobs']:.1f}s），"
+            f"试运行 {stats['dry_runs']} 次（拦截 {stats['dry_run_failures']} 次失败），"
+            f"崩溃 {stats['crashes']}，回收 {stats['recycled']}"
+        )
+    shutdown_render_pool()
+
+    render_cache = get_render_cache() if args.render else None
+    if render_cache:
+        stats = render_cache.stats()
+        print(f"🎞️ 渲染缓存: 命中 {stats['hits']} / 未命中 {stats['misses']}，写入 {stats['writes']}，淘汰 {stats['evictions']}")
+
+    llm_cache = get_llm_cache()
+    if llm_cache:
+        stats = llm_cache.stats()
+        print(f"🗄️ LLM 缓存 ({stats['mode']}): 命中 {stats['hits']} / 未命中 {stats['misses']}，写入 {stats['writes']}，淘汰 {stats['evictions']}")
+
     print(f"\n✅ 项目完成: {base_output_dir}")
 
 
-def _merge_videos(video_paths: list, output_dir: str) -> str:
+def _generate_codes_sequential(sections: list, task_type: str, section_mode: str, stream_events: bool,
+                               scripts_dir: str = None):
     """
-    将多个分镜视频合并为一个完整视频。
+    逐个生成章节代码（生成器）
 
-    优先使用 PyAV（Manim 已安装的依赖）的 concat 模式进行快速拼接。
-    如果 PyAV 不可用，回退尝试 CLI ffmpeg。
+    递进模式下把上一个 Section 的代码作为上下文传入；
+    调用方处理完当前章节（保存、渲染）后才会开始生成下一个章节。
+    与流水线一致，上下文使用调用方处理后保存的最终脚本（修复/优化可能改写了代码）。
 
     参数:
-        video_paths: 按顺序排列的视频文件路径列表
-        output_dir: 输出目录
+        sections: 故事板中的章节列表
+        task_type: 任务类型
+        section_mode: 章节模式（independent / sequential）
+        stream_events: 是否输出流式事件行
+        scripts_dir: 章节脚本目录（<章节 ID>.py），用于读取处理后的最终代码
 
     返回:
-        str: 合并后的视频文件路径，或失败时返回 None
+        迭代器: 依次产出 (章节序号, code, class_name)
+    """
+    previous_section_code = ""  # 用于递进模式的上下文传递
+    for index, section in enumerate(sections):
+        # 打印当前正在处理的章节ID
+        print(f"\n🔄 Processing section: {section['id']}")
+        # 调用LLM生成该章节的Manim代码
+        code_emitter = StreamEmitter("code", section["id"]) if stream_events else None
+        code, class_name = generate_code(
+            section,
+            previous_code=previous_section_code if section_mode == "sequential" else "",
+            task_type=task_type,
+            on_token=code_emitter,
+        )
+        if code_emitter:
+            code_emitter.close()
+        yield index, code, class_name
+        # 递进模式下，保存当前 Section 的代码供下一个 Section 使用：
+        # 调用方渲染时的修复/优化会改写脚本，读取保存后的最终版本
+        if code and section_mode == "sequential":
+            previous_section_code = code
+            script_path = os.path.join(scripts_dir, f"{section['id']}.py") if scripts_dir else None
+            if script_path and os.path.exists(script_path):
+                with open(script_path, "r", encoding="utf-8") as f:
+                    previous_section_code = f.read()
+
+
+def _generate_codes_parallel(sections: list, task_type: str, jobs: int, stream_events: bool):
     """
-    import shutil
-    from pathlib import Path
+    以最多 jobs 个并发生成独立模式下所有章节的代码（生成器）
 
-    final_path = os.path.join(output_dir, "final_video.mp4")
+    所有章节一次性提交，按完成顺序产出结果：调用方渲染已完成的章节时，
+    其余章节仍在后台生成，LLM 总耗时接近最慢的单次调用而不是各次调用之和。
 
-    # 方式1: 使用 PyAV（Manim 的 ffmpeg 绑定），与 Manim 自身的合并方式一致
-    try:
-        import av
-
-        # 创建 concat 文件列表（与 Manim 的 combine_files 格式一致）
-        concat_list_path = os.path.join(output_dir, "_concat_list.txt")
-        with open(concat_list_path, "w", encoding="utf-8") as f:
-            f.write("# This file is used internally for video concatenation.\n")
-            for vp in video_paths:
-                posix_path = Path(vp).resolve().as_posix()
-                f.write(f"file 'file:{posix_path}'\n")
-
-        # 使用 PyAV 的 concat demuxer 读取所有分镜
-        input_container = av.open(
-            str(concat_list_path),
-            options={"safe": "0", "an": "1"},
-            format="concat",
-        )
-        input_stream = input_container.streams.video[0]
+    参数:
+        sections: 故事板中的章节列表
+        task_type: 任务类型
+        jobs: 最大并发数
+        stream_events: 是否输出流式事件行
 
-        # 创建输出容器，使用与输入相同的编码参数
-        output_container = av.open(final_path, mode="w")
-        output_stream = output_container.add_stream(
-            input_stream.codec_context.name,
-            rate=input_stream.average_rate,
-        )
-        output_stream.width = input_stream.codec_context.width
-        output_stream.height = input_stream.codec_context.height
-        output_stream.pix_fmt = input_stream.codec_context.pix_fmt
+    返回:
+        迭代器: 按完成顺序产出 (章节序号, code, class_name)
+    """
+    def _generate(section):
+        code_emitter = StreamEmitter("code", section["id"]) if stream_events else None
+        try:
+            return generate_code(section, task_type=task_type, on_token=code_emitter)
+        finally:
+            if code_emitter:
+                code_emitter.close()
+
+    workers = min(jobs, len(sections))
+    print(f"\n⚡ 并行生成 {len(sections)} 个章节的代码（并发 {workers}）...")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="codegen") as executor:
+        # 每个任务运行在当前上下文的副本中，调用指标仍写入本项目的 metrics.jsonl
+        futures = {
+            executor.submit(contextvars.copy_context().run, _generate, section): index
+            for index, section in enumerate(sections)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            code, class_name = future.result()
+            print(f"\n🔄 Processing section: {sections[index]['id']}")
+            yield index, code, class_name
+
+
+def _start_sequential_pipeline(sections: list, task_type: str, stream_events: bool) -> SequentialCodePipeline:
+    """
+    启动递进模式的代码生成流水线
 
-        # 解码所有帧并重新编码到输出（确保时间戳连续）
-        for frame in input_container.decode(video=0):
-            for packet in output_stream.encode(frame):
-                output_container.mux(packet)
+    后台线程按章节顺序生成代码，每个章节以上一个章节的代码作为上下文；
+    主线程渲染第 N 个章节时，第 N+1 个章节的代码已经在生成。
 
-        # 刷新编码器缓冲
-        for packet in output_stream.encode():
-            output_container.mux(packet)
+    返回:
+        SequentialCodePipeline: 可迭代，按顺序产出 (章节序号, code, class_name)
+    """
+    def _generate(section, previous_code):
+        print(f"\n🔄 Generating section: {section['id']}")
+        code_emitter = StreamEmitter("code", section["id"]) if stream_events else None
+        try:
+            return generate_code(
+                section,
+                previous_code=previous_code,
+                task_type=task_type,
+                on_token=code_emitter,
+            )
+        finally:
+            if code_emitter:
+                code_emitter.close()
+
+    print(f"\n⚡ 递进模式流水线：代码生成与渲染并行（共 {len(sections)} 个章节）")
+    return SequentialCodePipeline(sections, _generate).start()
+
+
+def _render_section(section: dict, filename: str, class_name: str, media_dir: str, critique: bool = True):
+    """
+    渲染单个章节（失败时自动修复重试，成功后可选视觉反馈优化）
 
-        output_container.close()
-        input_container.close()
+    参数:
+        section: 章节数据
+        filename: 章节脚本路径
+        class_name: 场景类名
+        media_dir: 媒体输出目录
+        critique: 渲染成功后是否立即做视觉评估（批量评估模式下由调用方统一评估）
 
-        # 清理临时文件
-        os.remove(concat_list_path)
+    返回:
+        str: 渲染成功的视频路径；失败时返回 None
+    """
+    # 打印开始渲染的信息
+    print(f"🎬 Rendering {class_name}...")
+
+    # 设置最大重试次数为3次（总共尝试4次：0, 1, 2, 3）
+    max_retries = 3
+    rendered = None
+    # 循环尝试渲染，最多重试max_retries次
+    for attempt in range(max_retries + 1):
+        # 先试运行再完整渲染（-ql 低质量快速渲染，输出到指定的媒体目录）
+        result = _validate_and_render(filename, class_name, media_dir)
+        if result["ok"]:
+            # 渲染成功，打印成功信息
+            print(f"✨ Rendered {class_name} successfully.{_format_render_timing(result)}")
+            video_path = result["video_path"]
+
+            # 步骤4: 视觉反馈与优化 (Refiner Loop)
+            if USE_VISUAL_FEEDBACK and critique:
+                if os.path.exists(video_path):
+                    print(f"👁️ analyzing video frame: {video_path}")
+                    critic = VisualCritic()
+                    suggestion = critic.critique(video_path, section, script_path=filename)
+
+                    if suggestion:
+                        _refine_section(filename, class_name, media_dir, suggestion)
+                    else:
+                        print("✅ Visual check passed!")
+                else:
+                    print(f"⚠️ Video not found: {video_path}")
+
+            # 记录成功渲染的视频路径
+            if os.path.exists(video_path):
+                rendered = video_path
+
+            # 跳出重试循环
+            break  # Success!
+
+        # 渲染失败，打印失败信息（包含尝试次数）
+        print(f"❌ Failed to render {class_name} (Attempt {attempt + 1}/{max_retries + 1})")
+        # 获取错误输出信息（有结构化信息时包含错误类型、出错行和阶段）
+        error_output = format_render_error(result)
+        # 打印错误详情（只显示500个字符，避免输出过长；结构化信息在开头，原始输出看末尾）
+        print(f"Error details:\n{error_output[:500] if result.get('error_info') else error_output[-500:]}...")
+
+        # 如果还有重试机会
+        if attempt < max_retries:
+            # 打印尝试自动修复代码的信息
+            print("🔧 Attempting to self-correct code...")
+
+            # 读取当前出错的代码文件
+            with open(filename, "r", encoding="utf-8") as f:
+                current_code = f.read()
+
+            # 调用LLM修复代码，传入当前代码和错误信息
+            fixed_code = fix_code(current_code, error_output)
+
+            # 检查是否成功生成修复后的代码
+            if fixed_code:
+                # 将修复后的代码写回文件
+                with open(filename, "w", encoding="utf-8") as f:
+                    f.write(fixed_code)
+                # 打印修复成功信息，准备重试
+                print(f"📝 Fixed code saved to {filename}. Retrying...")
+            else:
+                # 无法生成修复代码，停止重试
+                print("❌ Could not generate fixed code. Stopping retries.")
+                break
+        else:
+            # 已达到最大重试次数，放弃当前章节，继续处理下一个
+            print("❌ Max retries reached. Moving to next section.")
+    return rendered
 
-        if os.path.exists(final_path):
-            return final_path
 
-    except ImportError:
-        print("⚠️ PyAV 未安装，尝试使用 CLI ffmpeg...")
-    except Exception as e:
-        print(f"⚠️ PyAV 合并失败: {e}，尝试使用 CLI ffmpeg...")
+def _use_batch_critique(requested, section_mode: str) -> bool:
+    """
+    决定是否使用批量视觉评估
 
-    # 方式2: 回退到 CLI ffmpeg
-    ffmpeg_cmd = shutil.which("ffmpeg")
-    if not ffmpeg_cmd:
-        print("⚠️ ffmpeg 未找到，无法合并视频")
-        return None
+    递进模式下后续章节以前序章节的最终代码为上下文生成；批量评估的优化发生在所有章节生成之后，
+    改动不会传到后续章节，因此未显式指定时只在独立模式下默认开启。
 
-    concat_list_path = os.path.join(output_dir, "_concat_list.txt")
-    try:
-        with open(concat_list_path, "w", encoding="utf-8") as f:
-            for vp in video_paths:
-                abs_path = os.path.abspath(vp).replace("\\", "/")
-                f.write(f"file '{abs_path}'\n")
-
-        cmd = [
-            ffmpeg_cmd, "-y",
-            "-f", "concat", "-safe", "0",
-            "-i", concat_list_path,
-            "-c", "copy",
-            final_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-
-        if result.returncode == 0 and os.path.exists(final_path):
-            os.remove(concat_list_path)
-            return final_path
+    参数:
+        requested: 命令行 --batch-critique / --no-batch-critique（未指定时为 None）
+        section_mode: 章节模式（independent / sequential）
+
+    返回:
+        bool: 是否批量评估
+    """
+    if requested is None:
+        return CRITIC_BATCH and section_mode != "sequential"
+    if requested and section_mode == "sequential":
+        print("⚠️ 递进模式下使用批量评估：优化后的代码不会用于重新生成后续章节")
+    return requested
+
+
+def _refine_section(filename: str, class_name: str, media_dir: str, suggestion: str):
+    """
+    按视觉反馈优化章节代码并重新渲染一次（优化后的代码渲染失败时恢复原代码）
+
+    参数:
+        filename: 章节脚本路径
+        class_name: 场景类名
+        media_dir: 媒体输出目录
+        suggestion: 视觉评估给出的修改建议
+    """
+    print(f"🎨 Suggestion: {suggestion}")
+    print("🔧 Refining code...")
+
+    # 读取当前代码
+    with open(filename, "r", encoding="utf-8") as f:
+        current_code = f.read()
+
+    # 调用优化代理
+    refined_code = refine_code(current_code, suggestion)
+
+    if refined_code:
+        # 保存并重试
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(refined_code)
+
+        print("♻️ Re-rendering refined code...")
+        # 只重试一次渲染
+        refined = _validate_and_render(filename, class_name, media_dir)
+        if refined["ok"]:
+            print(f"✨ Refined render success!{_format_render_timing(refined)}")
         else:
-            print(f"⚠️ ffmpeg 合并失败: {result.stderr[-300:] if result.stderr else '未知错误'}")
-            return None
+            print(f"❌ Refined render failed: {format_render_error(refined)[-500:]}")
+            # 优化后的代码无法运行：恢复为已成功渲染的版本，保持脚本与视频一致
+            with open(filename, "w", encoding="utf-8") as f:
+                f.write(current_code)
+            print("↩️ 已恢复优化前的代码")
+
+
+def _batch_critique_and_refine(sections: list, rendered_by_index: dict, rendered_scripts: dict,
+                               media_dir: str, jobs: int):
+    """
+    批量视觉评估：所有已渲染章节的关键帧放进一次视觉请求，再以最多 jobs 个并发优化有问题的章节
+
+    参数:
+        sections: 故事板中的章节列表
+        rendered_by_index: 章节序号 -> 渲染成功的视频路径
+        rendered_scripts: 章节序号 -> (脚本路径, 场景类名)
+        media_dir: 媒体输出目录
+        jobs: 最大并发数
+    """
+    order = sorted(rendered_by_index)
+    print(f"\n👁️ 批量评估 {len(order)} 个章节的渲染结果...")
+    critic = VisualCritic()
+    try:
+        suggestions = critic.critique_batch([
+            (rendered_by_index[i], sections[i], rendered_scripts[i][0]) for i in order
+        ])
     except Exception as e:
-        print(f"⚠️ 视频合并异常: {e}")
+        # 视觉评估失败不影响合并已渲染的章节
+        print(f"⚠️ 批量视觉评估失败，跳过优化 (soft fail): {e}")
+        return
+    todo = [(i, suggestion) for i, suggestion in zip(order, suggestions) if suggestion]
+    if not todo:
+        print("✅ Visual check passed!")
+        return
+
+    workers = max(1, min(jobs, len(todo)))
+    print(f"\n🔧 并行优化 {len(todo)} 个章节（并发 {workers}）: {', '.join(sections[i]['id'] for i, _ in todo)}")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="refine") as executor:
+        # 每个任务运行在当前上下文的副本中，调用指标仍写入本项目的 metrics.jsonl
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run, _refine_section, *rendered_scripts[i], media_dir, suggestion,
+            ): i
+            for i, suggestion in todo
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"❌ 优化 {sections[futures[future]]['id']} 失败: {e}")
+
+
+def _validate_and_render(filename: str, class_name: str, media_dir: str) -> dict:
+    """
+    先试运行场景的 construct（跳过动画、不写帧），通过后再完整渲染
+
+    脚本错误在试运行阶段就能发现，耗时只是完整渲染的一小部分；
+    渲染在常驻渲染进程中进行，进程池不可用时回退为 python -m manim 子进程。
+
+    返回:
+        dict: render_scene 的结果（试运行失败时为试运行的结果）
+    """
+    if RENDER_DRY_RUN:
+        check = render_scene(filename, class_name, media_dir, dry_run=True)
+        if not check["ok"]:
+            print(f"🧪 试运行失败 ({check.get('elapsed', 0):.1f}s)，跳过完整渲染")
+            return check
+        print(f"🧪 试运行通过 ({check.get('elapsed', 0):.1f}s)")
+    return render_scene(filename, class_name, media_dir)
+
+
+def _format_render_timing(result: dict) -> str:
+    """渲染耗时、常驻进程节省的启动耗时及动画片段复用情况（用于日志）"""
+    text = f" ({result.get('elapsed', 0):.1f}s"
+    if result.get("startup_saved"):
+        text += f"，预热进程省去启动 {result['startup_saved']:.1f}s"
+    animation_summary = format_animation_cache(result)
+    if animation_summary:
+        text += f"，{animation_summary}"
+    return text + ")"
+
+
+def _merge_videos(video_paths: list, output_dir: str, section_ids: list = None) -> str:
+    """
+    将多个分镜视频合并为一个完整视频。
+
+    优先按数据包直接拼接（不解码），只转码参数与其他分镜不一致的分镜；
+    拼接失败时整体重新编码，PyAV 不可用时回退尝试 CLI ffmpeg（见 video_merge）。
+    传入 section_ids 时同时写入分镜清单，之后单个章节重新渲染只需增量替换（见 segment_manifest）。
+
+    参数:
+        video_paths: 按顺序排列的视频文件路径列表
+        output_dir: 输出目录
+        section_ids: 与 video_paths 对应的章节 ID
+
+    返回:
+        str: 合并后的视频文件路径，或失败时返回 None
+    """
+    final_path = os.path.join(output_dir, "final_video.mp4")
+    merged = merge_videos(video_paths, final_path)
+    if not merged:
         return None
+    transcoded = f"，转码 {merged['transcoded']}/{len(video_paths)} 个分镜" if merged["transcoded"] else ""
+    print(f"🎞️ 合并方式: {merged['strategy']}{transcoded}，耗时 {merged['elapsed']:.2f}s")
+    if section_ids:
+        save_manifest(output_dir, list(zip(section_ids, video_paths)), merged["segments"], merged["strategy"])
+    return merged["path"]
 
 
 # 程序入口点：当脚本被直接运行时（而不是被导入），执行main函数
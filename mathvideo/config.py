@@ -19,8 +19,9 @@ load_dotenv()
 CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY", "")
 
 # Claude API的基础URL
-# 这是 Anthropic 的官方 API 服务端点地址
-CLAUDE_BASE_URL = "https://api.anthropic.com/v1"
+# 默认是 Anthropic 的官方 API 服务端点地址；
+# 可通过环境变量指向代理或本地桩服务器（tools/bench/stub_server.py）做离线基准测试
+CLAUDE_BASE_URL = os.getenv("CLAUDE_BASE_URL", "https://api.anthropic.com/v1").rstrip("/")
 
 # 使用的 Claude 模型名称
 # "claude-opus-4-5-20251101" 是 Claude Opus 4.5 的完整版本名称
@@ -38,12 +39,82 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
 
 # Gemini 原生 API Base URL
-GEMINI_NATIVE_BASE_URL = os.getenv("GEMINI_NATIVE_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_NATIVE_BASE_URL = os.getenv("GEMINI_NATIVE_BASE_URL", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
 
 # 使用的视觉模型名称
 # "gemini-3-pro-preview" 是 Gemini 3 Pro 在 Gemini API 中的模型标识
 GEMINI_VISION_MODEL_NAME = os.getenv("GEMINI_VISION_MODEL_NAME", "gemini-3-pro-preview")
 
+# ============================================================================
+# 分阶段模型配置
+# ============================================================================
+# 路由分类、资产关键词、JSON 修复、图片描述等轻量调用使用低延迟的快速模型，
+# 分镜、代码生成/修复/优化、视觉评估使用主模型。
+
+# 快速模型名称
+CLAUDE_FAST_MODEL_NAME = os.getenv("CLAUDE_FAST_MODEL_NAME", "claude-haiku-4-5-20251001")
+GEMINI_FAST_MODEL_NAME = os.getenv("GEMINI_FAST_MODEL_NAME", "gemini-2.5-flash")
+
+# 各阶段的默认 (提供商, 档位)
+# 档位 strong 对应主模型（CLAUDE_MODEL_NAME / GEMINI_VISION_MODEL_NAME），
+# fast 对应快速模型（CLAUDE_FAST_MODEL_NAME / GEMINI_FAST_MODEL_NAME）。
+# 文本阶段目前只支持 claude；视觉阶段（critic / describe_images）的提供商决定优先调用顺序。
+STAGE_DEFAULTS = {
+    "router": ("claude", "fast"),
+    "planner": ("claude", "strong"),
+    "coder": ("claude", "strong"),
+    "fixer": ("claude", "strong"),
+    "refiner": ("claude", "strong"),
+    "critic": ("gemini", "strong"),
+    "assets": ("claude", "fast"),
+    "json_repair": ("claude", "fast"),
+    "describe_images": ("gemini", "fast"),
+}
+
+_TIER_MODELS = {
+    ("claude", "strong"): CLAUDE_MODEL_NAME,
+    ("claude", "fast"): CLAUDE_FAST_MODEL_NAME,
+    ("gemini", "strong"): GEMINI_VISION_MODEL_NAME,
+    ("gemini", "fast"): GEMINI_FAST_MODEL_NAME,
+}
+
+
+def _parse_stage_override(value: str):
+    """解析 "provider:model" 或 "model" 形式的阶段覆盖配置"""
+    if ":" in value:
+        provider, model = value.split(":", 1)
+        return provider.strip().lower(), model.strip()
+    provider = "gemini" if value.startswith("gemini") else "claude"
+    return provider, value
+
+
+# 可通过环境变量 STAGE_MODEL_<STAGE> 覆盖单个阶段，
+# 如 STAGE_MODEL_ROUTER=claude:claude-haiku-4-5-20251001、STAGE_MODEL_CRITIC=claude:claude-opus-4-5-20251101
+STAGE_MODELS = {}
+for _stage, (_provider, _tier) in STAGE_DEFAULTS.items():
+    _override = os.getenv(f"STAGE_MODEL_{_stage.upper()}", "").strip()
+    STAGE_MODELS[_stage] = _parse_stage_override(_override) if _override else (_provider, _TIER_MODELS[(_provider, _tier)])
+
+
+def get_stage_model(stage: str, provider: str = None):
+    """
+    获取某个阶段使用的 (提供商, 模型)
+
+    参数:
+        stage: 阶段名称（router / planner / coder / fixer / refiner / critic / assets / json_repair / describe_images）
+        provider: 指定提供商时返回该提供商上同档位的模型（用于视觉调用回退到另一家）
+
+    返回:
+        tuple: (provider, model)；未知阶段使用 Claude 主模型
+    """
+    if stage not in STAGE_MODELS:
+        return provider or "claude", _TIER_MODELS[(provider or "claude", "strong")]
+    stage_provider, model = STAGE_MODELS[stage]
+    if provider and provider != stage_provider:
+        tier = STAGE_DEFAULTS[stage][1]
+        return provider, _TIER_MODELS[(provider, tier)]
+    return stage_provider, model
+
 # ============================================================================
 # 资产与功能配置
 # ============================================================================
@@ -58,3 +129,156 @@ USE_ASSETS = os.getenv("USE_ASSETS", "true").lower() in ("1", "true", "yes")
 # 是否启用视觉反馈（High-end feature）
 # 需要配置 GEMINI_API_KEY 或 CLAUDE_API_KEY 才能真正生效
 USE_VISUAL_FEEDBACK = os.getenv("USE_VISUAL_FEEDBACK", "true").lower() in ("1", "true", "yes")
+
+# CLI 是否在所有章节渲染完成后批量评估（CLI --batch-critique / --no-batch-critique 的默认值）：
+# 所有章节的关键帧按章节标注后放进一次视觉请求，返回每个章节的结论，再并行优化有问题的章节；
+# 关闭时每个章节渲染后立即单独评估。递进模式（sequential）下未显式指定 --batch-critique 时不批量评估，
+# 以便修复/优化后的代码作为后续章节的上下文
+CRITIC_BATCH = os.getenv("CRITIC_BATCH", "true").lower() in ("1", "true", "yes")
+
+# 单次批量评估最多包含的章节数，超出时分成多次请求
+CRITIC_BATCH_MAX_SECTIONS = max(1, int(os.getenv("CRITIC_BATCH_MAX_SECTIONS", "8")))
+
+# 独立模式（knowledge / problem）下并行生成章节代码的最大并发数（CLI --jobs 的默认值）
+# 1 表示逐个生成；实际请求速率仍受 CLAUDE_RPM / CLAUDE_TPM 限制
+CODEGEN_JOBS = max(1, int(os.getenv("CODEGEN_JOBS", "4")))
+
+# ============================================================================
+# 渲染配置
+# ============================================================================
+# 常驻 Manim 渲染工作进程数量（预导入 manim 和 mathvideo.manim_base），0 表示每次启动 manim 子进程
+RENDER_POOL_SIZE = int(os.getenv("RENDER_POOL_SIZE", "2"))
+
+# 每个工作进程渲染多少个任务后回收重启（避免内存和全局状态累积）
+RENDER_WORKER_MAX_JOBS = int(os.getenv("RENDER_WORKER_MAX_JOBS", "20"))
+
+# 单个渲染任务的超时时间（秒）
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "600"))
+
+# 完整渲染前先试运行场景的 construct（跳过动画、不写帧），
+# 脚本错误在试运行阶段即可发现并交给修复代理，只有通过的代码才进入编码
+RENDER_DRY_RUN = os.getenv("RENDER_DRY_RUN", "true").lower() in ("1", "true", "yes")
+
+# 布局检查：完整渲染时由 TeachingScene 记录每一步所有对象的包围盒，检查文字重叠、
+# 越过讲义栏和超出网格；报告无问题时跳过远程视觉评估，有问题时直接把具体问题交给优化代理
+LAYOUT_CHECK = os.getenv("LAYOUT_CHECK", "true").lower() in ("1", "true", "yes")
+
+# 渲染结果缓存：脚本内容、manim / manim_base 版本和质量都相同时直接复用上次渲染的视频
+RENDER_CACHE_ENABLED = os.getenv("RENDER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# 渲染缓存目录（命中时以 reflink / 硬链接放入项目目录，建议与 output 位于同一文件系统）
+RENDER_CACHE_DIR = os.path.expanduser(os.getenv(
+    "RENDER_CACHE_DIR",
+    os.path.join("~", ".cache", "mathvideo", "render"),
+))
+
+# 渲染缓存总大小上限（MB），超出后按最近访问时间淘汰
+RENDER_CACHE_MAX_MB = float(os.getenv("RENDER_CACHE_MAX_MB", "2048"))
+
+# ============================================================================
+# 视觉请求图片配置
+# ============================================================================
+# 发给视觉模型的图片（critic 关键帧、describe_images 输入图片）在内存中编码的格式: jpeg / webp / png
+VISION_IMAGE_FORMAT = os.getenv("VISION_IMAGE_FORMAT", "jpeg").strip().lower()
+
+# JPEG / WebP 编码质量（1-100）
+VISION_IMAGE_QUALITY = int(os.getenv("VISION_IMAGE_QUALITY", "85"))
+
+# 单张图片的像素预算，超出时等比缩小（Claude 建议不超过约 1.15MP），0 表示不限制
+VISION_MAX_PIXELS = int(os.getenv("VISION_MAX_PIXELS", "1150000"))
+
+# critic 关键帧是否拼成一张联系表发送（Gemini 按图片图块计费，拼图后图片 token 约为 1/4）
+VISION_CONTACT_SHEET = os.getenv("VISION_CONTACT_SHEET", "true").lower() in ("1", "true", "yes")
+
+# ============================================================================
+# 视觉评估缓存配置
+# ============================================================================
+# 按视频内容 + 章节描述缓存 critic 结论；关键帧与上次评估的渲染感知哈希一致时复用上次结论
+CRITIQUE_CACHE_ENABLED = os.getenv("CRITIQUE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# 评估缓存目录
+CRITIQUE_CACHE_DIR = os.path.expanduser(os.getenv(
+    "CRITIQUE_CACHE_DIR",
+    os.path.join("~", ".cache", "mathvideo", "critique"),
+))
+
+# 感知哈希（每帧 256 位 dHash）允许的最大逐帧汉明距离，超过则视为画面有变化；负数表示关闭感知哈希比较
+CRITIQUE_PHASH_DISTANCE = int(os.getenv("CRITIQUE_PHASH_DISTANCE", "4"))
+
+# ============================================================================
+# 视觉请求对冲配置
+# ============================================================================
+# critic 和 describe_images 的视觉请求是否对冲：主提供商在等待 VISION_HEDGE_DELAY 后仍未返回时
+# 并行请求备用提供商，先给出可解析结果的一方胜出，另一方被取消（关闭时按顺序失败回退）
+VISION_HEDGE = os.getenv("VISION_HEDGE", "true").lower() in ("1", "true", "yes")
+
+# 发出对冲请求前的等待时间（秒）；主提供商已有足够的历史耗时时改用其 VISION_HEDGE_PERCENTILE 分位数
+VISION_HEDGE_DELAY = float(os.getenv("VISION_HEDGE_DELAY", "30"))
+
+# 用主提供商历史耗时的哪个分位数作为对冲等待时间
+VISION_HEDGE_PERCENTILE = float(os.getenv("VISION_HEDGE_PERCENTILE", "90"))
+
+# 代码生成是否使用流式输出（SSE）
+# 开启后可以边生成边展示代码，并在 Python 代码块闭合后立即停止生成
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() in ("1", "true", "yes")
+
+# 是否为静态 system 前缀（CODER/PLANNER 指令 + Skill）启用 Anthropic 提示缓存
+# 多个章节共享同一前缀，缓存命中后按缓存读取计费并降低首 token 延迟
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# ============================================================================
+# LLM 响应缓存配置
+# ============================================================================
+# 缓存模式: off（默认）/ on（读写）/ record（只写）/ replay（严格回放，未命中即失败）
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off").strip().lower()
+
+# 缓存目录（内容寻址的 JSON 文件）
+LLM_CACHE_DIR = os.path.expanduser(os.getenv(
+    "LLM_CACHE_DIR",
+    os.path.join("~", ".cache", "mathvideo", "llm"),
+))
+
+# 缓存总大小上限（MB），超出后按最近访问时间淘汰
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "512"))
+
+# 缓存条目有效期（小时），0 表示永不过期
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+
+# ============================================================================
+# HTTP 连接池配置
+# ============================================================================
+# 每个提供商（claude / gemini）在进程内共享一个连接池，复用 TCP+TLS 连接，
+# 避免每次 LLM / 视觉调用都重新握手。
+
+# 每个提供商连接池的最大连接数（并发请求数超过该值时会临时新建连接）
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+# 异步连接池中空闲 keep-alive 连接的保留时间（秒）
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# 异步传输是否尝试 HTTP/2（需要安装 h2 包，未安装时自动回退到 HTTP/1.1）
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# ============================================================================
+# 重试与限流配置
+# ============================================================================
+# 遇到 429（限流）/ 529（过载）/ 5xx 以及网络错误时的最大重试次数
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+
+# 指数退避的基础等待时间和上限（秒），实际等待时间带随机抖动；
+# 服务端返回 retry-after 时以其为准
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "60"))
+
+# 进程内共享的客户端限流（令牌桶），0 表示不限制
+# RPM: 每分钟请求数；TPM: 每分钟 token 数（按请求体估算输入，并在响应后补记输出）
+CLAUDE_RPM = int(os.getenv("CLAUDE_RPM", "0"))
+CLAUDE_TPM = int(os.getenv("CLAUDE_TPM", "0"))
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "0"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "0"))
+
+# 视觉调用的熔断器（按提供商 + 接口）：连续失败 CIRCUIT_FAILURE_THRESHOLD 次后熔断，
+# CIRCUIT_RESET_TIMEOUT 秒内直接跳过该提供商；之后放行一个探测请求，成功则恢复
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() in ("1", "true", "yes")
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "60"))
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+视觉评估结果缓存
+
+POST /critique 和 /refine 都会调用 VisualCritic，同一个视频可能被反复评估；
+优化后重新渲染的视频如果画面没有变化（例如只改了注释或不可见的代码），也会再评估一次。
+本缓存在两级上避免重复的视觉模型调用:
+
+1. 内容命中: 以视频文件 sha256 + 章节描述（storyboard section）+ 评估配置（CRITIC_PROMPT、
+   视觉模型）为键保存结论，同一个视频再次评估直接返回
+2. 感知哈希命中: 每个章节槽位（视频路径 + 章节描述 + 评估配置）记住上一次被评估的渲染的
+   关键帧感知哈希；新视频的关键帧与之逐帧比较，dHash 汉明距离都不超过 CRITIQUE_PHASH_DISTANCE
+   且颜色缩略图差异不超过 MAX_COLOR_DELTA 时视为画面一致，复用上一次的结论
+   （视觉模型看到的正是这几帧，结论不会不同）
+
+dHash 使用 16×16 的灰度梯度（256 位）：轻微编码噪声和 1 像素以内的偏移只改变几位，
+对象移动 2 像素以上（320px 宽的关键帧）或内容变化通常超过阈值；dHash 看不出换色，
+由 8×8 的 RGB 平均色缩略图补上。
+
+目录结构:
+    <CRITIQUE_CACHE_DIR>/entries/<key[:2]>/<key>.json   内容键 -> 结论
+    <CRITIQUE_CACHE_DIR>/last/<slot>.json               章节槽位 -> 上一次被评估的渲染
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import List, Optional
+
+from mathvideo.config import (
+    CRITIQUE_CACHE_DIR,
+    CRITIQUE_CACHE_ENABLED,
+    CRITIQUE_PHASH_DISTANCE,
+)
+
+CACHE_VERSION = 1
+
+# dHash 边长（hash_size × hash_size 位）
+HASH_SIZE = 16
+
+# 颜色缩略图边长与允许的最大通道差（0-255）：编码噪声和 1 像素偏移只改变几个单位
+COLOR_GRID = 8
+MAX_COLOR_DELTA = 12
+
+
+def section_fingerprint(section: Optional[dict]) -> str:
+    """章节描述的指纹（按键排序序列化后取 sha256）"""
+    text = json.dumps(section or {}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def frame_hash(image, hash_size: int = HASH_SIZE) -> str:
+    """
+    计算单帧的感知哈希: "<dHash>-<颜色缩略图>"（均为十六进制）
+
+    dHash 是相邻像素亮度梯度的符号（hash_size² 位），对编码噪声不敏感，但看不出换色；
+    因此再附上 COLOR_GRID×COLOR_GRID 的 RGB 平均色缩略图，用于发现颜色变化。
+
+    参数:
+        image: PIL Image
+        hash_size: dHash 边长
+    """
+    import numpy as np
+    from PIL import Image
+
+    gray = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = np.packbits((pixels[:, 1:] > pixels[:, :-1]).flatten())
+    colors = np.asarray(image.convert("RGB").resize((COLOR_GRID, COLOR_GRID), Image.BOX), dtype=np.uint8)
+    return f"{bits.tobytes().hex()}-{colors.tobytes().hex()}"
+
+
+def frame_hashes(images: list) -> List[str]:
+    """计算多帧的感知哈希"""
+    return [frame_hash(image) for image in images]
+
+
+def hash_distance(previous: List[str], current: List[str]) -> Optional[tuple]:
+    """
+    比较两组关键帧的感知哈希
+
+    返回:
+        tuple: (dHash 最大逐帧汉明距离, 颜色缩略图最大通道差)；帧数不同时返回 None（无法逐帧比较）
+    """
+    if not previous or len(previous) != len(current):
+        return None
+    bits = 0
+    color = 0
+    for a, b in zip(previous, current):
+        a_bits, a_colors = a.split("-")
+        b_bits, b_colors = b.split("-")
+        bits = max(bits, bin(int(a_bits, 16) ^ int(b_bits, 16)).count("1"))
+        color = max(color, max(abs(x - y) for x, y in zip(bytes.fromhex(a_colors), bytes.fromhex(b_colors))))
+    return bits, color
+
+
+class CritiqueCache:
+    """
+    基于文件的视觉评估结果缓存
+
+    参数:
+        cache_dir: 缓存根目录
+        max_distance: 感知哈希命中的最大逐帧汉明距离（0 表示画面必须完全一致）
+    """
+
+    def __init__(self, cache_dir: str, max_distance: int = 4):
+        self.cache_dir = cache_dir
+        self.max_distance = max_distance
+        self.hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(video_sha256: str, section_fp: str, variant: str) -> str:
+        """内容键: 视频内容 + 章节描述 + 评估配置"""
+        basis = f"{CACHE_VERSION}|{video_sha256}|{section_fp}|{variant}"
+        return hashlib.sha256(basis.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def slot_key(video_path: str, section_fp: str, variant: str) -> str:
+        """章节槽位键: 同一章节的视频路径固定，多次优化 / 重新渲染共用一个槽位"""
+        basis = f"{CACHE_VERSION}|{os.path.abspath(video_path)}|{section_fp}|{variant}"
+        return hashlib.sha256(basis.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, "entries", key[:2], f"{key}.json")
+
+    def _slot_path(self, slot: str) -> str:
+        return os.path.join(self.cache_dir, "last", f"{slot}.json")
+
+    @staticmethod
+    def _read(path: str) -> Optional[dict]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("version") == CACHE_VERSION else None
+
+    @staticmethod
+    def _write(path: str, entry: dict):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def get(self, key: str) -> Optional[dict]:
+        """按内容键读取结论"""
+        entry = self._read(self._entry_path(key))
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def match_last(self, slot: str, hashes: List[str]) -> Optional[tuple]:
+        """
+        与章节槽位上一次被评估的渲染比较关键帧
+
+        返回:
+            tuple: (上一次的结论 entry, (最大逐帧汉明距离, 最大颜色差))；没有记录或画面不一致时返回 None
+        """
+        last = self._read(self._slot_path(slot))
+        if last is None:
+            return None
+        distance = hash_distance(last.get("frame_hashes") or [], hashes)
+        if distance is None or distance[0] > self.max_distance or distance[1] > MAX_COLOR_DELTA:
+            return None
+        with self._lock:
+            self.perceptual_hits += 1
+            # get() 已经把这次查询记为未命中
+            self.misses -= 1
+        return last, distance
+
+    def put(self, key: str, slot: str, entry: dict):
+        """保存结论，并把它记为章节槽位上一次被评估的渲染"""
+        entry = dict(entry, version=CACHE_VERSION, created_at=entry.get("created_at") or time.time())
+        self._write(self._entry_path(key), entry)
+        self._write(self._slot_path(slot), entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "dir": self.cache_dir,
+                "hits": self.hits,
+                "perceptual_hits": self.perceptual_hits,
+                "misses": self.misses,
+            }
+
+
+_cache: Optional[CritiqueCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_critique_cache() -> Optional[CritiqueCache]:
+    """获取全局视觉评估缓存实例（CRITIQUE_CACHE_ENABLED=false 时返回 None）"""
+    global _cache
+    if not CRITIQUE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = CritiqueCache(CRITIQUE_CACHE_DIR, max_distance=CRITIQUE_PHASH_DISTANCE)
+        return _cache
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+视觉评估的关键帧采样
+
+旧流程解码整段视频、每秒转一帧 PNG 写入 frames/ 目录，最后只用其中 4 帧。
+这里先根据容器元数据（时长、帧率）算出目标时间点，对每个时间点 seek 到它之前
+最近的关键帧，只解码到目标帧为止；解码开启 FFmpeg 多线程，结果直接保存在内存中。
+耗时只取决于采样数量和 GOP 长度，与视频总时长无关，也不再写磁盘。
+"""
+import math
+from fractions import Fraction
+from typing import List, Optional
+
+# 与旧流程一致：按每秒一帧编号，取首、1/3、2/3、尾 4 帧
+DEFAULT_SAMPLE_COUNT = 4
+DEFAULT_WIDTH = 320
+
+
+def sample_timestamps(duration: float, count: int = DEFAULT_SAMPLE_COUNT) -> List[float]:
+    """
+    计算采样时间点（秒）
+
+    与旧流程的选帧规则一致：把视频按每秒一帧编号为 0..n-1，
+    n 不超过 count 时全部保留，否则取首帧、1/3、2/3 处和尾帧。
+    """
+    n = max(1, math.ceil(duration - 1e-6))
+    if n <= count:
+        return [float(i) for i in range(n)]
+    if count == 1:
+        return [0.0]
+    indices = sorted({(n - 1) if k == count - 1 else k * n // (count - 1) for k in range(count)})
+    return [float(i) for i in indices]
+
+
+def _video_duration(container, stream) -> Optional[float]:
+    import av
+
+    if stream.duration is not None and stream.time_base is not None:
+        return float(stream.duration * stream.time_base)
+    if container.duration is not None:
+        return container.duration / av.time_base
+    if stream.frames and stream.average_rate:
+        return stream.frames / float(stream.average_rate)
+    return None
+
+
+def _keyframe_before(container, stream, target: int) -> Optional[int]:
+    """返回 target 之前最近的关键帧的 pts（只读数据包，不解码）"""
+    container.seek(target, stream=stream, backward=True, any_frame=False)
+    for packet in container.demux(stream):
+        if packet.dts is None:
+            continue
+        return packet.pts if packet.pts is not None else packet.dts
+    return None
+
+
+def _scaled_image(frame, width: int):
+    """用 swscale（Lanczos）缩放到指定宽度（保持宽高比）并转为 PIL Image"""
+    height = max(1, int(frame.height * width / frame.width))
+    return frame.reformat(width=width, height=height, format="rgb24", interpolation="LANCZOS").to_image()
+
+
+def sample_frames(video_path: str, count: int = DEFAULT_SAMPLE_COUNT, width: int = DEFAULT_WIDTH) -> list:
+    """
+    从视频中采样代表帧
+
+    参数:
+        video_path: 视频路径
+        count: 采样帧数
+        width: 缩放后的宽度（像素）
+
+    返回:
+        list: PIL Image 列表（按时间顺序），视频无法解码时为空列表
+    """
+    import av
+
+    images = []
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        # 帧级 + 切片级多线程解码
+        stream.thread_type = "AUTO"
+        time_base = stream.time_base
+        duration = _video_duration(container, stream)
+        fps = float(stream.average_rate) if stream.average_rate else None
+
+        if duration is None or time_base is None:
+            # 元数据缺失时只能顺序解码，仍只在内存中保留采样帧
+            frames = []
+            interval = max(1, int(fps or 1))
+            for index, frame in enumerate(container.decode(stream)):
+                if index % interval == 0:
+                    frames.append(frame)
+            if len(frames) > count:
+                picks = sample_timestamps(len(frames), count)
+                frames = [frames[int(i)] for i in picks]
+            return [_scaled_image(frame, width) for frame in frames]
+
+        start = stream.start_time or 0
+        # 最后一帧的时间点，避免目标落在视频末尾之后
+        last = max(0.0, duration - (1 / fps if fps else 0))
+        decoder = None
+        cursor = None
+        # 第二个容器只做 demux，用来查询目标之前最近的关键帧位置
+        with av.open(video_path) as probe:
+            probe_stream = probe.streams.video[0]
+            for timestamp in sample_timestamps(duration, count):
+                target = start + round(Fraction(min(timestamp, last)).limit_denominator(1_000_000) / time_base)
+                keyframe = _keyframe_before(probe, probe_stream, target)
+                # 目标与当前解码位置之间没有关键帧时继续往后解码，比 seek 回关键帧重新解码更快
+                if decoder is None or cursor is None or keyframe is None or keyframe > cursor:
+                    container.seek(target, stream=stream, backward=True, any_frame=False)
+                    decoder = container.decode(stream)
+                picked = None
+                for frame in decoder:
+                    picked = frame
+                    cursor = frame.pts
+                    if frame.pts is None or frame.pts >= target:
+                        break
+                if picked is not None:
+                    images.append(_scaled_image(picked, width))
+    return images
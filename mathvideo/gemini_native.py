@@ -1,10 +1,12 @@
 import base64
 import os
+import time
 from typing import List, Optional
 
-import requests
-
 from mathvideo.config import GEMINI_API_KEY, GEMINI_VISION_MODEL_NAME, GEMINI_NATIVE_BASE_URL
+from mathvideo.circuit_breaker import CircuitOpenError
+from mathvideo.metrics import record_call, gemini_usage
+from mathvideo.retry import post_with_retry, apost_with_retry
 
 
 def _guess_mime_type(data_url_header: Optional[str], file_path: Optional[str]) -> str:
@@ -64,15 +66,8 @@ def file_to_inline_part(file_path: str) -> Optional[dict]:
         return None
 
 
-def generate_content_from_parts(
-    parts: List[dict],
-    model: Optional[str] = None,
-    api_key: Optional[str] = None,
-    timeout: int = 60,
-) -> Optional[str]:
-    """
-    调用 Gemini 原生 API (generateContent)，返回拼接后的文本内容。
-    """
+def _build_generate_request(parts: List[dict], model: Optional[str], api_key: Optional[str]):
+    """构建 generateContent 请求，返回 (url, params, payload)；缺少 Key 或 parts 时返回 None"""
     api_key = api_key or GEMINI_API_KEY
     model = model or GEMINI_VISION_MODEL_NAME
     if not api_key:
@@ -90,11 +85,11 @@ def generate_content_from_parts(
             }
         ]
     }
+    return url, params, payload
 
-    response = requests.post(url, params=params, json=payload, timeout=timeout)
-    if response.status_code != 200:
-        raise RuntimeError(f"Gemini API error {response.status_code}: {response.text[:200]}")
-    data = response.json()
+
+def _extract_text(data: dict) -> Optional[str]:
+    """从 generateContent 响应中拼接文本内容"""
     candidates = data.get("candidates") or []
     if not candidates:
         return None
@@ -103,3 +98,80 @@ def generate_content_from_parts(
     texts = [p.get("text", "") for p in parts_out if p.get("text")]
     text = "".join(texts).strip()
     return text or None
+
+
+def generate_content_from_parts(
+    parts: List[dict],
+    model: Optional[str] = None,
+    api_key: Optional[str] = None,
+    timeout: int = 60,
+    stage: Optional[str] = None,
+) -> Optional[str]:
+    """
+    调用 Gemini 原生 API (generateContent)，返回拼接后的文本内容。
+    429 / 5xx 与网络错误按退避策略重试（见 mathvideo.retry）；每个模型的 generateContent 接口
+    经过熔断器，已熔断时抛出 CircuitOpenError，不发送请求。
+    stage 为调用阶段（critic / describe_images），写入调用指标。
+    """
+    model = model or GEMINI_VISION_MODEL_NAME
+    request = _build_generate_request(parts, model, api_key)
+    if request is None:
+        return None
+    url, params, payload = request
+
+    started = time.perf_counter()
+    retries = 0
+    try:
+        response = post_with_retry(
+            "gemini", url, json_body=payload, params=params, timeout=timeout,
+            circuit=f"generateContent/{model}",
+        )
+        retries = response.retries
+        if response.status_code != 200:
+            raise RuntimeError(f"Gemini API error {response.status_code}: {response.text[:200]}")
+        data = response.json()
+    except CircuitOpenError:
+        # 已熔断，没有发出请求
+        raise
+    except Exception as e:
+        record_call(stage, "gemini", model, started, retries=retries, ok=False, error=str(e))
+        raise
+    record_call(stage, "gemini", model, started, usage=gemini_usage(data), retries=retries)
+    return _extract_text(data)
+
+
+async def agenerate_content_from_parts(
+    parts: List[dict],
+    model: Optional[str] = None,
+    api_key: Optional[str] = None,
+    timeout: int = 60,
+    stage: Optional[str] = None,
+) -> Optional[str]:
+    """
+    generate_content_from_parts 的异步版本，使用共享的 httpx.AsyncClient。
+    """
+    model = model or GEMINI_VISION_MODEL_NAME
+    request = _build_generate_request(parts, model, api_key)
+    if request is None:
+        return None
+    url, params, payload = request
+
+    started = time.perf_counter()
+    retries = 0
+    try:
+        response = await apost_with_retry(
+            "gemini", url, json_body=payload, params=params, timeout=timeout,
+            circuit=f"generateContent/{model}",
+        )
+        retries = response.retries
+        if response.status_code != 200:
+            raise RuntimeError(f"Gemini API error {response.status_code}: {response.text[:200]}")
+        data = response.json()
+    except CircuitOpenError:
+        # 已熔断，没有发出请求
+        raise
+    except Exception as e:
+        record_call(stage, "gemini", model, started, retries=retries, ok=False, error=str(e))
+        raise
+    record_call(stage, "gemini", model, started, usage=gemini_usage(data), retries=retries)
+    return _extract_text(data)
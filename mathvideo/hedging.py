@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+视觉请求对冲（hedged requests）
+
+critic 和 describe_images 原来按顺序调用视觉模型：主提供商（默认 Gemini）失败后才回退到
+备用提供商（Claude）。主提供商变慢或卡到超时时，整次请求要等满超时再加上一次完整的备用调用。
+
+对冲策略:
+1. 先请求主提供商，等待 hedge_delay()（主提供商历史耗时的 VISION_HEDGE_PERCENTILE 分位数，
+   样本不足时用 VISION_HEDGE_DELAY）
+2. 到时仍未返回就并行请求下一个提供商；主提供商提前失败时立即请求下一个
+3. 先给出可解析结果（accept() 返回非 None）的一方胜出，其余请求被取消:
+   异步版本直接取消任务；同步版本无法中断正在进行的 HTTP 请求，只能放弃其结果
+   （每个请求在独立的守护线程中执行，被放弃的请求不会占用共享线程池、拖慢后续请求）
+4. 每次请求通过 metrics.record_hedge 记录胜出的提供商和节省的时间
+
+节省时间（saved_s）相对原来的顺序回退计算:
+    主提供商胜出                    0
+    主提供商失败后备用方胜出        主提供商失败时刻 - 备用请求发出时刻（不小于 0）
+    主提供商仍在进行时备用方胜出    按"主提供商最终失败、再顺序调用备用方"估计，即胜出方的耗时
+
+VISION_HEDGE=false 时退化为原来的顺序回退。
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from mathvideo.config import VISION_HEDGE, VISION_HEDGE_DELAY, VISION_HEDGE_PERCENTILE
+from mathvideo.metrics import get_metrics_project, load_metrics, record_hedge
+
+# 提供商显示名称（日志用）
+_LABELS = {"gemini": "Gemini", "claude": "Claude"}
+
+# 每个 (阶段, 提供商) 保留的最近耗时样本数，以及使用分位数前至少需要的样本数
+WINDOW = 50
+MIN_SAMPLES = 5
+
+
+class LatencyTracker:
+    """
+    按 (阶段, 提供商) 记录最近的视觉调用耗时
+
+    首次查询某个项目时从其 metrics.jsonl 读取历史耗时（成功且非缓存命中的调用），
+    之后由 hedged_call 在每次请求结束后补充样本。
+    """
+
+    def __init__(self, window: int = WINDOW):
+        self.window = window
+        self._samples: Dict[Tuple[str, str], deque] = {}
+        self._seeded = set()
+        self._lock = threading.Lock()
+
+    def _seed(self):
+        project_dir = get_metrics_project()
+        if not project_dir or project_dir in self._seeded:
+            return
+        self._seeded.add(project_dir)
+        for record in load_metrics(project_dir):
+            if record.get("event") or not record.get("ok") or record.get("cache_hit"):
+                continue
+            key = (record.get("stage"), record.get("provider"))
+            samples = self._samples.setdefault(key, deque(maxlen=self.window))
+            samples.append(float(record.get("latency_ms") or 0) / 1000)
+
+    def observe(self, stage: str, provider: str, seconds: float):
+        """记录一次耗时（秒）"""
+        with self._lock:
+            self._samples.setdefault((stage, provider), deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, stage: str, provider: str, q: float) -> Optional[float]:
+        """
+        最近耗时的 q 分位数（秒，最近秩法）
+
+        返回:
+            float: 分位数；样本少于 MIN_SAMPLES 时返回 None
+        """
+        with self._lock:
+            self._seed()
+            samples = sorted(self._samples.get((stage, provider), ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        rank = max(1, int(-(-q * len(samples) // 100)))
+        return samples[min(rank, len(samples)) - 1]
+
+
+_tracker = LatencyTracker()
+
+
+def get_latency_tracker() -> LatencyTracker:
+    """获取全局耗时记录实例"""
+    return _tracker
+
+
+def _submit(fn: Callable) -> Future:
+    """
+    在新的守护线程中执行 fn（在调用方的上下文中，record_call 才能写入当前项目的指标）
+
+    被放弃的同步请求会一直运行到超时和重试结束；放在共享的定长线程池里会占满工作线程，
+    让后续的主请求和对冲请求排队，因此每个请求单独起一个线程。
+    """
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        # 启动前已被取消（对冲已结束）时不再发出请求
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(context.run(fn))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="vision-hedge", daemon=True).start()
+    return future
+
+
+def hedge_delay(stage: str, provider: str) -> float:
+    """发出对冲请求前的等待时间：主提供商历史耗时的分位数，样本不足时用 VISION_HEDGE_DELAY"""
+    observed = _tracker.percentile(stage, provider, VISION_HEDGE_PERCENTILE)
+    return VISION_HEDGE_DELAY if observed is None else observed
+
+
+class _Race:
+    """一次对冲请求的状态：记录每个提供商的发出时刻和结果，最后计算节省的时间并写入指标"""
+
+    def __init__(self, stage: str, attempts: list):
+        self.stage = stage
+        self.attempts = attempts
+        self.primary = attempts[0][0]
+        self.delay = hedge_delay(stage, self.primary) if VISION_HEDGE else 0.0
+        self.started = time.perf_counter()
+        self.launched: Dict[str, float] = {}
+        self.log: List[dict] = []
+        self.next_index = 0
+        self.hedged = False
+        self.primary_failed_at: Optional[float] = None
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def next_attempt(self, reason: Optional[str]):
+        """取出下一个要请求的提供商；reason 为 "hedge" / "fallback" 时打印切换日志"""
+        provider, fn = self.attempts[self.next_index]
+        self.next_index += 1
+        self.launched[provider] = self.elapsed()
+        if reason == "hedge":
+            self.hedged = True
+            print(f"   ⏱️ {_LABELS.get(self.primary, self.primary)} {self.delay:.1f}s 内未返回，"
+                  f"并行请求 {_LABELS.get(provider, provider)}。")
+        elif reason == "fallback":
+            print(f"   🔁 {_LABELS.get(self.attempts[self.next_index - 2][0])} 无法使用，"
+                  f"切换到 {_LABELS.get(provider, provider)}。")
+        return provider, fn
+
+    def has_next(self) -> bool:
+        return self.next_index < len(self.attempts)
+
+    def next_hedge_at(self) -> float:
+        """下一个对冲请求的发出时刻（相对开始时间）：每 delay 秒最多再发出一个"""
+        return max(self.launched.values()) + self.delay
+
+    def finish(self, provider: str, accepted: bool):
+        """记录一个提供商的结果"""
+        now = self.elapsed()
+        elapsed = now - self.launched[provider]
+        self.log.append({"provider": provider, "elapsed_s": round(elapsed, 3),
+                         "outcome": "won" if accepted else "failed"})
+        if accepted:
+            _tracker.observe(self.stage, provider, elapsed)
+        elif provider == self.primary:
+            self.primary_failed_at = now
+
+    def cancel(self, provider: str):
+        """记录被取消的请求；主提供商被取消时的已耗时也作为样本，避免慢请求被取消后分位数越来越低"""
+        elapsed = self.elapsed() - self.launched[provider]
+        self.log.append({"provider": provider, "elapsed_s": round(elapsed, 3), "outcome": "cancelled"})
+        if provider == self.primary:
+            _tracker.observe(self.stage, provider, elapsed)
+
+    def report(self, winner: Optional[str]) -> dict:
+        """计算节省的时间并写入指标"""
+        latency = self.elapsed()
+        saved = 0.0
+        if winner and winner != self.primary:
+            winner_elapsed = latency - self.launched[winner]
+            if self.primary_failed_at is not None:
+                saved = max(0.0, self.primary_failed_at - self.launched[winner])
+            else:
+                saved = winner_elapsed
+        info = {
+            "stage": self.stage,
+            "winner": winner,
+            "primary": self.primary,
+            "hedged": self.hedged,
+            "delay_s": round(self.delay, 3),
+            "latency_s": round(latency, 3),
+            "saved_s": round(saved, 3),
+            "attempts": self.log,
+        }
+        record_hedge(self.stage, self.primary, winner, self.hedged, self.delay, latency, saved, self.log)
+        if self.hedged and winner:
+            print(f"   🏁 {_LABELS.get(winner, winner)} 胜出（{latency:.1f}s），节省约 {saved:.1f}s。")
+        return info
+
+
+def _accept(accept: Callable, content, provider: str):
+    try:
+        return accept(content)
+    except Exception as e:
+        print(f"   ⚠️ {_LABELS.get(provider, provider)} 返回结果无法使用: {e}")
+        return None
+
+
+def hedged_call(stage: str, attempts: List[Tuple[str, Callable]], accept: Callable) -> Tuple[object, dict]:
+    """
+    对冲调用多个提供商（同步版本，每个请求在独立线程中执行）
+
+    参数:
+        stage: 调用阶段（用于耗时统计和指标）
+        attempts: 按优先级排列的 [(提供商, 无参调用函数)]；调用函数失败时应返回 None 而不是抛出异常
+        accept: 把调用结果转换为最终结果，无法使用时返回 None（例如 JSON 解析失败）
+
+    返回:
+        tuple: (胜出的结果或 None, 本次请求信息 dict，见 _Race.report)
+    """
+    if not attempts:
+        return None, {}
+    race = _Race(stage, attempts)
+    if not VISION_HEDGE or len(attempts) == 1:
+        for i in range(len(attempts)):
+            provider, fn = race.next_attempt("fallback" if i else None)
+            value = _accept(accept, fn(), provider)
+            race.finish(provider, value is not None)
+            if value is not None:
+                return value, race.report(provider)
+        return None, race.report(None)
+
+    pending = {}
+
+    def launch(reason):
+        provider, fn = race.next_attempt(reason)
+        pending[_submit(fn)] = provider
+
+    launch(None)
+    while pending or race.has_next():
+        if not pending:
+            launch("fallback")
+            continue
+        timeout = max(0.0, race.next_hedge_at() - race.elapsed()) if race.has_next() else None
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            launch("hedge")
+            continue
+        for future in done:
+            provider = pending.pop(future)
+            try:
+                content = future.result()
+            except Exception as e:
+                print(f"   ⚠️ {_LABELS.get(provider, provider)} 调用失败: {e}")
+                content = None
+            value = _accept(accept, content, provider)
+            race.finish(provider, value is not None)
+            if value is not None:
+                for loser, loser_provider in pending.items():
+                    # 正在执行的请求无法中断，结果会被丢弃
+                    loser.cancel()
+                    race.cancel(loser_provider)
+                return value, race.report(provider)
+    return None, race.report(None)
+
+
+async def ahedged_call(stage: str, attempts: List[Tuple[str, Callable]], accept: Callable) -> Tuple[object, dict]:
+    """
+    hedged_call 的异步版本：attempts 中的调用函数返回协程，失败方的任务会被取消
+
+    参数、返回值同 hedged_call
+    """
+    if not attempts:
+        return None, {}
+    race = _Race(stage, attempts)
+    if not VISION_HEDGE or len(attempts) == 1:
+        for i in range(len(attempts)):
+            provider, fn = race.next_attempt("fallback" if i else None)
+            value = _accept(accept, await fn(), provider)
+            race.finish(provider, value is not None)
+            if value is not None:
+                return value, race.report(provider)
+        return None, race.report(None)
+
+    pending = {}
+
+    def launch(reason):
+        provider, fn = race.next_attempt(reason)
+        pending[asyncio.ensure_future(fn())] = provider
+
+    launch(None)
+    try:
+        while pending or race.has_next():
+            if not pending:
+                launch("fallback")
+                continue
+            timeout = max(0.0, race.next_hedge_at() - race.elapsed()) if race.has_next() else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch("hedge")
+                continue
+            for task in done:
+                provider = pending.pop(task)
+                try:
+                    content = task.result()
+                except Exception as e:
+                    print(f"   ⚠️ {_LABELS.get(provider, provider)} 调用失败: {e}")
+                    content = None
+                value = _accept(accept, content, provider)
+                race.finish(provider, value is not None)
+                if value is not None:
+                    for loser_provider in pending.values():
+                        race.cancel(loser_provider)
+                    return value, race.report(provider)
+        return None, race.report(None)
+    finally:
+        # 胜出后（或调用方被取消时）取消仍在进行的请求
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP 连接池
+
+为每个模型提供商（claude / gemini）维护一个进程级共享的 requests.Session。
+Session 内部的 urllib3 连接池会保持 keep-alive 连接，同一进程里的 Router、
+Planner、Coder、Fix、Refine、Critic 等调用复用已建立的 TCP+TLS 连接，
+不必每次请求都重新握手。
+
+注意: requests/urllib3 只支持 HTTP/1.1，同步路径通过 keep-alive 复用连接；
+异步路径使用 httpx.AsyncClient，安装了 h2 时启用 HTTP/2 多路复用。
+"""
+import asyncio
+import importlib.util
+import threading
+from typing import Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from mathvideo.config import HTTP_POOL_SIZE, HTTP_KEEPALIVE_EXPIRY, HTTP2_ENABLED
+
+
+# provider -> Session，进程内共享
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+# (provider, id(loop)) -> (loop, AsyncClient)
+# httpx.AsyncClient 绑定创建它的事件循环，因此按事件循环分别缓存
+_async_clients: Dict[Tuple[str, int], tuple] = {}
+
+
+def _build_session(pool_size: int) -> requests.Session:
+    """
+    创建一个挂载了连接池适配器的 Session。
+
+    参数:
+        pool_size: 每个 host 的最大保持连接数
+
+    返回:
+        requests.Session: 已配置连接池的会话
+    """
+    session = requests.Session()
+    # max_retries=0: 重试逻辑由调用方控制，适配器只负责连接复用
+    # pool_block=False: 并发超过池大小时临时新建连接，而不是阻塞等待
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=pool_size,
+        max_retries=0,
+        pool_block=False,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Connection"] = "keep-alive"
+    return session
+
+
+def get_session(provider: str) -> requests.Session:
+    """
+    获取指定提供商的共享 Session（首次调用时创建）。
+
+    参数:
+        provider: 提供商标识，如 "claude" / "gemini"
+
+    返回:
+        requests.Session: 进程级共享的会话对象
+    """
+    session = _sessions.get(provider)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(provider)
+        if session is None:
+            session = _build_session(HTTP_POOL_SIZE)
+            _sessions[provider] = session
+        return session
+
+
+def http2_available() -> bool:
+    """检查是否可以启用 HTTP/2（配置开启且安装了 h2 包）"""
+    return HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+
+
+def get_async_client(provider: str):
+    """
+    获取当前事件循环中指定提供商的共享 httpx.AsyncClient。
+
+    必须在协程中调用。同一事件循环内的所有异步请求共享连接池，
+    安装了 h2 时同一连接上可以多路复用多个并发请求。
+
+    参数:
+        provider: 提供商标识，如 "claude" / "gemini"
+
+    返回:
+        httpx.AsyncClient: 当前事件循环共享的异步客户端
+    """
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    key = (provider, id(loop))
+    cached = _async_clients.get(key)
+    if cached is not None and cached[0] is loop and not cached[1].is_closed:
+        return cached[1]
+
+    # 清理已关闭事件循环遗留的客户端，避免 id 复用导致误命中
+    for stale_key, (stale_loop, _client) in list(_async_clients.items()):
+        if stale_loop.is_closed():
+            _async_clients.pop(stale_key, None)
+
+    client = httpx.AsyncClient(
+        http2=http2_available(),
+        # 与同步连接池一致：不限制总连接数，只限制保活连接数
+        limits=httpx.Limits(
+            max_connections=None,
+            max_keepalive_connections=HTTP_POOL_SIZE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+    _async_clients[key] = (loop, client)
+    return client
+
+
+def close_sessions():
+    """关闭所有共享 Session，释放连接（主要用于测试和基准脚本）。"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+async def aclose_clients():
+    """关闭当前事件循环中的所有异步客户端（如 FastAPI shutdown 时调用）。"""
+    loop = asyncio.get_running_loop()
+    for key, (client_loop, client) in list(_async_clients.items()):
+        if client_loop is loop:
+            await client.aclose()
+            _async_clients.pop(key, None)
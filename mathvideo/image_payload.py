@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+视觉请求的图片载荷
+
+所有发给视觉模型的图片（critic 关键帧、describe_images 输入图片）都经过这里：
+
+- 在内存中编码为 JPEG / WebP（VISION_IMAGE_FORMAT、VISION_IMAGE_QUALITY），不落盘，
+  data URL 使用真实的 MIME 类型
+- 超过像素预算（VISION_MAX_PIXELS）的图片等比缩小；Claude 按像素计费（约 宽×高/750 token），
+  超过约 1.15MP 的图片服务端也会先缩小，提前缩小只减少请求体积和 token，不损失信息
+- 可把多帧拼成一张联系表（VISION_CONTACT_SHEET）：Gemini 每张图片至少按一个图块计费，
+  4 帧拼成一张后图片 token 约为原来的 1/4，请求中也只有一个图片块
+"""
+import base64
+import io
+import math
+import time
+from typing import List, Optional, Tuple
+
+from mathvideo.config import VISION_IMAGE_FORMAT, VISION_IMAGE_QUALITY, VISION_MAX_PIXELS
+
+# 格式 -> (Pillow 格式名, MIME 类型)
+IMAGE_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+    "png": ("PNG", "image/png"),
+}
+
+
+def load_image(path: str, max_pixels: Optional[int] = None):
+    """
+    读取图片并按 EXIF 方向摆正（手机拍摄的题目照片常带旋转标记）
+
+    JPEG 超过像素预算时用 draft 模式在解码阶段按 1/2、1/4、1/8 缩小（DCT 缩放），
+    不必先解码完整的原图。
+    """
+    from PIL import Image, ImageOps
+
+    max_pixels = VISION_MAX_PIXELS if max_pixels is None else max_pixels
+    with Image.open(path) as image:
+        width, height = image.size
+        if max_pixels and image.format == "JPEG" and width * height > max_pixels:
+            scale = math.sqrt(max_pixels / (width * height))
+            image.draft("RGB", (int(width * scale), int(height * scale)))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+        return image
+
+
+def fit_pixel_budget(image, max_pixels: Optional[int] = None):
+    """像素数超过预算时等比缩小，否则原样返回"""
+    from PIL import Image
+
+    max_pixels = VISION_MAX_PIXELS if max_pixels is None else max_pixels
+    width, height = image.size
+    if not max_pixels or width * height <= max_pixels:
+        return image
+    scale = math.sqrt(max_pixels / (width * height))
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    # reducing_gap 先用整数倍缩小再做 Lanczos，手机照片这类大图快很多
+    return image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+
+def encode_image(image, fmt: Optional[str] = None, quality: Optional[int] = None, max_pixels: Optional[int] = None) -> dict:
+    """
+    在内存中编码图片
+
+    参数:
+        image: PIL Image
+        fmt: jpeg / webp / png，默认 VISION_IMAGE_FORMAT
+        quality: 有损格式的质量（1-100），默认 VISION_IMAGE_QUALITY
+        max_pixels: 像素预算，默认 VISION_MAX_PIXELS（0 表示不限制）
+
+    返回:
+        dict: {"mime", "data"（bytes）, "width", "height"}
+    """
+    fmt = (fmt or VISION_IMAGE_FORMAT).lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"不支持的图片格式: {fmt}（可选 {', '.join(IMAGE_FORMATS)}）")
+    pil_format, mime = IMAGE_FORMATS[fmt]
+    quality = VISION_IMAGE_QUALITY if quality is None else quality
+
+    image = fit_pixel_budget(image, max_pixels)
+    if fmt == "jpeg" and image.mode != "RGB":
+        image = _flatten(image)
+    elif image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+    options = {}
+    if fmt == "jpeg":
+        options = {"quality": quality, "optimize": True}
+    elif fmt == "webp":
+        options = {"quality": quality, "method": 4}
+    elif fmt == "png":
+        options = {"optimize": True}
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, **options)
+    return {"mime": mime, "data": buffer.getvalue(), "width": image.width, "height": image.height}
+
+
+def _flatten(image):
+    """去掉透明通道（铺白底），JPEG 不支持透明"""
+    from PIL import Image
+
+    if "A" in image.getbands() or image.mode == "P":
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, "white")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def contact_sheet(images: list, columns: Optional[int] = None, gap: int = 4, labels: bool = True):
+    """
+    把多帧按时间顺序拼成一张联系表（从左到右、从上到下），每帧左上角标注序号
+
+    参数:
+        images: PIL Image 列表（尺寸不同时按第一帧缩放）
+        columns: 列数，默认取接近正方形的排列
+        gap: 帧间距（像素）
+        labels: 是否标注序号
+    """
+    from PIL import Image, ImageDraw
+
+    if not images:
+        raise ValueError("images 不能为空")
+    columns = columns or math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+    cell_w, cell_h = images[0].size
+    sheet = Image.new(
+        "RGB",
+        (columns * cell_w + (columns - 1) * gap, rows * cell_h + (rows - 1) * gap),
+        "white",
+    )
+    draw = ImageDraw.Draw(sheet)
+    for index, image in enumerate(images):
+        if image.size != (cell_w, cell_h):
+            image = image.resize((cell_w, cell_h), Image.LANCZOS)
+        x = (index % columns) * (cell_w + gap)
+        y = (index // columns) * (cell_h + gap)
+        sheet.paste(_flatten(image) if image.mode != "RGB" else image, (x, y))
+        if labels:
+            text = str(index + 1)
+            box = draw.textbbox((0, 0), text)
+            draw.rectangle((x, y, x + box[2] + 6, y + box[3] + 4), fill="black")
+            draw.text((x + 3, y + 1), text, fill="white")
+    return sheet
+
+
+def image_content(encoded: dict) -> dict:
+    """转为 OpenAI 兼容的 image_url 消息项（data URL 使用真实 MIME 类型）"""
+    b64_data = base64.b64encode(encoded["data"]).decode("utf-8")
+    return {"type": "image_url", "image_url": {"url": f"data:{encoded['mime']};base64,{b64_data}"}}
+
+
+def estimate_image_tokens(width: int, height: int) -> Tuple[int, int]:
+    """
+    粗略估算单张图片的 token 数
+
+    返回:
+        tuple: (Claude 估算值 ≈ 宽×高/750, Gemini 估算值 = 258 × 768px 图块数；两边都不超过 384px 时为 258)
+    """
+    claude = math.ceil(width * height / 750)
+    if width <= 384 and height <= 384:
+        gemini = 258
+    else:
+        gemini = 258 * math.ceil(width / 768) * math.ceil(height / 768)
+    return claude, gemini
+
+
+def build_image_contents(
+    images: list,
+    tile: bool = False,
+    fmt: Optional[str] = None,
+    quality: Optional[int] = None,
+    max_pixels: Optional[int] = None,
+    source_bytes: Optional[int] = None,
+    label: str = "视觉",
+) -> Tuple[List[dict], dict]:
+    """
+    把图片编码为视觉请求的消息项，并打印载荷大小和编码耗时
+
+    参数:
+        images: PIL Image 列表
+        tile: 是否拼成一张联系表
+        fmt / quality / max_pixels: 见 encode_image
+        source_bytes: 原始图片的总字节数（用于对比，可选）
+        label: 日志前缀
+
+    返回:
+        tuple: (messages_content 图片项列表, 统计信息 dict)
+    """
+    started = time.perf_counter()
+    frames = len(images)
+    if tile and len(images) > 1:
+        images = [contact_sheet(images)]
+    encoded = [encode_image(image, fmt=fmt, quality=quality, max_pixels=max_pixels) for image in images]
+    contents = [image_content(item) for item in encoded]
+    encode_ms = (time.perf_counter() - started) * 1000
+
+    tokens = [estimate_image_tokens(item["width"], item["height"]) for item in encoded]
+    stats = {
+        "frames": frames,
+        "images": len(encoded),
+        "mime": encoded[0]["mime"] if encoded else None,
+        "bytes": sum(len(item["data"]) for item in encoded),
+        "payload_bytes": sum(len(c["image_url"]["url"]) for c in contents),
+        "pixels": sum(item["width"] * item["height"] for item in encoded),
+        "claude_tokens": sum(t[0] for t in tokens),
+        "gemini_tokens": sum(t[1] for t in tokens),
+        "encode_ms": round(encode_ms, 1),
+        "source_bytes": source_bytes,
+    }
+    if encoded:
+        sizes = ", ".join(f"{item['width']}x{item['height']}" for item in encoded)
+        source = f"，原始 {source_bytes / 1024:.1f}KB" if source_bytes else ""
+        tiled = f"（{frames} 帧拼图）" if tile and frames > 1 else ""
+        print(
+            f"   🖼️ {label}图片: {len(encoded)} 张 {encoded[0]['mime']}{tiled} {sizes}，"
+            f"{stats['bytes'] / 1024:.1f}KB{source}，"
+            f"≈{stats['claude_tokens']} token（Claude）/ ≈{stats['gemini_tokens']} token（Gemini），"
+            f"编码 {encode_ms:.1f}ms"
+        )
+    return contents, stats
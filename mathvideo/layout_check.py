@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+本地布局检查（不调用视觉模型）
+
+CRITIC_PROMPT 检查的大部分问题是几何问题：文字重叠、内容越过讲义栏分隔线（divider_x）、
+内容超出网格区域。TeachingScene 知道这些边界（grid_x_min / grid_x_max / grid_y_min / grid_y_max），
+因此可以在渲染时直接检查，无需看图：
+
+- 渲染时设置环境变量 MATHVIDEO_LAYOUT_REPORT=<报告路径>，TeachingScene 在每次 play / wait 后
+  记录场景中每个对象（以及对象内每段文字）的包围盒，渲染结束时写出 JSON 布局报告
+- 所有步骤的包围盒拼成一个数组，越界用向量比较、各步文字两两交叠用 numpy 广播一次算完
+- 同一问题在多步中出现时只记一次（记录首次出现的步骤、持续步数和最大程度）
+- 报告中记录脚本的 sha256，脚本被修改后旧报告自动失效
+
+VisualCritic 先读取报告：没有问题时跳过远程视觉评估；有问题时把具体问题
+（哪个对象、第几步、越界多少）交给 refine_code。
+
+本模块只依赖 numpy，渲染工作进程和 CLI 都可以导入。
+"""
+import hashlib
+import json
+import os
+from typing import Optional
+
+import numpy as np
+
+# 渲染时通过该环境变量告诉 TeachingScene 报告写到哪里（未设置时不做任何记录）
+LAYOUT_REPORT_ENV = "MATHVIDEO_LAYOUT_REPORT"
+
+REPORT_VERSION = 1
+
+# 两段文字的交叠面积超过较小一段面积的这个比例才算重叠（忽略字形包围盒的轻微接触）
+OVERLAP_RATIO = 0.15
+
+# 越界容差（场景单位），忽略描边宽度和贝塞尔控制点带来的微小超出
+TOLERANCE = 0.05
+
+# 交给 refine_code 的问题条数上限（按严重程度排序）
+MAX_FINDINGS_IN_SUGGESTION = 8
+
+
+def layout_report_path(video_path: str) -> str:
+    """布局报告与视频放在一起: <视频名>.layout.json"""
+    return os.path.splitext(video_path)[0] + ".layout.json"
+
+
+def script_sha256(script_path: str) -> Optional[str]:
+    """脚本内容的 sha256（读取失败时返回 None）"""
+    try:
+        with open(script_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def overlap_ratios(boxes: np.ndarray) -> np.ndarray:
+    """
+    两两计算包围盒交叠面积占较小包围盒面积的比例（向量化，可带批次维度）
+
+    参数:
+        boxes: (..., N, 4) 数组，每行为 [x_min, y_min, x_max, y_max]；面积为 0 的行（填充）比例为 0
+
+    返回:
+        np.ndarray: (..., N, N) 比例矩阵
+    """
+    lower = np.maximum(boxes[..., :, None, :2], boxes[..., None, :, :2])
+    upper = np.minimum(boxes[..., :, None, 2:], boxes[..., None, :, 2:])
+    intersection = np.prod(np.clip(upper - lower, 0, None), axis=-1)
+    areas = np.prod(boxes[..., 2:] - boxes[..., :2], axis=-1)
+    smaller = np.minimum(areas[..., :, None], areas[..., None, :])
+    return np.divide(intersection, smaller, out=np.zeros_like(intersection), where=smaller > 0)
+
+
+def bounds_violations(boxes: np.ndarray, bounds: dict, tolerance: float = TOLERANCE) -> dict:
+    """
+    计算每个包围盒越过讲义栏分隔线和超出网格上/下/右边界的距离（向量化，未越界为 0）
+
+    参数:
+        boxes: (N, 4) 数组
+        bounds: {"divider_x", "grid_x_max", "grid_y_min", "grid_y_max"}
+
+    返回:
+        dict: {"lecture_column": (N,), "right": (N,), "top": (N,), "bottom": (N,)}
+    """
+    distances = {
+        "lecture_column": bounds["divider_x"] - boxes[:, 0],
+        "right": boxes[:, 2] - bounds["grid_x_max"],
+        "top": boxes[:, 3] - bounds["grid_y_max"],
+        "bottom": bounds["grid_y_min"] - boxes[:, 1],
+    }
+    return {side: np.where(d > tolerance, d, 0.0) for side, d in distances.items()}
+
+
+def _merge_finding(findings: dict, key: tuple, step: int, amount: float, make):
+    """同一问题只记录一次：保留首次出现的步骤，累计步数，取最大程度"""
+    finding = findings.get(key)
+    if finding is None:
+        finding = findings[key] = make()
+        finding.update({"first_step": step, "steps": 0, "amount": 0.0})
+    finding["steps"] += 1
+    finding["amount"] = round(max(finding["amount"], amount), 3)
+
+
+def _text_overlaps(boxes: np.ndarray, text_rows: list, min_ratio: float = OVERLAP_RATIO):
+    """
+    找出每一步内文字两两交叠的行号对
+
+    各步的文字补齐到相同个数后一次广播计算（(步数, K, K)），步数较多时分块以限制内存
+
+    参数:
+        boxes: 所有步骤所有对象的 (M, 4) 包围盒
+        text_rows: 每一步中文字对象在 boxes 中的行号列表
+
+    返回:
+        list: [(步骤序号, 行号 a, 行号 b, ratio), ...]
+    """
+    width = max((len(rows) for rows in text_rows), default=0)
+    if width < 2:
+        return []
+    index = np.full((len(text_rows), width), -1)
+    for step, rows in enumerate(text_rows):
+        index[step, :len(rows)] = rows
+    # 填充位置的包围盒全为 0（面积为 0，比例为 0）
+    padded = np.where((index >= 0)[..., None], boxes[index], 0.0)
+    upper_pairs = np.triu(np.ones((width, width), dtype=bool), k=1)
+    chunk = max(1, 2_000_000 // (width * width))
+    pairs = []
+    for first in range(0, len(text_rows), chunk):
+        ratio = overlap_ratios(padded[first:first + chunk])
+        for step, a, b in zip(*np.nonzero((ratio >= min_ratio) & upper_pairs)):
+            pairs.append((first + int(step), int(index[first + step, a]), int(index[first + step, b]),
+                          float(ratio[step, a, b])))
+    return pairs
+
+
+def analyze_steps(steps: list, bounds: dict) -> list:
+    """
+    根据每一步记录的包围盒找出重叠和越界问题
+
+    所有步骤的包围盒拼成一个数组后一次完成越界比较和文字两两求交，
+    只有发现问题的对象才回到 Python 中合并
+
+    参数:
+        steps: [{"index", "kind", "objects": [{"id", "label", "text", "parent", "box"}]}]
+            parent 为 None 的是场景中的顶层对象（检查越界），text 为 True 的是文字（检查重叠）
+        bounds: 见 bounds_violations
+
+    返回:
+        list: 问题列表，按严重程度（持续步数 × 程度）降序
+    """
+    objects = [obj for step in steps for obj in step["objects"]]
+    if not objects:
+        return []
+    boxes = np.array([obj["box"] for obj in objects], dtype=float).reshape(-1, 4)
+    step_of = np.repeat(np.arange(len(steps)), [len(step["objects"]) for step in steps])
+    top_level = np.array([obj.get("parent") is None for obj in objects])
+
+    findings = {}
+    violations = bounds_violations(boxes, bounds)
+    column = violations.pop("lecture_column")
+    for row in np.nonzero(top_level & (column > 0))[0]:
+        obj = objects[row]
+        _merge_finding(
+            findings, ("lecture_column", obj["id"]), steps[step_of[row]]["index"], float(column[row]),
+            lambda obj=obj: {"kind": "lecture_column", "objects": [obj["label"]], "box": obj["box"]},
+        )
+    sides = np.stack(list(violations.values()), axis=1)
+    for row in np.nonzero(top_level & (sides.max(axis=1) > 0))[0]:
+        obj = objects[row]
+        exceeded = [side for side, d in zip(violations, sides[row]) if d > 0]
+        _merge_finding(
+            findings, ("out_of_bounds", obj["id"]), steps[step_of[row]]["index"], float(sides[row].max()),
+            lambda obj=obj, exceeded=exceeded: {
+                "kind": "out_of_bounds", "objects": [obj["label"]], "sides": exceeded, "box": obj["box"],
+            },
+        )
+
+    text_rows = [[] for _ in steps]
+    for row, obj in enumerate(objects):
+        if obj.get("text"):
+            text_rows[step_of[row]].append(row)
+    for step, a, b, ratio in _text_overlaps(boxes, text_rows):
+        first, second = objects[a], objects[b]
+        _merge_finding(
+            findings, ("overlap", first["id"], second["id"]), steps[step]["index"], ratio,
+            lambda first=first, second=second: {
+                "kind": "overlap", "objects": [first["label"], second["label"]],
+                "box": first["box"], "other_box": second["box"],
+            },
+        )
+    return sorted(findings.values(), key=lambda f: (-f["steps"] * f["amount"], f["first_step"]))
+
+
+def build_report(scene_name: str, script_path: Optional[str], bounds: dict, steps: list) -> dict:
+    """生成布局报告（TeachingScene 在渲染结束时调用）"""
+    findings = analyze_steps(steps, bounds)
+    return {
+        "version": REPORT_VERSION,
+        "scene": scene_name,
+        "script_sha256": script_sha256(script_path) if script_path else None,
+        "bounds": {k: round(float(v), 4) for k, v in bounds.items()},
+        "clean": not findings,
+        "findings": findings,
+        "steps": steps,
+    }
+
+
+def write_report(path: str, report: dict):
+    """原子写入报告（先写临时文件再替换）"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_layout_report(video_path: str, script_path: Optional[str] = None) -> Optional[dict]:
+    """
+    读取视频对应的布局报告
+
+    参数:
+        video_path: 渲染出的视频路径
+        script_path: 章节脚本路径；提供时校验报告是否由当前脚本生成
+
+    返回:
+        dict: 报告；不存在、版本不符或脚本已修改时返回 None
+    """
+    path = layout_report_path(video_path)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if report.get("version") != REPORT_VERSION:
+        return None
+    if script_path and report.get("script_sha256") != script_sha256(script_path):
+        return None
+    return report
+
+
+def format_findings(report: dict, limit: int = MAX_FINDINGS_IN_SUGGESTION) -> str:
+    """把报告中的问题整理成交给 refine_code 的修改建议"""
+    bounds = report["bounds"]
+    lines = [
+        "本地布局检查发现以下问题（坐标为场景单位；网格区域 "
+        f"x∈[{bounds['grid_x_min']:.2f}, {bounds['grid_x_max']:.2f}]，"
+        f"y∈[{bounds['grid_y_min']:.2f}, {bounds['grid_y_max']:.2f}]；"
+        f"讲义栏分隔线 x={bounds['divider_x']:.2f}）:"
+    ]
+    side_names = {"right": "右", "top": "上", "bottom": "下"}
+    findings = report.get("findings", [])
+    for number, finding in enumerate(findings[:limit], 1):
+        when = f"第 {finding['first_step'] + 1} 步起，持续 {finding['steps']} 步"
+        if finding["kind"] == "overlap":
+            text = (f"文字重叠: {finding['objects'][0]} 与 {finding['objects'][1]} "
+                    f"交叠 {finding['amount']:.0%}（{when}）")
+        elif finding["kind"] == "lecture_column":
+            text = (f"越过讲义栏: {finding['objects'][0]} 左边界 x={finding['box'][0]:.2f}，"
+                    f"越过分隔线 {finding['amount']:.2f}（{when}）")
+        else:
+            sides = "、".join(side_names[s] for s in finding["sides"])
+            text = f"超出网格: {finding['objects'][0]} 超出{sides}边界 {finding['amount']:.2f}（{when}）"
+        lines.append(f"{number}. {text}")
+    if len(findings) > limit:
+        lines.append(f"……另有 {len(findings) - limit} 个问题")
+    lines.append(
+        "请调整这些对象的位置或大小（例如使用 place_in_area / fit_to_screen 并缩小字号），"
+        "使内容位于网格区域内、不进入左侧讲义栏，且文字互不重叠。"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 响应缓存
+
+以请求内容的哈希（model、temperature、max_tokens、system、messages、stop）
+为键，把 Anthropic 响应保存到磁盘。同一主题重跑或重新生成时，完全相同的
+Router/Planner/Coder 调用直接命中缓存，不再重复付费。
+
+缓存模式（LLM_CACHE_MODE）:
+    off     不使用缓存（默认）
+    on      读写缓存：命中直接返回，未命中调用 API 后写入
+    record  只写不读：总是调用 API 并覆盖缓存，用于录制一次完整运行
+    replay  严格回放：只读缓存，任何未命中都抛出 LLMCacheMiss，
+            便于离线复现整条 Pipeline 做基准测试和调试
+
+目录结构:
+    <LLM_CACHE_DIR>/<key[:2]>/<key>.json
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from mathvideo.config import (
+    LLM_CACHE_MODE,
+    LLM_CACHE_DIR,
+    LLM_CACHE_MAX_MB,
+    LLM_CACHE_TTL_HOURS,
+)
+
+VALID_CACHE_MODES = {"off", "on", "record", "replay"}
+
+
+class LLMCacheMiss(RuntimeError):
+    """replay 模式下请求未命中缓存"""
+
+
+class LLMCache:
+    """
+    基于文件的内容寻址缓存，按最近访问时间做 LRU 淘汰
+
+    参数:
+        cache_dir: 缓存根目录
+        mode: 缓存模式（on / record / replay）
+        max_bytes: 缓存总大小上限，超出后淘汰最久未访问的条目
+        ttl_seconds: 条目有效期（秒），0 表示永不过期
+    """
+
+    def __init__(self, cache_dir: str, mode: str = "on", max_bytes: int = 512 * 1024 * 1024, ttl_seconds: float = 0):
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # 缓存目录当前总大小（首次写入时扫描得到）
+        self._total_bytes: Optional[int] = None
+
+    @property
+    def readable(self) -> bool:
+        return self.mode in ("on", "replay")
+
+    @property
+    def writable(self) -> bool:
+        return self.mode in ("on", "record")
+
+    @staticmethod
+    def make_key(request: dict) -> str:
+        """
+        计算请求的缓存键
+
+        只取影响输出的字段，并按键排序序列化，保证相同请求得到相同哈希。
+        流式请求单独成键：调用方可能在代码块闭合后提前停止读取，缓存的是截断的输出，
+        不能作为同一请求的完整响应返回给非流式调用。
+        """
+        basis = {
+            "model": request.get("model"),
+            "temperature": request.get("temperature"),
+            "max_tokens": request.get("max_tokens"),
+            "system": request.get("system"),
+            "messages": request.get("messages"),
+            "stop_sequences": request.get("stop_sequences"),
+        }
+        if request.get("stream"):
+            basis["stream"] = True
+        raw = json.dumps(basis, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        读取缓存的响应；未命中或已过期返回 None（replay 模式下抛出 LLMCacheMiss）
+        """
+        if not self.readable:
+            return None
+        path = self._path(key)
+        entry = None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+        # replay 模式要求可复现，不做过期判断
+        if entry is not None and self.mode != "replay" and self.ttl_seconds and time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if entry is None:
+            if self.mode == "replay":
+                raise LLMCacheMiss(f"LLM 缓存未命中（replay 模式）: {key}")
+            return None
+
+        # 更新访问时间，作为 LRU 淘汰依据
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry.get("response")
+
+    def put(self, key: str, response: dict):
+        """写入一条响应，并在超出容量时淘汰最久未访问的条目"""
+        if not self.writable:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = json.dumps(
+            {"created_at": time.time(), "response": response},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        # 先写临时文件再原子替换，避免并发读到半截内容
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.writes += 1
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += len(payload) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _iter_entries(self):
+        for root, _dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def _scan_size(self) -> int:
+        return sum(size for _path, size, _mtime in self._iter_entries())
+
+    def _evict(self):
+        """按访问时间从旧到新删除条目，直到总大小降到上限的 90% 以下"""
+        entries = sorted(self._iter_entries(), key=lambda e: e[2])
+        total = sum(size for _path, size, _mtime in entries)
+        target = int(self.max_bytes * 0.9)
+        for path, size, _mtime in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.evictions += 1
+            except OSError:
+                continue
+        self._total_bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """
+    获取进程级共享的 LLM 缓存实例；LLM_CACHE_MODE=off 时返回 None
+    """
+    global _cache
+    mode = LLM_CACHE_MODE
+    if mode not in VALID_CACHE_MODES:
+        print(f"⚠️ 未知的 LLM_CACHE_MODE '{mode}'，已禁用 LLM 缓存")
+        return None
+    if mode == "off":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(
+                cache_dir=LLM_CACHE_DIR,
+                mode=mode,
+                max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024),
+                ttl_seconds=LLM_CACHE_TTL_HOURS * 3600,
+            )
+        return _cache
@@ -1,14 +1,18 @@
 # 直接使用 requests 调用 Anthropic API
 # 绕过 SDK 的 API 版本问题
+import json
+import threading
 import time
-import requests
-from requests.exceptions import ConnectionError, Timeout
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.messages import BaseMessage, AIMessage, HumanMessage
-from langchain_core.outputs import ChatResult, ChatGeneration
-from typing import List, Optional, Any
+from langchain_core.messages import BaseMessage, AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatResult, ChatGeneration, ChatGenerationChunk
+from typing import AsyncIterator, Iterator, List, Optional, Any
 # 从配置模块导入 Claude API 的配置信息
-from mathvideo.config import CLAUDE_API_KEY, CLAUDE_MODEL_NAME
+from mathvideo.config import CLAUDE_API_KEY, CLAUDE_BASE_URL, CLAUDE_MODEL_NAME, PROMPT_CACHE_ENABLED, get_stage_model
+from mathvideo.rate_limiter import get_rate_limiter
+from mathvideo.retry import post_with_retry, apost_with_retry
+from mathvideo.llm_cache import get_llm_cache
+from mathvideo.metrics import record_call
 
 
 class ClaudeDirectChat(BaseChatModel):
@@ -21,8 +25,12 @@ class ClaudeDirectChat(BaseChatModel):
     temperature: float = 0.7
     max_tokens: int = 16384
     api_key: str = CLAUDE_API_KEY
-    api_url: str = "https://api.anthropic.com/v1/messages"
+    api_url: str = f"{CLAUDE_BASE_URL}/messages"
     api_version: str = "2023-06-01"
+    # 响应缓存（LLMCache），为 None 时不使用缓存
+    cache: Optional[Any] = None
+    # 调用阶段（router / planner / coder ...），用于日志和统计
+    stage: Optional[str] = None
     
     def __init__(self, temperature: float = 0.7, max_tokens: int = 16384, **kwargs):
         super().__init__(**kwargs)
@@ -33,13 +41,8 @@ class ClaudeDirectChat(BaseChatModel):
     def _llm_type(self) -> str:
         return "claude-direct"
     
-    def _generate(
-        self,
-        messages: List[BaseMessage],
-        stop: Optional[List[str]] = None,
-        **kwargs
-    ) -> ChatResult:
-        """调用 Claude API 生成回复"""
+    def _build_request(self, messages: List[BaseMessage], stop: Optional[List[str]] = None):
+        """将 LangChain 消息转换为 Anthropic 请求头和请求体"""
         # 将 LangChain 消息转换为 Anthropic 格式
         anthropic_messages = []
         system_message = None
@@ -68,50 +71,396 @@ class ClaudeDirectChat(BaseChatModel):
         }
         
         if system_message:
-            data["system"] = system_message
+            if PROMPT_CACHE_ENABLED:
+                # 静态 system 前缀（CODER/PLANNER 指令 + Skill）标记为可缓存，
+                # 后续章节/项目复用同一前缀时按缓存读取计费，首 token 延迟也更低
+                data["system"] = [{
+                    "type": "text",
+                    "text": system_message,
+                    "cache_control": {"type": "ephemeral"},
+                }]
+            else:
+                data["system"] = system_message
         
         if stop:
             data["stop_sequences"] = stop
         
-        # 发送请求（带重试机制，防止 SSL 瞬断导致整个 section 失败）
-        max_retries = 3
-        for attempt in range(max_retries + 1):
-            try:
-                response = requests.post(
-                    self.api_url,
-                    headers=headers,
-                    json=data,
-                    timeout=180
-                )
-                break  # 请求成功，跳出重试循环
-            except (ConnectionError, Timeout, requests.exceptions.SSLError) as e:
-                if attempt < max_retries:
-                    wait_time = 2 ** attempt  # 指数退避: 1s, 2s, 4s
-                    print(f"⚠️ API 请求失败 (第 {attempt + 1} 次)，{wait_time}s 后重试: {type(e).__name__}")
-                    time.sleep(wait_time)
-                else:
-                    raise Exception(
-                        f"API 请求在 {max_retries + 1} 次尝试后仍然失败: {type(e).__name__}: {e}"
-                    )
-        
-        if response.status_code != 200:
-            raise Exception(f"API Error {response.status_code}: {response.text}")
-        
-        result = response.json()
-        
-        # 提取文本内容
+        return headers, data
+
+    def _cache_lookup(self, data: dict, stream: bool = False):
+        """
+        查询响应缓存，返回 (cache_key, cached_response)
+
+        stream=True 时使用流式请求的缓存键（流式结果可能在代码块闭合后被截断，与完整响应分开缓存）。
+        未启用缓存时返回 (None, None)；replay 模式下未命中会抛出 LLMCacheMiss。
+        """
+        if self.cache is None:
+            return None, None
+        key = self.cache.make_key(dict(data, stream=True) if stream else data)
+        return key, self.cache.get(key)
+
+    def _cache_stream_result(self, key: Optional[str], pieces: List[str], stop_reason: str,
+                             usage: Optional[dict] = None):
+        """把流式输出拼接为普通响应格式写入缓存"""
+        if key is None or not pieces:
+            return
+        self.cache.put(key, {
+            "content": [{"type": "text", "text": "".join(pieces)}],
+            "stop_reason": stop_reason,
+            "usage": usage or {},
+        })
+
+    @staticmethod
+    def _parse_response(result: dict) -> ChatResult:
+        """从 Anthropic 响应中提取文本内容，转换为 LangChain 格式"""
         content = ""
         for block in result.get("content", []):
             if block.get("type") == "text":
                 content += block.get("text", "")
         
-        # 返回 LangChain 格式
+        usage = result.get("usage") or {}
         return ChatResult(
-            generations=[ChatGeneration(message=AIMessage(content=content))]
+            generations=[ChatGeneration(message=AIMessage(
+                content=content,
+                response_metadata={"usage": usage, "stop_reason": result.get("stop_reason")},
+            ))],
+            llm_output={"usage": usage},
+        )
+
+    def _send(self, headers: dict, data: dict, stream: bool = False):
+        """
+        发送请求并返回状态码为 200 的响应
+
+        网络错误、429 / 529 / 5xx 由 post_with_retry 按退避策略重试，
+        并经过进程内共享的限流器。
+
+        参数:
+            headers: 请求头
+            data: 请求体
+            stream: 是否以流式方式读取响应体（SSE）
+        """
+        response = post_with_retry(
+            "claude",
+            self.api_url,
+            json_body=data,
+            headers=headers,
+            timeout=180,
+            stream=stream,
+        )
+        
+        if response.status_code != 200:
+            try:
+                raise Exception(f"API Error {response.status_code}: {response.text}")
+            finally:
+                response.close()
+        
+        return response
+
+    async def _asend(self, headers: dict, data: dict, stream: bool = False):
+        """
+        _send 的异步版本，使用 httpx.AsyncClient 原生异步传输
+        """
+        response = await apost_with_retry(
+            "claude",
+            self.api_url,
+            json_body=data,
+            headers=headers,
+            timeout=180,
+            stream=stream,
         )
+        
+        if response.status_code != 200:
+            try:
+                await response.aread()
+                raise Exception(f"API Error {response.status_code}: {response.text}")
+            finally:
+                await response.aclose()
+        
+        return response
+
+    def _record_call(self, started: float, usage: Optional[dict] = None, retries: int = 0,
+                     error: Optional[Exception] = None, cache_hit: bool = False):
+        """记录一次调用的用量和耗时（进程累计 + 项目 metrics.jsonl）"""
+        if error is None and not cache_hit:
+            record_usage(usage)
+        record_call(
+            self.stage,
+            "claude",
+            self.model,
+            started,
+            usage=usage,
+            retries=retries,
+            ok=error is None,
+            error=str(error) if error is not None else None,
+            cache_hit=cache_hit,
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        **kwargs
+    ) -> ChatResult:
+        """调用 Claude API 生成回复"""
+        headers, data = self._build_request(messages, stop)
+        started = time.perf_counter()
+        cache_key, cached = self._cache_lookup(data)
+        if cached is not None:
+            self._record_call(started, cached.get("usage"), cache_hit=True)
+            return self._parse_response(cached)
+        try:
+            response = self._send(headers, data)
+            result = response.json()
+        except Exception as e:
+            self._record_call(started, error=e)
+            raise
+        self._record_call(started, result.get("usage"), retries=getattr(response, "retries", 0))
+        if cache_key is not None:
+            self.cache.put(cache_key, result)
+        return self._parse_response(result)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        **kwargs
+    ) -> ChatResult:
+        """
+        异步调用 Claude API 生成回复
+
+        使用 httpx.AsyncClient 原生异步传输，不占用线程池，
+        FastAPI 路由中 await 时不会阻塞事件循环。
+        """
+        headers, data = self._build_request(messages, stop)
+        started = time.perf_counter()
+        cache_key, cached = self._cache_lookup(data)
+        if cached is not None:
+            self._record_call(started, cached.get("usage"), cache_hit=True)
+            return self._parse_response(cached)
+        try:
+            response = await self._asend(headers, data)
+            result = response.json()
+        except Exception as e:
+            self._record_call(started, error=e)
+            raise
+        self._record_call(started, result.get("usage"), retries=getattr(response, "retries", 0))
+        if cache_key is not None:
+            self.cache.put(cache_key, result)
+        return self._parse_response(result)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs
+    ) -> Iterator[ChatGenerationChunk]:
+        """
+        流式调用 Claude API（SSE），逐块产出文本增量
+
+        调用方提前停止迭代（如检测到代码块已闭合）时，生成器关闭会同时关闭
+        HTTP 响应，服务端随即停止生成，不再为剩余 token 付费。
+        """
+        headers, data = self._build_request(messages, stop)
+        started = time.perf_counter()
+        cache_key, cached = self._cache_lookup(data, stream=True)
+        if cached is not None:
+            # 缓存命中：整段内容作为一个增量返回
+            self._record_call(started, cached.get("usage"), cache_hit=True)
+            text = self._parse_response(cached).generations[0].message.content
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+            return
+
+        data["stream"] = True
+        try:
+            response = self._send(headers, data, stream=True)
+        except Exception as e:
+            self._record_call(started, error=e)
+            raise
+        retries = getattr(response, "retries", 0)
+        # SSE 规定使用 UTF-8，避免 requests 按 ISO-8859-1 解码中文
+        response.encoding = "utf-8"
+        parser = SSEParser()
+        pieces: List[str] = []
+        usage: dict = {}
+        try:
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    event = parser.feed(line)
+                    _event_usage(event, usage)
+                    text = _event_text(event)
+                    if text:
+                        pieces.append(text)
+                        chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+                        if run_manager:
+                            run_manager.on_llm_new_token(text, chunk=chunk)
+                        yield chunk
+        except GeneratorExit:
+            # 调用方提前终止（代码块已闭合），已收到的内容就是调用方需要的全部输出
+            self._record_call(started, usage, retries=retries)
+            self._cache_stream_result(cache_key, pieces, "client_closed", usage)
+            raise
+        except Exception as e:
+            self._record_call(started, usage, retries=retries, error=e)
+            raise
+        self._record_call(started, usage, retries=retries)
+        self._cache_stream_result(cache_key, pieces, "end_turn", usage)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """
+        _stream 的异步版本
+        """
+        headers, data = self._build_request(messages, stop)
+        started = time.perf_counter()
+        cache_key, cached = self._cache_lookup(data, stream=True)
+        if cached is not None:
+            self._record_call(started, cached.get("usage"), cache_hit=True)
+            text = self._parse_response(cached).generations[0].message.content
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+            return
+
+        data["stream"] = True
+        try:
+            response = await self._asend(headers, data, stream=True)
+        except Exception as e:
+            self._record_call(started, error=e)
+            raise
+        retries = getattr(response, "retries", 0)
+        parser = SSEParser()
+        pieces: List[str] = []
+        usage: dict = {}
+        try:
+            async for line in response.aiter_lines():
+                event = parser.feed(line)
+                _event_usage(event, usage)
+                text = _event_text(event)
+                if text:
+                    pieces.append(text)
+                    chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+                    if run_manager:
+                        await run_manager.on_llm_new_token(text, chunk=chunk)
+                    yield chunk
+        except GeneratorExit:
+            self._record_call(started, usage, retries=retries)
+            self._cache_stream_result(cache_key, pieces, "client_closed", usage)
+            raise
+        except Exception as e:
+            self._record_call(started, usage, retries=retries, error=e)
+            raise
+        finally:
+            await response.aclose()
+        self._record_call(started, usage, retries=retries)
+        self._cache_stream_result(cache_key, pieces, "end_turn", usage)
+
+
+class SSEParser:
+    """
+    Server-Sent Events 增量解析器
+
+    逐行输入 SSE 文本，遇到空行（事件结束）时返回该事件 data 字段
+    反序列化后的 JSON 对象；其它情况返回 None。
+    """
+
+    def __init__(self):
+        self._data_lines: List[str] = []
 
+    def feed(self, line) -> Optional[dict]:
+        if line is None:
+            return None
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        line = line.rstrip("\r")
 
-def get_llm(temperature=0.7, max_tokens=16384):
+        # 空行表示一个事件结束
+        if not line:
+            if not self._data_lines:
+                return None
+            payload = "\n".join(self._data_lines)
+            self._data_lines = []
+            try:
+                return json.loads(payload)
+            except ValueError:
+                return None
+
+        # 以冒号开头的是注释（心跳），event: 行的类型信息在 data 中也有，忽略即可
+        if line.startswith("data:"):
+            self._data_lines.append(line[5:].lstrip())
+        return None
+
+
+def _event_text(event: Optional[dict]) -> str:
+    """从 Anthropic 流式事件中提取文本增量；遇到 error 事件时抛出异常"""
+    if not event:
+        return ""
+    event_type = event.get("type")
+    if event_type == "error":
+        error = event.get("error", {})
+        raise Exception(f"API Stream Error: {error.get('type')}: {error.get('message')}")
+    if event_type == "content_block_delta":
+        delta = event.get("delta", {})
+        if delta.get("type") == "text_delta":
+            return delta.get("text", "")
+    return ""
+
+
+def _event_usage(event: Optional[dict], usage: dict):
+    """
+    从流式事件中收集 token 用量
+
+    message_start 携带输入侧用量（含缓存读写），message_delta 携带累计输出 token 数。
+    """
+    if not event:
+        return
+    event_type = event.get("type")
+    if event_type == "message_start":
+        usage.update(event.get("message", {}).get("usage") or {})
+    elif event_type == "message_delta":
+        usage.update(event.get("usage") or {})
+
+
+# 进程级 token 用量统计（只统计真实 API 调用，LLM 缓存命中不计入）
+_USAGE_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+)
+_usage_totals = {field: 0 for field in _USAGE_FIELDS}
+_usage_totals["requests"] = 0
+_usage_lock = threading.Lock()
+
+
+def record_usage(usage: Optional[dict]):
+    """累加一次 API 调用的 token 用量"""
+    if not usage:
+        return
+    with _usage_lock:
+        _usage_totals["requests"] += 1
+        for field in _USAGE_FIELDS:
+            _usage_totals[field] += int(usage.get(field) or 0)
+    # 请求前只按输入估算了 TPM 额度，这里补记输出 token
+    get_rate_limiter("claude").consume(int(usage.get("output_tokens") or 0))
+
+
+def get_usage_totals() -> dict:
+    """
+    返回当前进程累计的 token 用量
+
+    返回:
+        dict: requests、input_tokens、output_tokens、
+              cache_creation_input_tokens（缓存写入）、cache_read_input_tokens（缓存读取）
+    """
+    with _usage_lock:
+        return dict(_usage_totals)
+
+
+def get_llm(temperature=0.7, max_tokens=16384, stage=None):
     """
     创建并返回一个配置好的 Claude 聊天模型实例
     
@@ -132,6 +481,10 @@ def get_llm(temperature=0.7, max_tokens=16384):
             - 中等值 (8192): 适合一般内容生成
             - 较大值 (16384): 适合长代码生成、详细 storyboard
             - 默认值: 16384（充分利用模型能力）
+        stage (str, 可选): 调用阶段，按 config.STAGE_MODELS 选择模型
+            - router / assets / json_repair 默认使用快速模型
+            - planner / coder / fixer / refiner 默认使用主模型
+            - 不指定时使用 CLAUDE_MODEL_NAME
     
     返回:
         ClaudeDirectChat: 配置好的聊天模型实例，可用于调用Claude API
@@ -148,12 +501,31 @@ def get_llm(temperature=0.7, max_tokens=16384):
         
         # 创建小输出LLM（适合分类任务）
         llm = get_llm(temperature=0.1, max_tokens=1024)
+        
+        # 按阶段选择模型（分类任务使用快速模型）
+        llm = get_llm(temperature=0.1, max_tokens=1024, stage="router")
     
     注意事项:
         - 需要确保CLAUDE_API_KEY和CLAUDE_MODEL_NAME在config.py中正确配置
         - max_tokens 越大，API 调用费用越高（按输出 token 计费）
         - 如果遇到API调用失败，请检查网络连接和API密钥是否有效
+        - 设置 LLM_CACHE_MODE=on 可复用相同请求的响应；replay 模式下未命中缓存会抛出 LLMCacheMiss
     """
-    if not CLAUDE_API_KEY:
+    cache = get_llm_cache()
+    # replay 模式完全离线运行，不需要 API Key
+    if not CLAUDE_API_KEY and not (cache and cache.mode == "replay"):
         raise RuntimeError("CLAUDE_API_KEY 未设置，请在 .env 中配置后再运行。")
-    return ClaudeDirectChat(temperature=temperature, max_tokens=max_tokens)
+    model = CLAUDE_MODEL_NAME
+    if stage:
+        provider, model = get_stage_model(stage)
+        if provider != "claude":
+            # 文本阶段只有 Claude 客户端，改用同档位的 Claude 模型
+            provider, model = get_stage_model(stage, provider="claude")
+            print(f"⚠️ 阶段 {stage} 暂不支持非 Claude 提供商，改用 {model}")
+    return ClaudeDirectChat(
+        temperature=temperature,
+        max_tokens=max_tokens,
+        model=model,
+        stage=stage,
+        cache=cache,
+    )
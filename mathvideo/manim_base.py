@@ -4,6 +4,10 @@ from manim import *
 import shutil
 # 导入subprocess模块，用于执行系统命令（检查LaTeX是否可用）
 import subprocess
+# 导入os模块，用于读取布局检查的环境变量
+import os
+# 布局检查报告路径的环境变量名（渲染时由 render_pool 设置）
+from mathvideo.layout_check import LAYOUT_REPORT_ENV
 
 # ============================================================================
 # LLM兼容性常量定义
@@ -985,6 +989,150 @@ class TeachingScene(Scene):
         
         # 将整个网格组添加到场景中（立即显示）
         self.add(grid_group)
+        # 调试网格不参与布局检查
+        self._debug_grid_group = grid_group
+
+    # ------------------------------------------------------------------------
+    # 布局检查（渲染时设置 MATHVIDEO_LAYOUT_REPORT 才会启用，见 mathvideo.layout_check）
+    # ------------------------------------------------------------------------
+
+    def play(self, *args, **kwargs):
+        """播放动画，启用布局检查时在动画结束后记录所有对象的包围盒"""
+        super().play(*args, **kwargs)
+        self._record_layout("play")
+
+    def wait(self, *args, **kwargs):
+        """等待，启用布局检查时在等待结束后记录所有对象的包围盒"""
+        super().wait(*args, **kwargs)
+        self._record_layout("wait")
+
+    def tear_down(self):
+        """construct 结束后写出布局报告（未启用布局检查时不做任何事）"""
+        super().tear_down()
+        self._write_layout_report()
+
+    @staticmethod
+    def _layout_text_types():
+        """
+        需要检查重叠的文字类型（LaTeX 回退时的 MathTex / Tex 也继承自 Text）
+
+        从 manim 模块直接导入，避免受本文件对 MathTex 等名称重新绑定的影响
+        """
+        from manim.mobject.text.numbers import DecimalNumber
+        from manim.mobject.text.tex_mobject import SingleStringMathTex
+        from manim.mobject.text.text_mobject import MarkupText, Paragraph, Text as _Text
+        return (_Text, MarkupText, Paragraph, SingleStringMathTex, DecimalNumber)
+
+    @staticmethod
+    def _layout_label(mobject):
+        """对象的简短描述（用于报告），文字对象附带内容"""
+        content = getattr(mobject, "text", None) or getattr(mobject, "tex_string", None)
+        if content is None and hasattr(mobject, "number"):
+            content = str(mobject.number)
+        name = type(mobject).__name__
+        if content:
+            content = " ".join(str(content).split())
+            return f"{name}({content[:30]!r})"
+        return name
+
+    @staticmethod
+    def _layout_visible(mobject):
+        """对象是否可见（有点且填充或描边不透明）"""
+        for member in mobject.get_family():
+            if not member.has_points():
+                continue
+            if not isinstance(member, VMobject):
+                return True
+            if member.get_fill_opacity() > 0:
+                return True
+            if member.get_stroke_opacity() > 0 and member.get_stroke_width() > 0:
+                return True
+        return False
+
+    @staticmethod
+    def _layout_box(mobject):
+        """对象在 xy 平面上的包围盒 [x_min, y_min, x_max, y_max]"""
+        points = mobject.get_all_points()
+        if len(points) == 0:
+            return None
+        lower = points[:, :2].min(axis=0)
+        upper = points[:, :2].max(axis=0)
+        return [round(float(v), 4) for v in (*lower, *upper)]
+
+    def _record_layout(self, kind):
+        """
+        记录当前所有内容对象的包围盒（标题、讲义笔记和调试网格除外）
+
+        顶层对象用于检查越界；顶层对象内的每段文字单独记录，用于检查文字重叠
+        """
+        if not os.environ.get(LAYOUT_REPORT_ENV) or not hasattr(self, "divider_x"):
+            return
+        if not hasattr(self, "_layout_steps"):
+            self._layout_steps = []
+            self._layout_ids = {}
+        text_types = self._layout_text_types()
+        excluded = {id(m) for m in (getattr(self, "title", None), getattr(self, "notes_group", None),
+                                    getattr(self, "_debug_grid_group", None)) if m is not None}
+
+        def object_id(mobject):
+            return self._layout_ids.setdefault(id(mobject), len(self._layout_ids))
+
+        def text_leaves(mobject):
+            if isinstance(mobject, text_types):
+                return [mobject]
+            leaves = []
+            for sub in mobject.submobjects:
+                leaves.extend(text_leaves(sub))
+            return leaves
+
+        objects = []
+        for mobject in self.mobjects:
+            if id(mobject) in excluded or not self._layout_visible(mobject):
+                continue
+            box = self._layout_box(mobject)
+            if box is None:
+                continue
+            is_text = isinstance(mobject, text_types)
+            parent_id = object_id(mobject)
+            objects.append({"id": parent_id, "label": self._layout_label(mobject), "text": is_text,
+                            "parent": None, "box": box})
+            if is_text:
+                continue
+            for leaf in text_leaves(mobject):
+                leaf_box = self._layout_box(leaf)
+                if leaf_box is None or not self._layout_visible(leaf):
+                    continue
+                objects.append({"id": object_id(leaf), "label": self._layout_label(leaf), "text": True,
+                                "parent": parent_id, "box": leaf_box})
+
+        self._layout_steps.append({
+            "index": len(self._layout_steps),
+            "kind": kind,
+            "time": round(float(getattr(self.renderer, "time", 0.0)), 3),
+            "objects": objects,
+        })
+
+    def _write_layout_report(self):
+        """把记录的包围盒分析为布局报告并写入 MATHVIDEO_LAYOUT_REPORT 指定的路径"""
+        report_path = os.environ.get(LAYOUT_REPORT_ENV)
+        if not report_path or not hasattr(self, "divider_x"):
+            return
+        import inspect
+        from mathvideo.layout_check import build_report, write_report
+
+        try:
+            script_path = inspect.getfile(type(self))
+        except (TypeError, OSError):
+            script_path = None
+        bounds = {
+            "divider_x": self.divider_x,
+            "grid_x_min": self.grid_x_min,
+            "grid_x_max": self.grid_x_max,
+            "grid_y_min": self.grid_y_min,
+            "grid_y_max": self.grid_y_max,
+        }
+        report = build_report(type(self).__name__, script_path, bounds, getattr(self, "_layout_steps", []))
+        write_report(report_path, report)
 
 # ============================================================================
 # 猴子补丁：修复LLM常见的幻觉方法
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+LLM / 视觉调用指标
+
+每次 Claude / Gemini 调用记录一行 JSON 到项目目录下的 metrics.jsonl:
+    {"ts": ..., "stage": "coder", "provider": "claude", "model": "...",
+     "latency_ms": 8123.4, "input_tokens": 1200, "output_tokens": 900,
+     "cache_creation_input_tokens": 0, "cache_read_input_tokens": 5400,
+     "retries": 0, "ok": true, "cache_hit": false, "cost_usd": 0.027}
+
+对冲的视觉请求（mathvideo.hedging）额外记录一行 "event": "hedge"，包含主提供商、
+胜出的提供商、是否发出了对冲请求以及相对顺序回退节省的时间；summarize() 按阶段单独汇总。
+
+当前项目目录通过 ContextVar 传递：CLI 进程启动后设置一次；后端在处理
+某个项目的请求时用 metrics_project() 包裹，并发请求互不干扰
+（asyncio 任务和 asyncio.to_thread 都会继承当前上下文）。
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+METRICS_FILENAME = "metrics.jsonl"
+
+# 当前项目目录（None 表示不落盘）
+_project_dir: contextvars.ContextVar = contextvars.ContextVar("metrics_project_dir", default=None)
+_write_lock = threading.Lock()
+
+# 参考价格（美元 / 百万 token），按模型名前缀匹配，仅用于估算成本。
+# 提示缓存写入按输入价 1.25 倍、读取按 0.1 倍计（Anthropic 计费规则）。
+MODEL_PRICES = {
+    "claude-opus-4": (5.0, 25.0),
+    "claude-sonnet-4": (3.0, 15.0),
+    "claude-haiku-4": (1.0, 5.0),
+    "gemini-3-pro": (2.0, 12.0),
+    "gemini-2.5-pro": (1.25, 10.0),
+    "gemini-2.5-flash": (0.30, 2.50),
+}
+
+_TOKEN_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+)
+
+
+def set_metrics_project(project_dir: Optional[str]):
+    """设置当前上下文的项目目录（CLI 在创建/重命名项目目录后调用）"""
+    _project_dir.set(project_dir)
+
+
+def get_metrics_project() -> Optional[str]:
+    """当前上下文的项目目录（未设置时为 None）"""
+    return _project_dir.get()
+
+
+@contextmanager
+def metrics_project(project_dir: str):
+    """
+    在 with 块内把调用指标写入 project_dir/metrics.jsonl
+
+    用法:
+        with metrics_project(project_dir):
+            await agenerate_code(...)
+    """
+    token = _project_dir.set(project_dir)
+    try:
+        yield
+    finally:
+        _project_dir.reset(token)
+
+
+def estimate_cost(model: Optional[str], usage: dict) -> Optional[float]:
+    """按参考价格估算一次调用的费用（美元），未知模型返回 None"""
+    if not model:
+        return None
+    for prefix, (input_price, output_price) in MODEL_PRICES.items():
+        if model.startswith(prefix):
+            cost = (
+                usage.get("input_tokens", 0) * input_price
+                + usage.get("cache_creation_input_tokens", 0) * input_price * 1.25
+                + usage.get("cache_read_input_tokens", 0) * input_price * 0.1
+                + usage.get("output_tokens", 0) * output_price
+            ) / 1_000_000
+            return round(cost, 6)
+    return None
+
+
+def gemini_usage(data: Optional[dict]) -> dict:
+    """把 Gemini 响应的 usageMetadata 转换为统一的用量字段"""
+    meta = (data or {}).get("usageMetadata") or {}
+    cached = int(meta.get("cachedContentTokenCount") or 0)
+    return {
+        "input_tokens": max(0, int(meta.get("promptTokenCount") or 0) - cached),
+        "output_tokens": int(meta.get("candidatesTokenCount") or 0) + int(meta.get("thoughtsTokenCount") or 0),
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": cached,
+    }
+
+
+def record_call(
+    stage: Optional[str],
+    provider: str,
+    model: Optional[str],
+    started: float,
+    usage: Optional[dict] = None,
+    retries: int = 0,
+    ok: bool = True,
+    error: Optional[str] = None,
+    cache_hit: bool = False,
+):
+    """
+    记录一次 LLM / 视觉调用
+
+    参数:
+        stage: 调用阶段（router / planner / coder / fixer / refiner / critic / assets / json_repair / describe_images）
+        provider: 提供商（claude / gemini）
+        model: 模型名称
+        started: 调用开始时间（time.perf_counter()）
+        usage: Anthropic 格式的用量字典
+        retries: 重试次数
+        ok: 是否成功
+        error: 失败原因
+        cache_hit: 是否命中本地 LLM 响应缓存（未产生 API 调用）
+    """
+    project_dir = _project_dir.get()
+    if not project_dir:
+        return
+    usage = usage or {}
+    entry = {
+        "ts": round(time.time(), 3),
+        "stage": stage or "unknown",
+        "provider": provider,
+        "model": model,
+        "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        "retries": retries,
+        "ok": ok,
+        "cache_hit": cache_hit,
+    }
+    for field in _TOKEN_FIELDS:
+        entry[field] = int(usage.get(field) or 0)
+    entry["cost_usd"] = 0.0 if cache_hit else estimate_cost(model, entry)
+    if error:
+        entry["error"] = error[:300]
+    _append(project_dir, entry)
+
+
+def record_hedge(
+    stage: str,
+    primary: str,
+    winner: Optional[str],
+    hedged: bool,
+    delay_s: float,
+    latency_s: float,
+    saved_s: float,
+    attempts: List[dict],
+):
+    """
+    记录一次对冲视觉请求的结果（见 mathvideo.hedging.hedged_call）
+
+    参数:
+        stage: 调用阶段（critic / describe_images）
+        primary: 主提供商
+        winner: 给出可用结果的提供商（全部失败时为 None）
+        hedged: 是否在主提供商返回前发出了对冲请求
+        delay_s: 发出对冲请求前的等待时间
+        latency_s: 从开始到拿到结果的总耗时
+        saved_s: 相对原来的顺序回退节省的时间（下界）
+        attempts: 每个提供商的 {"provider", "elapsed_s", "outcome"}
+    """
+    project_dir = _project_dir.get()
+    if not project_dir:
+        return
+    _append(project_dir, {
+        "ts": round(time.time(), 3),
+        "event": "hedge",
+        "stage": stage,
+        "primary": primary,
+        "winner": winner,
+        "hedged": hedged,
+        "delay_ms": round(delay_s * 1000, 1),
+        "latency_ms": round(latency_s * 1000, 1),
+        "saved_ms": round(saved_s * 1000, 1),
+        "attempts": attempts,
+    })
+
+
+def _append(project_dir: str, entry: dict):
+    """追加一行记录到项目的 metrics.jsonl"""
+    path = os.path.join(project_dir, METRICS_FILENAME)
+    line = json.dumps(entry, ensure_ascii=False)
+    try:
+        with _write_lock:
+            os.makedirs(project_dir, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        print(f"⚠️ 写入调用指标失败: {e}")
+
+
+def load_metrics(project_dir: str) -> List[dict]:
+    """读取项目的全部调用记录（忽略损坏的行）"""
+    path = os.path.join(project_dir, METRICS_FILENAME)
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def summarize(records: List[dict]) -> dict:
+    """
+    按阶段汇总调用记录
+
+    返回:
+        dict: {"total": {...}, "stages": {stage: {...}}, "hedges": {stage: {...}}}，
+              stages 每项包含 calls、errors、cache_hits、retries、latency_ms（总和）、
+              max_latency_ms、各类 token 数和 cost_usd；
+              hedges 每项包含 requests、hedged（发出对冲请求的次数）、wins（各提供商胜出次数）、saved_ms
+    """
+    def _empty():
+        bucket = {
+            "calls": 0,
+            "errors": 0,
+            "cache_hits": 0,
+            "retries": 0,
+            "latency_ms": 0.0,
+            "max_latency_ms": 0.0,
+            "cost_usd": 0.0,
+        }
+        bucket.update({field: 0 for field in _TOKEN_FIELDS})
+        return bucket
+
+    total = _empty()
+    stages: Dict[str, dict] = {}
+    hedges: Dict[str, dict] = {}
+    for record in records:
+        stage = record.get("stage") or "unknown"
+        if record.get("event") == "hedge":
+            bucket = hedges.setdefault(stage, {"requests": 0, "hedged": 0, "wins": {}, "saved_ms": 0.0})
+            bucket["requests"] += 1
+            bucket["hedged"] += 1 if record.get("hedged") else 0
+            winner = record.get("winner") or "none"
+            bucket["wins"][winner] = bucket["wins"].get(winner, 0) + 1
+            bucket["saved_ms"] = round(bucket["saved_ms"] + float(record.get("saved_ms") or 0), 1)
+            continue
+        if record.get("event"):
+            continue
+        for bucket in (total, stages.setdefault(stage, _empty())):
+            bucket["calls"] += 1
+            bucket["errors"] += 0 if record.get("ok", True) else 1
+            bucket["cache_hits"] += 1 if record.get("cache_hit") else 0
+            bucket["retries"] += int(record.get("retries") or 0)
+            latency = float(record.get("latency_ms") or 0)
+            bucket["latency_ms"] += latency
+            bucket["max_latency_ms"] = max(bucket["max_latency_ms"], latency)
+            bucket["cost_usd"] += float(record.get("cost_usd") or 0)
+            for field in _TOKEN_FIELDS:
+                bucket[field] += int(record.get(field) or 0)
+
+    for bucket in [total, *stages.values()]:
+        bucket["latency_ms"] = round(bucket["latency_ms"], 1)
+        bucket["cost_usd"] = round(bucket["cost_usd"], 4)
+    return {"total": total, "stages": stages, "hedges": hedges}
+
+
+def format_summary(summary: dict) -> str:
+    """把 summarize() 的结果格式化为终端表格"""
+    header = f"{'阶段':<16}{'调用':>6}{'失败':>6}{'重试':>6}{'耗时(s)':>10}{'输入':>10}{'缓存读':>10}{'缓存写':>10}{'输出':>10}{'成本($)':>10}"
+    lines = [header]
+
+    def _row(name, b):
+        return (
+            f"{name:<16}{b['calls']:>6}{b['errors']:>6}{b['retries']:>6}"
+            f"{b['latency_ms'] / 1000:>10.1f}{b['input_tokens']:>10}"
+            f"{b['cache_read_input_tokens']:>10}{b['cache_creation_input_tokens']:>10}"
+            f"{b['output_tokens']:>10}{b['cost_usd']:>10.4f}"
+        )
+
+    stages = summary["stages"]
+    for name in sorted(stages, key=lambda n: stages[n]["latency_ms"], reverse=True):
+        lines.append(_row(name, stages[name]))
+    lines.append(_row("合计", summary["total"]))
+    for name, bucket in sorted(summary.get("hedges", {}).items()):
+        wins = "、".join(f"{provider} {count}" for provider, count in sorted(bucket["wins"].items()))
+        lines.append(
+            f"对冲 {name}: {bucket['requests']} 次请求，{bucket['hedged']} 次发出对冲，"
+            f"胜出 {wins}，节省 {bucket['saved_ms'] / 1000:.1f}s"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+递进模式（geometry / proof）的代码生成流水线
+
+递进模式下第 N+1 个章节的代码只依赖第 N 个章节的代码，而不依赖它的渲染结果。
+SequentialCodePipeline 在后台线程中沿着章节链提前生成代码（生产者），
+主线程按顺序取出代码并渲染、评估、修复（消费者），两条链并行推进，
+端到端耗时接近 max(LLM 链, 渲染链) 而不是两者之和。
+
+消费者修复或优化了第 N 个章节的代码后调用 update()：如果最终代码与生成时不同，
+基于旧代码提前生成的下游结果全部作废，生产者从第 N+1 个章节开始以最终代码重新生成。
+"""
+import contextvars
+import threading
+from typing import Callable, List, Optional, Tuple
+
+
+class SequentialCodePipeline:
+    """
+    递进模式的章节代码生产者/消费者流水线
+
+    参数:
+        sections: 故事板中的章节列表
+        generate: 生成函数 generate(section, previous_code) -> (code, class_name)
+        lookahead: 生产者最多领先消费者的章节数（领先越多，失效时浪费的调用越多）
+
+    用法:
+        pipeline = SequentialCodePipeline(sections, generate).start()
+        for index, code, class_name in pipeline:
+            ...  # 渲染 / 修复
+            pipeline.update(index, final_code)
+        pipeline.close()
+    """
+
+    def __init__(
+        self,
+        sections: List[dict],
+        generate: Callable[[dict, str], Tuple[Optional[str], Optional[str]]],
+        lookahead: int = 2,
+    ):
+        self.sections = sections
+        self.generate = generate
+        self.lookahead = max(1, lookahead)
+        # 因上游代码变化而作废的生成结果数量
+        self.discarded = 0
+
+        self._cond = threading.Condition()
+        self._results = {}          # 章节序号 -> (code, class_name)
+        self._next_index = 0        # 生产者下一个要生成的章节
+        self._previous_code = ""    # 生成下一个章节时使用的前序代码
+        self._consumed = 0          # 消费者已请求的章节数
+        self._in_flight = None      # 正在生成的章节序号
+        self._epoch = 0             # 每次失效递增，旧 epoch 的结果直接丢弃
+        self._closed = False
+        # 生产者线程运行在当前上下文的副本中，调用指标仍写入本项目的 metrics.jsonl
+        self._thread = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self._produce,),
+            name="codegen-pipeline",
+            daemon=True,
+        )
+
+    def start(self) -> "SequentialCodePipeline":
+        self._thread.start()
+        return self
+
+    def close(self):
+        """停止生产者（正在进行的生成调用完成后退出）"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _produce(self):
+        while True:
+            with self._cond:
+                while not self._closed and (
+                    self._next_index >= len(self.sections)
+                    or self._next_index >= self._consumed + self.lookahead
+                ):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                index = self._next_index
+                previous_code = self._previous_code
+                epoch = self._epoch
+                self._in_flight = index
+
+            try:
+                code, class_name = self.generate(self.sections[index], previous_code)
+            except Exception as e:
+                print(f"Error generating code: {e}")
+                code, class_name = None, None
+
+            with self._cond:
+                self._in_flight = None
+                if epoch != self._epoch:
+                    # 生成期间上游代码已变化，结果作废
+                    self.discarded += 1
+                    self._cond.notify_all()
+                    continue
+                self._results[index] = (code, class_name)
+                self._next_index = index + 1
+                # 生成失败时沿用更早章节的代码作为上下文
+                if code:
+                    self._previous_code = code
+                self._cond.notify_all()
+
+    def get(self, index: int) -> Tuple[Optional[str], Optional[str]]:
+        """
+        取出第 index 个章节的代码（阻塞直到生成完成）
+
+        返回:
+            tuple: (code, class_name)，生成失败时为 (None, None)
+        """
+        with self._cond:
+            self._consumed = max(self._consumed, index + 1)
+            self._cond.notify_all()
+            while index not in self._results:
+                self._cond.wait()
+            return self._results[index]
+
+    def __iter__(self):
+        for index in range(len(self.sections)):
+            code, class_name = self.get(index)
+            yield index, code, class_name
+
+    def update(self, index: int, final_code: Optional[str]) -> bool:
+        """
+        报告第 index 个章节的最终代码（渲染修复 / 视觉优化之后）
+
+        最终代码与生成时不同时，作废下游已生成或正在生成的结果，
+        并以最终代码为上下文从第 index+1 个章节重新生成。
+
+        返回:
+            bool: 是否使下游失效
+        """
+        with self._cond:
+            generated = self._results.get(index, (None, None))[0]
+            if not final_code or not generated or final_code == generated:
+                return False
+            stale = [i for i in self._results if i > index]
+            for i in stale:
+                del self._results[i]
+            running = self._in_flight is not None and self._in_flight > index
+            self.discarded += len(stale)
+            self._epoch += 1
+            self._next_index = index + 1
+            self._previous_code = final_code
+            self._cond.notify_all()
+        if stale or running:
+            print(f"♻️ 章节 {self.sections[index].get('id')} 的代码已修改，基于旧代码提前生成的后续章节将重新生成。")
+        return True
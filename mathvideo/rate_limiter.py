@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+客户端限流器
+
+每个模型提供商（claude / gemini）在进程内共享一个限流器，由两个令牌桶组成:
+    - 请求桶: 每分钟最多 RPM 个请求
+    - token 桶: 每分钟最多 TPM 个 token（请求前按请求体估算输入，响应后补记输出）
+
+令牌桶允许余额为负：请求先预订额度，再等待余额恢复为非负，
+这样并发调用会按到达顺序依次放行，而不是同时醒来再次争抢。
+
+收到 429 / 529 时调用 pause()，让进程内所有调用方在 retry-after 期间暂停发送，
+多个 Pipeline 并行运行时整体降速，而不是各自撞墙后失败。
+"""
+import asyncio
+import threading
+import time
+from typing import Dict
+
+from mathvideo.config import CLAUDE_RPM, CLAUDE_TPM, GEMINI_RPM, GEMINI_TPM
+
+
+class TokenBucket:
+    """
+    按分钟速率匀速补充的令牌桶
+
+    参数:
+        per_minute: 每分钟补充的令牌数，同时也是桶容量；0 表示不限制
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        预订 amount 个令牌，返回需要等待的秒数
+
+        单次预订超过桶容量时按容量计算等待时间，避免大请求永远无法放行。
+        """
+        if not self.enabled or amount <= 0:
+            return 0.0
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def consume(self, amount: float, now: float):
+        """事后补记已消耗的令牌（不等待，余额可为负）"""
+        if not self.enabled or amount <= 0:
+            return
+        self._refill(now)
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """
+    单个提供商的请求数 + token 数联合限流器
+
+    参数:
+        rpm: 每分钟请求数上限，0 表示不限制
+        tpm: 每分钟 token 数上限，0 表示不限制
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            wait = max(
+                self.requests.reserve(1, now),
+                self.tokens.reserve(tokens, now),
+                self._paused_until - now,
+            )
+            return max(0.0, wait)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        阻塞直到允许发送一个估算消耗 tokens 个 token 的请求
+
+        返回:
+            float: 实际等待的秒数
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        """acquire 的异步版本，等待期间不阻塞事件循环"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def consume(self, tokens: int):
+        """响应返回后补记输出 token 等额外消耗"""
+        with self._lock:
+            self.tokens.consume(tokens, time.monotonic())
+
+    def pause(self, seconds: float):
+        """服务端限流时让所有调用方暂停 seconds 秒"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+_LIMITS = {
+    "claude": (CLAUDE_RPM, CLAUDE_TPM),
+    "gemini": (GEMINI_RPM, GEMINI_TPM),
+}
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> RateLimiter:
+    """
+    获取指定提供商在进程内共享的限流器
+
+    参数:
+        provider: 提供商名称（"claude" / "gemini"）
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            rpm, tpm = _LIMITS.get(provider, (0, 0))
+            limiter = RateLimiter(rpm, tpm)
+            _limiters[provider] = limiter
+        return limiter
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+渲染结果缓存
+
+以 hash(脚本内容, 场景类名, manim 版本, mathvideo.manim_base 版本, 质量) 为键，
+把渲染出的 MP4 保存到共享缓存目录。脚本字节未变化时（CLI 重跑、后端重新渲染、
+修复后又改回原样）直接复用上次的视频，不再启动渲染。
+
+命中时通过 reflink（写时复制）或硬链接把视频放到项目的 media/videos/... 目录，
+两者都不可用（例如跨文件系统）时才复制。使用硬链接时项目文件与缓存共享同一个 inode，
+因此真正渲染前会先把目标路径移到一旁（见 stash_output），让 manim 写入新文件而不是原地覆盖缓存；
+渲染失败时再把原来的视频移回（restore_output），章节不会因为一次失败的修复而丢掉上一版可用的视频。
+
+目录结构:
+    <RENDER_CACHE_DIR>/<key[:2]>/<key>.mp4
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+from typing import Optional
+
+from mathvideo.config import RENDER_CACHE_ENABLED, RENDER_CACHE_DIR, RENDER_CACHE_MAX_MB
+
+# Linux FICLONE ioctl（btrfs / xfs 等支持写时复制的文件系统）
+_FICLONE = 0x40049409
+
+_MANIM_BASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "manim_base.py")
+
+
+def _manim_version() -> str:
+    try:
+        from importlib.metadata import version
+        return version("manim")
+    except Exception:
+        return "unknown"
+
+
+def _manim_base_version() -> str:
+    """mathvideo.manim_base 没有版本号，以文件内容哈希作为版本"""
+    try:
+        with open(_MANIM_BASE_PATH, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()[:16]
+    except OSError:
+        return "unknown"
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """尝试写时复制克隆文件，不支持时返回 False"""
+    if sys.platform.startswith("linux"):
+        try:
+            import fcntl
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            return True
+        except (OSError, ImportError):
+            try:
+                os.remove(dst)
+            except OSError:
+                pass
+            return False
+    return False
+
+
+def link_or_copy(src: str, dst: str) -> str:
+    """
+    把 src 放到 dst：依次尝试 reflink、硬链接、复制
+
+    返回:
+        str: 实际使用的方式（"reflink" / "hardlink" / "copy"）
+    """
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if _reflink(src, tmp):
+        method = "reflink"
+    else:
+        try:
+            os.link(src, tmp)
+            method = "hardlink"
+        except OSError:
+            shutil.copy2(src, tmp)
+            method = "copy"
+    # 原子替换，正在播放/读取旧文件的进程不受影响
+    os.replace(tmp, dst)
+    return method
+
+
+def prepare_output(path: str):
+    """
+    真正渲染前删除已存在的输出文件
+
+    输出文件可能是缓存条目的硬链接，manim 原地覆盖会同时改坏缓存。
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def stash_output(path: str) -> Optional[str]:
+    """
+    真正渲染前把已存在的输出文件改名移到一旁
+
+    与 prepare_output 一样避免 manim 原地覆盖硬链接的缓存条目，但保留旧文件，
+    渲染失败时可以用 restore_output 恢复。
+
+    返回:
+        str: 备份路径；输出文件不存在时返回 None
+    """
+    if not os.path.exists(path):
+        return None
+    backup = f"{path}.{os.getpid()}.{threading.get_ident()}.prev"
+    try:
+        os.replace(path, backup)
+    except OSError as e:
+        print(f"⚠️ 备份旧输出失败，改为删除: {e}")
+        prepare_output(path)
+        return None
+    return backup
+
+
+def restore_output(backup: Optional[str], path: str, ok: bool):
+    """
+    渲染结束后处理 stash_output 的备份：成功时删除备份，失败时把旧文件移回原路径
+
+    参数:
+        backup: stash_output 返回的备份路径（None 时不做任何事）
+        path: 输出文件路径
+        ok: 渲染是否成功（且已生成输出文件）
+    """
+    if not backup:
+        return
+    try:
+        if ok:
+            os.remove(backup)
+        else:
+            # 失败的渲染可能留下不完整的文件，用旧文件覆盖
+            os.replace(backup, path)
+    except OSError as e:
+        print(f"⚠️ 处理旧输出备份失败: {e}")
+
+
+class RenderCache:
+    """
+    基于文件的渲染结果缓存，按最近访问时间做 LRU 淘汰
+
+    参数:
+        cache_dir: 缓存根目录
+        max_bytes: 缓存总大小上限，超出后淘汰最久未访问的条目
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 2048 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+        self._versions = None
+
+    def make_key(self, script_path: str, class_name: str, quality: str) -> Optional[str]:
+        """
+        计算渲染缓存键：脚本内容 + 场景类名 + manim 版本 + manim_base 版本 + 质量
+
+        返回:
+            str: 十六进制哈希；脚本无法读取时返回 None
+        """
+        try:
+            with open(script_path, "rb") as f:
+                script_hash = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+        if self._versions is None:
+            self._versions = (_manim_version(), _manim_base_version())
+        basis = {
+            "script": script_hash,
+            "class_name": class_name,
+            "manim": self._versions[0],
+            "manim_base": self._versions[1],
+            "quality": quality,
+        }
+        raw = json.dumps(basis, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.mp4")
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str, dst: str) -> Optional[str]:
+        """
+        命中时把缓存的视频放到 dst
+
+        返回:
+            str: 使用的方式（reflink / hardlink / copy）；未命中返回 None
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            method = link_or_copy(path, dst)
+        except OSError as e:
+            print(f"⚠️ 渲染缓存读取失败: {e}")
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        # 更新访问时间，作为 LRU 淘汰依据
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return method
+
+    def put(self, key: str, video_path: str):
+        """保存一次成功渲染的视频，并在超出容量时淘汰最久未访问的条目"""
+        path = self._path(key)
+        try:
+            link_or_copy(video_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"⚠️ 写入渲染缓存失败: {e}")
+            return
+        with self._lock:
+            self.writes += 1
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _iter_entries(self):
+        for root, _dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".mp4"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def _scan_size(self) -> int:
+        return sum(size for _path, size, _mtime in self._iter_entries())
+
+    def _evict(self):
+        """按访问时间从旧到新删除条目，直到总大小降到上限的 90% 以下"""
+        entries = sorted(self._iter_entries(), key=lambda e: e[2])
+        total = sum(size for _path, size, _mtime in entries)
+        target = int(self.max_bytes * 0.9)
+        for path, size, _mtime in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.evictions += 1
+            except OSError:
+                continue
+        self._total_bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+
+_cache: Optional[RenderCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_render_cache() -> Optional[RenderCache]:
+    """获取进程级共享的渲染缓存实例；RENDER_CACHE_ENABLED=false 时返回 None"""
+    global _cache
+    if not RENDER_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = RenderCache(
+                cache_dir=RENDER_CACHE_DIR,
+                max_bytes=int(RENDER_CACHE_MAX_MB * 1024 * 1024),
+            )
+        return _cache
@@ -0,0 +1,616 @@
+# -*- coding: utf-8 -*-
+"""
+常驻 Manim 渲染进程池
+
+每次 `python -m manim -ql ...` 都要重新启动解释器、导入 manim / numpy / cairo / pango，
+并执行 mathvideo.manim_base 的 LaTeX 探测和字体发现，冷启动往往要数秒。
+RenderPool 预先启动若干个常驻工作进程（multiprocessing spawn），
+它们在启动时导入 manim 和 mathvideo.manim_base，之后通过管道接收渲染任务:
+    - 崩溃隔离: 工作进程崩溃或超时只影响当前任务，进程池自动补充新进程
+    - 定期回收: 每个工作进程渲染 RENDER_WORKER_MAX_JOBS 个任务后重启，避免状态和内存累积
+    - 自动回退: 工作进程无法导入 manim 时（例如后端运行在没有 manim 的解释器中），
+      回退为每次启动 manim 子进程
+
+每个任务的结果中记录 startup_saved（本次避免的冷启动耗时，按工作进程从启动到就绪的实测耗时计）。
+
+试运行（dry_run=True）: 在工作进程中以 manim 的 dry_run 配置执行场景的 construct，
+跳过动画插值、不写任何帧，只用来尽早发现脚本错误。失败时结果中带有结构化的
+error_info（错误类型、信息、脚本中的出错行、阶段），format_render_error() 把它整理成
+交给修复代理的错误描述。
+
+动画级复用: manim 按每次 play() 的哈希把动画片段保存在 partial_movie_files 中，
+同一章节脚本（文件名、类名、媒体目录不变）再次渲染时，未改动的动画直接复用已有片段。
+工作进程使用由脚本路径决定的固定模块名，保证哈希在多次修复/优化之间稳定；
+结果中的 animation_cache 记录每个动画是否命中（format_animation_cache() 生成摘要）。
+
+布局检查: LAYOUT_CHECK 开启时，完整渲染通过环境变量 MATHVIDEO_LAYOUT_REPORT 让
+TeachingScene 在视频旁写出 <类名>.layout.json（见 mathvideo.layout_check），
+VisualCritic 据此决定是否需要调用远程视觉模型。
+
+render_scene() 先查询渲染结果缓存（mathvideo.render_cache）：脚本未变化时直接复用
+上次的视频（结果中 cache_hit=True），试运行也直接视为通过。
+
+用法:
+    result = render_scene(script_path, class_name, media_dir)
+    if result["ok"]:
+        print(result["video_path"])
+    else:
+        print(result["error"])
+"""
+import asyncio
+import hashlib
+import importlib.util
+import io
+import multiprocessing
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Optional
+
+from mathvideo.config import LAYOUT_CHECK, RENDER_POOL_SIZE, RENDER_TIMEOUT, RENDER_WORKER_MAX_JOBS
+from mathvideo.layout_check import LAYOUT_REPORT_ENV, layout_report_path
+from mathvideo.render_cache import get_render_cache, restore_output, stash_output
+
+# manim 质量名称 -> (命令行参数, 输出子目录)
+QUALITY_FLAGS = {
+    "low_quality": ("-ql", "480p15"),
+    "medium_quality": ("-qm", "720p30"),
+    "high_quality": ("-qh", "1080p60"),
+}
+
+# 错误输出保留的最大长度（与 CLI 打印/修复时使用的长度相当）
+_MAX_ERROR_CHARS = 6000
+
+# 出错阶段的说明（用于修复提示）
+ERROR_PHASES = {
+    "load": "加载脚本（语法错误 / 导入错误 / 找不到场景类）",
+    "construct": "试运行 construct（跳过动画，不写帧）",
+    "render": "完整渲染",
+}
+
+
+def expected_video_path(media_dir: str, script_path: str, class_name: str, quality: str = "low_quality") -> str:
+    """Manim 默认输出结构: media/videos/<脚本名>/<质量>/<类名>.mp4"""
+    script_name = os.path.splitext(os.path.basename(script_path))[0]
+    return os.path.join(media_dir, "videos", script_name, QUALITY_FLAGS[quality][1], f"{class_name}.mp4")
+
+
+# ============================================================================
+# 工作进程
+# ============================================================================
+
+def _worker_main(conn):
+    """工作进程入口：预导入 manim，然后循环处理渲染任务"""
+    started = time.perf_counter()
+    try:
+        import manim  # noqa: F401
+        # 触发 manim_base 的 LaTeX 探测、字体发现和各类补丁
+        import mathvideo.manim_base  # noqa: F401
+    except BaseException:
+        conn.send({"type": "ready", "ok": False, "error": traceback.format_exc()})
+        return
+    conn.send({
+        "type": "ready",
+        "ok": True,
+        "import_seconds": time.perf_counter() - started,
+        "ready_at": time.time(),
+    })
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        conn.send(_run_job(job))
+
+
+def _error_info(exc: BaseException, script_path: str, phase: str) -> dict:
+    """从异常中提取结构化错误信息（出错行取脚本文件内最深的一帧）"""
+    info = {
+        "type": type(exc).__name__,
+        "message": str(exc).strip()[:1000],
+        "phase": phase,
+        "line": None,
+        "code": None,
+    }
+    if isinstance(exc, SyntaxError) and exc.lineno:
+        info["line"] = exc.lineno
+        info["code"] = (exc.text or "").strip()
+        return info
+    for frame in reversed(traceback.extract_tb(exc.__traceback__)):
+        if os.path.abspath(frame.filename) == script_path:
+            info["line"] = frame.lineno
+            info["code"] = (frame.line or "").strip()
+            break
+    return info
+
+
+def _run_job(job: dict) -> dict:
+    """在工作进程内渲染（或试运行）一个场景（每个任务使用独立的模块名和临时配置）"""
+    from manim import tempconfig
+
+    started = time.perf_counter()
+    output = io.StringIO()
+    # 固定的模块名：动画哈希不受每次任务随机命名的影响，partial movie 片段可以跨任务复用
+    script_id = hashlib.sha256(job["script_path"].encode("utf-8")).hexdigest()[:12]
+    module_name = f"_mathvideo_render_{script_id}"
+    dry_run = job.get("dry_run", False)
+    cached_before = None
+    options = {
+        "media_dir": job["media_dir"],
+        "input_file": job["script_path"],
+        "quality": job.get("quality", "low_quality"),
+        "progress_bar": "none",
+        "verbosity": "WARNING",
+    }
+    if dry_run:
+        # 不写视频 / 图片文件
+        options["dry_run"] = True
+    if job.get("layout_report"):
+        # TeachingScene 在渲染结束时把布局报告写到这里
+        os.environ[LAYOUT_REPORT_ENV] = job["layout_report"]
+    phase = "load"
+    try:
+        with redirect_stdout(output), redirect_stderr(output), tempconfig(options):
+            spec = importlib.util.spec_from_file_location(module_name, job["script_path"])
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+            scene_class = getattr(module, job["class_name"])
+            if dry_run:
+                # 跳过动画插值：play() 直接把对象更新到动画结束状态
+                from manim.renderer.cairo_renderer import CairoRenderer
+                phase = "construct"
+                scene = scene_class(renderer=CairoRenderer(skip_animations=True))
+            else:
+                phase = "render"
+                scene = scene_class()
+                # 记录渲染前已有的动画片段，用于判断哪些动画命中缓存
+                partial_dir = getattr(getattr(scene.renderer, "file_writer", None), "partial_movie_directory", None)
+                cached_before = set(os.listdir(partial_dir)) if partial_dir and os.path.isdir(partial_dir) else set()
+            scene.render()
+            file_writer = getattr(scene.renderer, "file_writer", None)
+            movie_path = getattr(file_writer, "movie_file_path", None)
+            animation_cache = None
+            if cached_before is not None:
+                from manim import config
+                extension = config["movie_file_extension"]
+                animation_cache = [
+                    f"{h}{extension}" in cached_before
+                    for h in getattr(scene.renderer, "animations_hashes", [])
+                    if h
+                ]
+        return {
+            "ok": True,
+            "video_path": str(movie_path) if movie_path else None,
+            "animation_cache": animation_cache,
+            "log": output.getvalue()[-_MAX_ERROR_CHARS:],
+            "elapsed": time.perf_counter() - started,
+        }
+    except BaseException as e:
+        return {
+            "ok": False,
+            "error": (output.getvalue() + traceback.format_exc())[-_MAX_ERROR_CHARS:],
+            "error_info": _error_info(e, job["script_path"], phase),
+            "elapsed": time.perf_counter() - started,
+        }
+    finally:
+        sys.modules.pop(module_name, None)
+        os.environ.pop(LAYOUT_REPORT_ENV, None)
+
+
+class _Worker:
+    """父进程侧的工作进程句柄"""
+
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.spawned_at = time.time()
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+        # 从启动到就绪的耗时（即一次冷启动的代价），就绪前为 None
+        self.boot_seconds = None
+        self.ready_error = None
+
+    def wait_ready(self, timeout: float) -> bool:
+        """等待工作进程完成预导入，返回是否可用"""
+        if self.boot_seconds is not None:
+            return True
+        if self.ready_error is not None:
+            return False
+        try:
+            if not self.conn.poll(timeout):
+                self.ready_error = "工作进程启动超时"
+                return False
+            message = self.conn.recv()
+        except (EOFError, OSError):
+            self.ready_error = f"工作进程启动时退出 (exitcode={self.process.exitcode})"
+            return False
+        if not message.get("ok"):
+            self.ready_error = message.get("error") or "工作进程预导入失败"
+            return False
+        # 按工作进程报告的就绪时刻计算，不包含就绪后空闲等待任务的时间
+        self.boot_seconds = max(0.0, message.get("ready_at", time.time()) - self.spawned_at)
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(1)
+        self.conn.close()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+
+class RenderPool:
+    """
+    常驻 Manim 渲染进程池（线程安全）
+
+    参数:
+        size: 工作进程数量
+        max_jobs_per_worker: 每个工作进程渲染多少个任务后回收重启
+        timeout: 单个任务的超时时间（秒），超时的工作进程会被强制结束
+    """
+
+    def __init__(self, size: int = RENDER_POOL_SIZE, max_jobs_per_worker: int = RENDER_WORKER_MAX_JOBS,
+                 timeout: float = RENDER_TIMEOUT):
+        self.size = max(1, size)
+        self.max_jobs_per_worker = max(1, max_jobs_per_worker)
+        self.timeout = timeout
+        self.available = True
+        self.unavailable_reason = None
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {
+            "jobs": 0,
+            "failures": 0,
+            "crashes": 0,
+            "recycled": 0,
+            "startup_saved": 0.0,
+            "render_seconds": 0.0,
+            "dry_runs": 0,
+            "dry_run_failures": 0,
+        }
+        # 创建后立即启动全部工作进程，预导入与 LLM 调用并行进行
+        for _ in range(self.size):
+            self._idle.put(_Worker(self._ctx))
+
+    def _replace(self, worker: _Worker, crashed: bool):
+        """结束并替换一个工作进程"""
+        if crashed:
+            worker.kill()
+        else:
+            worker.stop()
+        with self._lock:
+            if crashed:
+                self.stats["crashes"] += 1
+            else:
+                self.stats["recycled"] += 1
+            closed = self._closed
+        if not closed:
+            self._idle.put(_Worker(self._ctx))
+
+    def render(self, script_path: str, class_name: str, media_dir: str, quality: str = "low_quality",
+               dry_run: bool = False, layout_report: Optional[str] = None) -> Optional[dict]:
+        """
+        在常驻工作进程中渲染一个场景
+
+        参数:
+            script_path: 场景脚本路径
+            class_name: 场景类名
+            media_dir: 媒体输出目录
+            quality: manim 质量名称（low_quality / medium_quality / high_quality）
+            dry_run: 只试运行 construct（跳过动画、不写帧），用于快速校验脚本
+            layout_report: 布局报告的写入路径（None 表示不做布局检查）
+
+        返回:
+            dict: {"ok", "video_path", "error", "error_info", "elapsed", "startup_saved"}；
+            进程池不可用（工作进程无法导入 manim）时返回 None，由调用方回退到子进程渲染
+        """
+        if not self.available:
+            return None
+        worker = self._idle.get()
+        waited_at = time.perf_counter()
+        if not worker.wait_ready(self.timeout):
+            reason = worker.ready_error
+            worker.kill()
+            with self._lock:
+                self.available = False
+                self.unavailable_reason = reason
+            # 放回一个空位，避免其它等待中的线程永久阻塞
+            self._idle.put(worker)
+            print(f"⚠️ 渲染进程池不可用，回退为 manim 子进程: {reason.strip().splitlines()[-1] if reason else ''}")
+            return None
+        # 首个任务如果等待了预导入，只计算实际省下的部分
+        startup_saved = max(0.0, worker.boot_seconds - (time.perf_counter() - waited_at)) if worker.jobs == 0 else worker.boot_seconds
+
+        job = {
+            "script_path": os.path.abspath(script_path),
+            "class_name": class_name,
+            "media_dir": os.path.abspath(media_dir),
+            "quality": quality,
+            "dry_run": dry_run,
+            "layout_report": layout_report,
+        }
+        try:
+            worker.conn.send(job)
+            if not worker.conn.poll(self.timeout):
+                self._replace(worker, crashed=True)
+                return self._record({"ok": False, "error": f"渲染超时（{self.timeout:.0f}s），已结束工作进程", "elapsed": self.timeout}, startup_saved, dry_run)
+            result = worker.conn.recv()
+        except (EOFError, OSError):
+            exitcode = worker.process.exitcode
+            self._replace(worker, crashed=True)
+            return self._record({"ok": False, "error": f"渲染工作进程崩溃 (exitcode={exitcode})", "elapsed": time.perf_counter() - waited_at}, startup_saved, dry_run)
+
+        worker.jobs += 1
+        if worker.jobs >= self.max_jobs_per_worker:
+            self._replace(worker, crashed=False)
+        else:
+            self._idle.put(worker)
+
+        if result.get("ok") and not dry_run and not result.get("video_path"):
+            result["video_path"] = expected_video_path(media_dir, script_path, class_name, quality)
+        return self._record(result, startup_saved, dry_run)
+
+    def _record(self, result: dict, startup_saved: float, dry_run: bool = False) -> dict:
+        result["startup_saved"] = startup_saved
+        with self._lock:
+            if dry_run:
+                self.stats["dry_runs"] += 1
+                self.stats["dry_run_failures"] += 0 if result.get("ok") else 1
+            self.stats["jobs"] += 1
+            self.stats["failures"] += 0 if result.get("ok") else 1
+            self.stats["startup_saved"] += startup_saved
+            self.stats["render_seconds"] += result.get("elapsed") or 0.0
+        return result
+
+    def shutdown(self):
+        """结束所有空闲工作进程"""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker.boot_seconds is not None:
+                worker.stop()
+            else:
+                worker.kill()
+
+
+_pool: Optional[RenderPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool() -> Optional[RenderPool]:
+    """获取进程内共享的渲染进程池（RENDER_POOL_SIZE=0 时返回 None）"""
+    global _pool
+    if RENDER_POOL_SIZE <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = RenderPool()
+        return _pool
+
+
+def shutdown_render_pool():
+    """关闭共享的渲染进程池（CLI 结束或后端关闭时调用）"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool:
+        pool.shutdown()
+
+
+def parse_error_text(text: str, script_path: str) -> Optional[dict]:
+    """
+    从 manim 子进程的错误输出中解析结构化错误信息（子进程回退路径使用）
+
+    同时兼容标准 traceback（File "...", line N）和 rich traceback（path.py:N in ...）两种格式。
+    """
+    if not text:
+        return None
+    script_name = os.path.basename(script_path)
+    line = None
+    for match in re.finditer(r'File "([^"]+)", line (\d+)|([^\s│]+\.py):(\d+) in ', text):
+        filename = match.group(1) or match.group(3)
+        if os.path.basename(filename) == script_name:
+            line = int(match.group(2) or match.group(4))
+    exc_type, message = "Error", ""
+    for candidate in reversed(text.strip().splitlines()):
+        match = re.match(r"^\s*([A-Za-z_][\w.]*(?:Error|Exception|Exit|Interrupt)):?\s*(.*)$", candidate)
+        if match:
+            exc_type, message = match.group(1).split(".")[-1], match.group(2).strip()
+            break
+    code = None
+    if line:
+        try:
+            with open(script_path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            code = lines[line - 1].strip() if 0 < line <= len(lines) else None
+        except OSError:
+            pass
+    return {"type": exc_type, "message": message[:1000], "phase": None, "line": line, "code": code}
+
+
+def format_render_error(result: dict) -> str:
+    """
+    把渲染 / 试运行失败的结果整理为交给修复代理的错误描述
+
+    有结构化信息时先列出错误类型、信息、出错行和阶段，再附上原始输出的末尾部分。
+    """
+    raw = result.get("error") or "（无错误输出）"
+    info = result.get("error_info")
+    if not info:
+        return raw
+    lines = [
+        f"错误类型: {info.get('type')}",
+        f"错误信息: {info.get('message') or '（无）'}",
+    ]
+    if info.get("line"):
+        lines.append(f"出错位置: 第 {info['line']} 行: {info.get('code') or ''}")
+    if info.get("phase"):
+        lines.append(f"出错阶段: {ERROR_PHASES.get(info['phase'], info['phase'])}")
+    lines.append("")
+    lines.append("原始输出（末尾）:")
+    lines.append(raw[-2000:])
+    return "\n".join(lines)
+
+
+def parse_animation_cache(log: str) -> Optional[list]:
+    """从 manim 子进程的 INFO 日志中解析每个动画是否复用了 partial movie 片段"""
+    status = {}
+    for match in re.finditer(r"Animation (\d+) : (Using cached data|Partial movie file written)", log or ""):
+        status[int(match.group(1))] = match.group(2).startswith("Using")
+    if not status:
+        return None
+    return [status.get(i, False) for i in range(max(status) + 1)]
+
+
+def format_animation_cache(result: dict) -> Optional[str]:
+    """
+    动画级缓存摘要，如 "动画缓存: 命中 5/8，重新渲染第 6、7、8 个"
+
+    返回:
+        str: 摘要；结果中没有动画信息时返回 None
+    """
+    flags = result.get("animation_cache")
+    if not flags:
+        return None
+    hits = sum(1 for flag in flags if flag)
+    text = f"动画缓存: 命中 {hits}/{len(flags)}"
+    rendered = [str(i + 1) for i, flag in enumerate(flags) if not flag]
+    if hits and rendered:
+        text += f"，重新渲染第 {'、'.join(rendered)} 个"
+    return text
+
+
+def _render_subprocess(script_path: str, class_name: str, media_dir: str, quality: str,
+                       python_exe: Optional[str], cwd: Optional[str], dry_run: bool = False,
+                       layout_report: Optional[str] = None) -> dict:
+    """冷启动 manim 子进程渲染（进程池不可用或被关闭时使用）"""
+    cwd = cwd or os.getcwd()
+    cmd = [python_exe or sys.executable, "-m", "manim", QUALITY_FLAGS[quality][0], "--media_dir", media_dir]
+    if dry_run:
+        cmd.append("--dry_run")
+    cmd += [script_path, class_name]
+    env = os.environ.copy()
+    env["PYTHONPATH"] = cwd
+    if layout_report:
+        env[LAYOUT_REPORT_ENV] = layout_report
+    started = time.perf_counter()
+    try:
+        result = subprocess.run(
+            cmd, env=env, cwd=cwd, capture_output=True, text=True,
+            encoding="utf-8", errors="replace", timeout=RENDER_TIMEOUT,
+        )
+    except subprocess.TimeoutExpired:
+        return {"ok": False, "error": f"渲染超时（{RENDER_TIMEOUT:.0f}s）", "elapsed": time.perf_counter() - started, "startup_saved": 0.0}
+    elapsed = time.perf_counter() - started
+    if result.returncode == 0:
+        return {
+            "ok": True,
+            "video_path": None if dry_run else expected_video_path(media_dir, script_path, class_name, quality),
+            "animation_cache": None if dry_run else parse_animation_cache((result.stdout or "") + (result.stderr or "")),
+            "elapsed": elapsed,
+            "startup_saved": 0.0,
+        }
+    error = (result.stderr or result.stdout or "（无错误输出）")[-_MAX_ERROR_CHARS:]
+    error_info = parse_error_text(error, script_path)
+    if error_info:
+        error_info["phase"] = "construct" if dry_run else "render"
+    return {
+        "ok": False,
+        "error": error,
+        "error_info": error_info,
+        "elapsed": elapsed,
+        "startup_saved": 0.0,
+    }
+
+
+def render_scene(script_path: str, class_name: str, media_dir: str, quality: str = "low_quality",
+                 python_exe: Optional[str] = None, cwd: Optional[str] = None, dry_run: bool = False) -> dict:
+    """
+    渲染一个场景：优先使用常驻进程池，不可用时回退到 manim 子进程
+
+    参数:
+        script_path: 场景脚本路径
+        class_name: 场景类名
+        media_dir: 媒体输出目录
+        quality: manim 质量名称
+        python_exe: 回退到子进程时使用的解释器（默认当前解释器）
+        cwd: 回退到子进程时的工作目录（同时加入 PYTHONPATH，默认当前目录）
+        dry_run: 只试运行 construct（跳过动画、不写帧），用于在完整渲染前快速发现错误
+
+    返回:
+        dict: {"ok": bool, "video_path": str, "error": str, "error_info": dict,
+               "elapsed": float, "startup_saved": float, "cache_hit": bool}
+        完整渲染且 LAYOUT_CHECK 开启时，视频旁会写出布局报告（layout_report_path(video_path)）
+    """
+    started = time.perf_counter()
+    cache = get_render_cache()
+    key = cache.make_key(script_path, class_name, quality) if cache else None
+    video_path = expected_video_path(media_dir, script_path, class_name, quality)
+    if key:
+        if dry_run and cache.contains(key):
+            # 同一脚本之前完整渲染成功过，无需再试运行
+            return {"ok": True, "video_path": None, "elapsed": time.perf_counter() - started,
+                    "startup_saved": 0.0, "cache_hit": True}
+        if not dry_run:
+            method = cache.get(key, video_path)
+            if method:
+                print(f"♻️ 命中渲染缓存（{method}）: {os.path.basename(video_path)}")
+                return {"ok": True, "video_path": video_path, "elapsed": time.perf_counter() - started,
+                        "startup_saved": 0.0, "cache_hit": True}
+
+    # 旧视频先移到一旁而不是删除：渲染失败时恢复，调用方回退脚本后视频仍与之对应
+    video_backup = None if dry_run else stash_output(video_path)
+    layout_report = report_backup = None
+    if LAYOUT_CHECK and not dry_run:
+        layout_report = os.path.abspath(layout_report_path(video_path))
+        # 旧报告同样移开：脚本不是 TeachingScene 时不会留下过期的结果，渲染失败时随旧视频一起恢复
+        report_backup = stash_output(layout_report)
+
+    pool = get_render_pool()
+    result = pool.render(script_path, class_name, media_dir, quality, dry_run=dry_run,
+                         layout_report=layout_report) if pool else None
+    if result is None:
+        result = _render_subprocess(script_path, class_name, media_dir, quality, python_exe, cwd, dry_run,
+                                    layout_report)
+    result["cache_hit"] = False
+    rendered = bool(result["ok"] and result.get("video_path") and os.path.exists(result["video_path"]))
+    if not dry_run:
+        restore_output(video_backup, video_path, rendered)
+        if layout_report:
+            restore_output(report_backup, layout_report, rendered)
+    if key and not dry_run and rendered:
+        cache.put(key, result["video_path"])
+    return result
+
+
+async def arender_scene(script_path: str, class_name: str, media_dir: str, quality: str = "low_quality",
+                        python_exe: Optional[str] = None, cwd: Optional[str] = None, dry_run: bool = False) -> dict:
+    """render_scene 的异步版本（在线程中等待，不阻塞事件循环）"""
+    return await asyncio.to_thread(render_scene, script_path, class_name, media_dir, quality, python_exe, cwd, dry_run)
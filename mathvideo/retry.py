@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+带状态码感知重试的 HTTP 调用
+
+所有 Claude / Gemini 请求都经过 post_with_retry / apost_with_retry:
+    - 发送前通过提供商共享的限流器（mathvideo.rate_limiter）申请额度
+    - 网络错误、408 / 429 / 5xx / 529 响应按带抖动的指数退避重试
+    - 服务端给出 retry-after（响应头或 Gemini 的 RetryInfo）时以其为准
+    - 429 / 529 会暂停整个进程对该提供商的请求，避免并发调用继续撞限流
+
+返回的响应可能仍是非 200（不可重试的状态码或重试次数用尽），
+由调用方按各自的错误格式处理。响应对象上附带 retries 属性，记录实际重试次数。
+
+传入 circuit=<接口名> 时经过该 (提供商, 接口) 的熔断器（mathvideo.circuit_breaker）:
+已熔断时直接抛出 CircuitOpenError，不发送请求；整次调用的结果计入熔断器。
+"""
+import asyncio
+import json
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import requests
+
+from mathvideo.circuit_breaker import FAILURE_STATUS_CODES, get_circuit_breaker
+from mathvideo.config import LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY
+from mathvideo.http_pool import get_session, get_async_client
+from mathvideo.rate_limiter import get_rate_limiter
+
+# 可重试的 HTTP 状态码（529 为 Anthropic 的过载响应）
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504, 529})
+
+# 服务端限流/过载：需要让进程内所有调用方一起降速
+THROTTLE_STATUS_CODES = frozenset({429, 529})
+
+# 估算 token 时每张图片按固定值计（base64 长度与 token 数无关）
+_IMAGE_TOKEN_ESTIMATE = 1600
+
+
+def parse_retry_after(headers, body: Optional[str] = None) -> Optional[float]:
+    """
+    解析服务端建议的重试等待时间（秒）
+
+    支持 retry-after-ms、retry-after（秒数或 HTTP 日期），
+    以及 Gemini 错误体中 RetryInfo 的 retryDelay（如 "12s"）。
+    """
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    if body:
+        try:
+            details = json.loads(body).get("error", {}).get("details") or []
+        except (ValueError, AttributeError):
+            details = []
+        for detail in details:
+            delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+            if isinstance(delay, str) and delay.endswith("s"):
+                try:
+                    return max(0.0, float(delay[:-1]))
+                except ValueError:
+                    pass
+    return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    计算第 attempt 次重试前的等待时间
+
+    有 retry-after 时在其基础上加少量抖动；否则使用 "full jitter" 指数退避，
+    避免多个并发调用在同一时刻集中重试。
+    """
+    if retry_after is not None:
+        return min(LLM_RETRY_MAX_DELAY, retry_after) + random.uniform(0, 0.5)
+    ceiling = min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def estimate_tokens(payload) -> int:
+    """
+    粗略估算请求体的输入 token 数，用于 TPM 限流
+
+    文本按约 3 个字符 1 个 token 估算；base64 图片按固定值计。
+    """
+    chars = 0
+    images = 0
+    stack = [payload]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            for key, value in item.items():
+                if key == "data" and isinstance(value, str):
+                    images += 1
+                else:
+                    stack.append(value)
+        elif isinstance(item, list):
+            stack.extend(item)
+        elif isinstance(item, str):
+            chars += len(item)
+    return chars // 3 + images * _IMAGE_TOKEN_ESTIMATE
+
+
+def _record_outcome(breaker, response):
+    """按最终状态码把整次调用的结果计入熔断器"""
+    if response.status_code in FAILURE_STATUS_CODES:
+        breaker.record_failure(f"HTTP {response.status_code}")
+    else:
+        breaker.record_success()
+
+
+def post_with_retry(
+    provider: str,
+    url: str,
+    *,
+    json_body: dict,
+    headers: Optional[dict] = None,
+    params: Optional[dict] = None,
+    timeout: float = 60,
+    stream: bool = False,
+    max_retries: int = LLM_MAX_RETRIES,
+    circuit: Optional[str] = None,
+):
+    """
+    通过共享连接池发送 POST 请求，按需限流和重试
+
+    参数:
+        provider: 提供商名称（"claude" / "gemini"），决定连接池和限流器
+        url: 请求地址
+        json_body: JSON 请求体
+        headers: 请求头
+        params: 查询参数
+        timeout: 单次请求超时（秒）
+        stream: 是否以流式方式读取响应体
+        max_retries: 最大重试次数
+        circuit: 熔断器接口名（如 "generateContent/<模型>"），None 表示不使用熔断器
+
+    返回:
+        requests.Response: 最后一次请求的响应（附带 retries 属性）
+
+    异常:
+        CircuitOpenError: 该接口已熔断
+    """
+    breaker = get_circuit_breaker(provider, circuit) if circuit else None
+    if breaker is None:
+        return _post_with_retry(provider, url, json_body, headers, params, timeout, stream, max_retries)
+    probe = breaker.before_call()
+    try:
+        response = _post_with_retry(provider, url, json_body, headers, params, timeout, stream, max_retries)
+    except Exception as e:
+        breaker.record_failure(str(e))
+        raise
+    except BaseException:
+        breaker.release(probe)
+        raise
+    _record_outcome(breaker, response)
+    return response
+
+
+def _post_with_retry(provider, url, json_body, headers, params, timeout, stream, max_retries):
+    """post_with_retry 的请求与重试循环"""
+    session = get_session(provider)
+    limiter = get_rate_limiter(provider)
+    tokens = estimate_tokens(json_body)
+
+    for attempt in range(max_retries + 1):
+        limiter.acquire(tokens)
+        try:
+            response = session.post(
+                url,
+                headers=headers,
+                params=params,
+                json=json_body,
+                timeout=timeout,
+                stream=stream,
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            # SSLError 是 ConnectionError 的子类，同样重试
+            if attempt >= max_retries:
+                raise Exception(
+                    f"API 请求在 {max_retries + 1} 次尝试后仍然失败: {type(e).__name__}: {e}"
+                )
+            delay = backoff_delay(attempt)
+            print(f"⚠️ {provider} 请求失败 (第 {attempt + 1} 次)，{delay:.1f}s 后重试: {type(e).__name__}")
+            time.sleep(delay)
+            continue
+
+        status = response.status_code
+        if status not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+            response.retries = attempt
+            return response
+
+        body = response.text if status == 429 else None
+        delay = backoff_delay(attempt, parse_retry_after(response.headers, body))
+        response.close()
+        print(f"⚠️ {provider} 返回 {status} (第 {attempt + 1} 次)，{delay:.1f}s 后重试")
+        if status in THROTTLE_STATUS_CODES:
+            # 由限流器统一等待，同时让其它并发调用一起暂停
+            limiter.pause(delay)
+        else:
+            time.sleep(delay)
+
+
+async def apost_with_retry(
+    provider: str,
+    url: str,
+    *,
+    json_body: dict,
+    headers: Optional[dict] = None,
+    params: Optional[dict] = None,
+    timeout: float = 60,
+    stream: bool = False,
+    max_retries: int = LLM_MAX_RETRIES,
+    circuit: Optional[str] = None,
+):
+    """
+    post_with_retry 的异步版本，使用共享的 httpx.AsyncClient
+
+    返回:
+        httpx.Response: 最后一次请求的响应（附带 retries 属性）；
+        stream=True 时调用方负责 aclose()
+
+    异常:
+        CircuitOpenError: 该接口已熔断
+    """
+    breaker = get_circuit_breaker(provider, circuit) if circuit else None
+    if breaker is None:
+        return await _apost_with_retry(provider, url, json_body, headers, params, timeout, stream, max_retries)
+    probe = breaker.before_call()
+    try:
+        response = await _apost_with_retry(provider, url, json_body, headers, params, timeout, stream, max_retries)
+    except Exception as e:
+        breaker.record_failure(str(e))
+        raise
+    except BaseException:
+        # 任务被取消（如对冲请求的另一方胜出）：没有结论，归还探测名额
+        breaker.release(probe)
+        raise
+    _record_outcome(breaker, response)
+    return response
+
+
+async def _apost_with_retry(provider, url, json_body, headers, params, timeout, stream, max_retries):
+    """apost_with_retry 的请求与重试循环"""
+    import httpx
+
+    client = get_async_client(provider)
+    limiter = get_rate_limiter(provider)
+    tokens = estimate_tokens(json_body)
+
+    for attempt in range(max_retries + 1):
+        await limiter.aacquire(tokens)
+        try:
+            request = client.build_request(
+                "POST",
+                url,
+                headers=headers,
+                params=params,
+                json=json_body,
+                timeout=timeout,
+            )
+            response = await client.send(request, stream=stream)
+        except httpx.TransportError as e:
+            if attempt >= max_retries:
+                raise Exception(
+                    f"API 请求在 {max_retries + 1} 次尝试后仍然失败: {type(e).__name__}: {e}"
+                )
+            delay = backoff_delay(attempt)
+            print(f"⚠️ {provider} 请求失败 (第 {attempt + 1} 次)，{delay:.1f}s 后重试: {type(e).__name__}")
+            await asyncio.sleep(delay)
+            continue
+
+        status = response.status_code
+        if status not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+            response.retries = attempt
+            return response
+
+        body = None
+        if status == 429:
+            await response.aread()
+            body = response.text
+        delay = backoff_delay(attempt, parse_retry_after(response.headers, body))
+        await response.aclose()
+        print(f"⚠️ {provider} 返回 {status} (第 {attempt + 1} 次)，{delay:.1f}s 后重试")
+        if status in THROTTLE_STATUS_CODES:
+            limiter.pause(delay)
+        else:
+            await asyncio.sleep(delay)
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+完整视频的分镜清单
+
+final_video.mp4 旁边保存 segments.json，记录每个分镜在完整视频中的起点、时长
+和源视频的内容哈希。单个章节重新生成/重新渲染后，sync_final_video 对比哈希找出
+变化的分镜，只把这些分镜按数据包替换进完整视频（见 video_merge.splice_segment），
+不需要重新运行 CLI 合并全部章节。
+
+增量替换要求每个分镜在完整视频中都从关键帧开始：按包拼接（remux，含单独转码的分镜）
+和单个分镜直接复制都满足；整体重编码（transcode）的 GOP 与分镜边界无关，
+ffmpeg 合并没有分镜时长，这两种情况下始终重新合并全部分镜。
+
+清单格式:
+    {
+        "version": 2,
+        "video": "final_video.mp4",
+        "strategy": "remux",
+        "video_sha256": "...",
+        "updated_at": 1700000000.0,
+        "segments": [
+            {"section_id": "section_1", "path": "media/videos/...", "sha256": "...",
+             "start": 0.0, "duration": 6.4, "transcoded": false},
+            ...
+        ]
+    }
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from mathvideo.video_merge import merge_videos, probe_segment, splice_segment
+
+MANIFEST_FILENAME = "segments.json"
+FINAL_VIDEO_FILENAME = "final_video.mp4"
+MANIFEST_VERSION = 2
+
+# 分镜边界一定落在关键帧上、可以增量替换的合并方式
+SPLICEABLE_STRATEGIES = ("copy", "remux")
+
+# 每个项目一把锁：同一项目的多个章节同时重新渲染时，依次更新 final_video.mp4 和清单
+_project_locks = {}
+_project_locks_lock = threading.Lock()
+
+
+def _project_lock(project_dir: str) -> threading.Lock:
+    with _project_locks_lock:
+        return _project_locks.setdefault(os.path.abspath(project_dir), threading.Lock())
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(project_dir: str) -> Optional[dict]:
+    """读取项目的分镜清单，不存在或格式不符时返回 None"""
+    path = os.path.join(project_dir, MANIFEST_FILENAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION or not isinstance(manifest.get("segments"), list):
+        return None
+    return manifest
+
+
+def _write_manifest(project_dir: str, manifest: dict):
+    path = os.path.join(project_dir, MANIFEST_FILENAME)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def save_manifest(project_dir: str, section_videos: List[Tuple[str, str]], segments: Optional[List[dict]] = None,
+                  strategy: str = "copy") -> dict:
+    """
+    合并完成后记录分镜清单
+
+    参数:
+        project_dir: 项目目录（final_video.mp4 所在目录）
+        section_videos: 按顺序排列的 (章节 ID, 分镜视频路径)
+        segments: merge_videos 返回的 segments；为 None 时（单个分镜直接复制）探测分镜时长
+        strategy: 完整视频的合并方式（merge_videos 返回的 strategy；单个分镜直接复制时为 "copy"）
+
+    返回:
+        dict: 写入的清单
+    """
+    if segments is None:
+        segments = []
+        start = 0.0
+        for _section_id, path in section_videos:
+            try:
+                duration = probe_segment(path)["duration"]
+            except Exception:
+                duration = None
+            segments.append({"start": start, "duration": duration, "transcoded": False})
+            start = start + duration if start is not None and duration is not None else None
+
+    entries = []
+    for (section_id, path), segment in zip(section_videos, segments):
+        entries.append({
+            "section_id": section_id,
+            "path": os.path.relpath(path, project_dir).replace(os.sep, "/"),
+            "sha256": file_sha256(path),
+            "start": segment["start"],
+            "duration": segment["duration"],
+            "transcoded": segment["transcoded"],
+        })
+    final_path = os.path.join(project_dir, FINAL_VIDEO_FILENAME)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "video": FINAL_VIDEO_FILENAME,
+        "strategy": strategy,
+        "video_sha256": file_sha256(final_path),
+        "updated_at": time.time(),
+        "segments": entries,
+    }
+    _write_manifest(project_dir, manifest)
+    return manifest
+
+
+def _splice_changed(project_dir: str, manifest: dict, section_videos: List[Tuple[str, str]]) -> Optional[List[str]]:
+    """
+    清单与完整视频一致、章节列表未变时，逐个替换内容变化的分镜
+
+    返回:
+        list: 被替换的章节 ID；无法增量替换（需要完整合并）时返回 None
+    """
+    final_path = os.path.join(project_dir, FINAL_VIDEO_FILENAME)
+    segments = manifest["segments"]
+    if not os.path.exists(final_path) or file_sha256(final_path) != manifest.get("video_sha256"):
+        return None
+    if manifest.get("strategy") not in SPLICEABLE_STRATEGIES:
+        # 整体重编码时分镜边界不一定是关键帧，按包替换会破坏前后分镜的解码
+        print(f"ℹ️ 完整视频由 {manifest.get('strategy')} 方式合并，无法增量替换分镜。")
+        return None
+    if [s["section_id"] for s in segments] != [section_id for section_id, _path in section_videos]:
+        return None
+    if any(s.get("start") is None or s.get("duration") is None for s in segments):
+        return None
+
+    hashes = [file_sha256(path) for _section_id, path in section_videos]
+    changed = [i for i, (segment, digest) in enumerate(zip(segments, hashes)) if segment["sha256"] != digest]
+    for index in changed:
+        section_id, path = section_videos[index]
+        spliced = splice_segment(final_path, segments, index, path)
+        delta = spliced["duration"] - segments[index]["duration"]
+        segments[index].update({
+            "path": os.path.relpath(path, project_dir).replace(os.sep, "/"),
+            "sha256": hashes[index],
+            "duration": round(spliced["duration"], 6),
+            "transcoded": spliced["transcoded"],
+        })
+        for segment in segments[index + 1:]:
+            segment["start"] = round(segment["start"] + delta, 6)
+    return [section_videos[i][0] for i in changed]
+
+
+def sync_final_video(project_dir: str, section_videos: List[Tuple[str, str]]) -> Optional[dict]:
+    """
+    让 final_video.mp4 与各章节当前的视频保持一致
+
+    清单有效时只替换内容变化的分镜；没有清单、完整视频被外部修改、章节列表变化
+    或上次合并是整体重编码时，重新合并全部分镜并重写清单。
+    同一项目的调用按项目加锁串行执行，清单始终描述实际写入的视频。
+
+    参数:
+        project_dir: 项目目录
+        section_videos: 按故事板顺序排列的 (章节 ID, 分镜视频路径)，只包含已渲染的章节
+
+    返回:
+        dict: {"path", "strategy", "sections", "elapsed", "segments"}
+            strategy 为 "unchanged" / "splice" / merge_videos 的合并方式；
+            sections 为本次替换的章节 ID；没有可合并的分镜或合并失败时返回 None
+    """
+    if not section_videos:
+        return None
+    with _project_lock(project_dir):
+        return _sync_final_video(project_dir, section_videos)
+
+
+def _sync_final_video(project_dir: str, section_videos: List[Tuple[str, str]]) -> Optional[dict]:
+    started = time.perf_counter()
+    final_path = os.path.join(project_dir, FINAL_VIDEO_FILENAME)
+
+    manifest = load_manifest(project_dir)
+    if manifest is not None:
+        try:
+            changed = _splice_changed(project_dir, manifest, section_videos)
+        except Exception as e:
+            print(f"⚠️ 增量替换分镜失败: {e}，重新合并全部分镜...")
+            changed = None
+        if changed is not None:
+            if changed:
+                manifest["video_sha256"] = file_sha256(final_path)
+                manifest["updated_at"] = time.time()
+                _write_manifest(project_dir, manifest)
+            return {
+                "path": final_path,
+                "strategy": "splice" if changed else "unchanged",
+                "sections": changed,
+                "elapsed": time.perf_counter() - started,
+                "segments": manifest["segments"],
+            }
+
+    merged = merge_videos([path for _section_id, path in section_videos], final_path)
+    if not merged:
+        return None
+    manifest = save_manifest(project_dir, section_videos, merged["segments"], merged["strategy"])
+    return {
+        "path": final_path,
+        "strategy": merged["strategy"],
+        "sections": [section_id for section_id, _path in section_videos],
+        "elapsed": time.perf_counter() - started,
+        "segments": manifest["segments"],
+    }
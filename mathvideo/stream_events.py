@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+流式输出事件
+
+CLI 在 Web 模式下（--stream-events）把 LLM 的增量输出以带前缀的 JSON 行
+打印到 stdout，后端 run_generation 识别这些行并转发为 WebSocket 的
+"stream" 事件，前端据此实时展示正在生成的代码/分镜。
+
+行格式:
+    @@STREAM {"stage": "code", "section": "section_1", "delta": "...", "done": false}
+"""
+import json
+import sys
+import threading
+import time
+from typing import Optional
+
+# 流式事件行前缀（普通日志不会以此开头）
+STREAM_EVENT_PREFIX = "@@STREAM "
+
+
+class StreamEmitter:
+    """
+    将 LLM 增量 token 节流后打印为流式事件行
+
+    每个 token 都打印一行会让 stdout 和 WebSocket 过于拥挤，
+    因此按时间间隔合并增量，结束时调用 close() 发送剩余内容和 done 标记。
+
+    参数:
+        stage: 生成阶段（"code" / "storyboard"）
+        section: 章节 ID（分镜阶段为 None）
+        min_interval: 两次输出之间的最小间隔（秒）
+    """
+
+    def __init__(self, stage: str, section: Optional[str] = None, min_interval: float = 0.25):
+        self.stage = stage
+        self.section = section
+        self.min_interval = min_interval
+        self._buffer = []
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, delta: str):
+        if not delta:
+            return
+        with self._lock:
+            self._buffer.append(delta)
+            if time.monotonic() - self._last_flush >= self.min_interval:
+                self._flush(done=False)
+
+    def close(self):
+        """发送剩余增量并标记该阶段结束"""
+        with self._lock:
+            self._flush(done=True)
+
+    def _flush(self, done: bool):
+        delta = "".join(self._buffer)
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        if not delta and not done:
+            return
+        event = {
+            "stage": self.stage,
+            "section": self.section,
+            "delta": delta,
+            "done": done,
+        }
+        # 单次 write 输出整行：并行生成多个章节时，各线程的事件行不会互相穿插
+        sys.stdout.write(STREAM_EVENT_PREFIX + json.dumps(event, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+
+def parse_stream_event(line: str) -> Optional[dict]:
+    """
+    解析一行 CLI 输出，如果是流式事件则返回事件字典，否则返回 None
+    """
+    if not line.startswith(STREAM_EVENT_PREFIX):
+        return None
+    try:
+        event = json.loads(line[len(STREAM_EVENT_PREFIX):])
+    except ValueError:
+        return None
+    return event if isinstance(event, dict) else None
@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""
+分镜视频合并
+
+各章节视频都由同一个 manim 质量预设渲染（libx264 / yuv420p / 相同分辨率和帧率），
+可以直接按数据包拼接（stream copy），不需要解码再编码。合并流程:
+
+1. 探测每个分镜的编码器、分辨率、像素格式、帧率、时间基和 extradata（SPS/PPS）
+2. 以出现次数最多的参数组合为基准，只把参数不一致的分镜转码成基准参数
+3. 逐个分镜读取数据包，按累计时长平移 pts/dts 后写入同一个输出流
+
+转码后仍无法与基准对齐、或者按包拼接失败时，回退到整体解码重编码；
+PyAV 不可用时回退到 CLI ffmpeg。
+"""
+import os
+import shutil
+import subprocess
+import threading
+import time
+from collections import Counter
+from fractions import Fraction
+from typing import List, Optional
+
+# 与 manim 渲染分镜时使用的编码参数保持一致，转码结果的 SPS/PPS 才能与其他分镜相同
+ENCODE_CODEC = "libx264"
+ENCODE_OPTIONS = {"crf": "23"}
+
+_SIGNATURE_FIELDS = ("codec", "width", "height", "pix_fmt", "fps", "time_base", "extradata")
+
+
+def probe_segment(path: str) -> dict:
+    """
+    读取分镜视频流的参数（只读容器头，不解码）
+
+    返回:
+        dict: codec / width / height / pix_fmt / fps / time_base / extradata / duration（秒）
+    """
+    import av
+
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        ctx = stream.codec_context
+        if stream.duration is not None and stream.time_base is not None:
+            duration = float(stream.duration * stream.time_base)
+        elif container.duration is not None:
+            duration = container.duration / av.time_base
+        else:
+            duration = None
+        return {
+            "codec": ctx.name,
+            "width": ctx.width,
+            "height": ctx.height,
+            "pix_fmt": ctx.pix_fmt,
+            "fps": stream.average_rate,
+            "time_base": stream.time_base,
+            "extradata": bytes(ctx.extradata or b""),
+            "duration": duration,
+        }
+
+
+def _signature(info: dict) -> tuple:
+    """能否按包拼接取决于这些参数是否完全一致"""
+    return tuple(info[name] for name in _SIGNATURE_FIELDS)
+
+
+def _describe_mismatch(info: dict, reference: dict) -> str:
+    diffs = []
+    for name in _SIGNATURE_FIELDS:
+        if info[name] != reference[name]:
+            diffs.append(name if name == "extradata" else f"{name} {info[name]} != {reference[name]}")
+    return ", ".join(diffs)
+
+
+def _add_stream_from_template(container, template):
+    # PyAV 14 起使用 add_stream_from_template，旧版本通过 add_stream(template=...)
+    if hasattr(container, "add_stream_from_template"):
+        return container.add_stream_from_template(template)
+    return container.add_stream(template=template)
+
+
+def _partial_path(output_path: str) -> str:
+    """先写临时文件再原子替换，正在播放旧视频的进程不受影响（文件名带进程/线程号，并发写入互不覆盖）"""
+    root, ext = os.path.splitext(output_path)
+    return f"{root}.{os.getpid()}.{threading.get_ident()}.partial{ext}"
+
+
+def _work_dir(output_path: str) -> str:
+    """单独转码分镜用的临时目录（同样按进程/线程区分）"""
+    return os.path.join(os.path.dirname(output_path) or ".", f"_merge_tmp.{os.getpid()}.{threading.get_ident()}")
+
+
+def _encode_resampled(sources: List[tuple], dst: str, reference: dict):
+    """
+    把若干分镜依次解码、按基准参数重新编码到同一个文件
+
+    帧率不同时按时间戳重采样：每个输出帧取显示时间不晚于它的最近一个源帧，
+    最后一个源帧持续到该分镜结束。
+
+    参数:
+        sources: [(路径, 时长秒数或 None), ...]
+        dst: 输出路径
+        reference: 基准参数（probe_segment 的返回值）
+    """
+    import av
+
+    fps = Fraction(reference["fps"])
+    frame_duration = 1 / fps
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+
+    with av.open(dst, mode="w") as output_container:
+        output_stream = output_container.add_stream(ENCODE_CODEC, rate=fps, options=dict(ENCODE_OPTIONS))
+        output_stream.width = reference["width"]
+        output_stream.height = reference["height"]
+        output_stream.pix_fmt = reference["pix_fmt"]
+        output_stream.time_base = reference["time_base"]
+
+        def emit(frame, index):
+            out = frame.reformat(
+                width=reference["width"],
+                height=reference["height"],
+                format=reference["pix_fmt"],
+            )
+            out.pts = index
+            out.time_base = frame_duration
+            for packet in output_stream.encode(out):
+                output_container.mux(packet)
+
+        index = 0
+        for path, duration in sources:
+            # 当前分镜在输出中的起点
+            base = index * frame_duration
+            first_index = index
+            last = None
+            last_timestamp = Fraction(0)
+            with av.open(path) as input_container:
+                input_stream = input_container.streams.video[0]
+                origin = None
+                decoded = 0
+                for frame in input_container.decode(input_stream):
+                    if frame.pts is not None and frame.time_base is not None:
+                        timestamp = Fraction(frame.pts) * frame.time_base
+                    else:
+                        timestamp = decoded * frame_duration
+                    decoded += 1
+                    if origin is None:
+                        origin = timestamp
+                    timestamp = base + timestamp - origin
+                    # 显示时间早于当前源帧的输出帧都使用上一源帧
+                    while last is not None and index * frame_duration < timestamp:
+                        emit(last, index)
+                        index += 1
+                    last, last_timestamp = frame, timestamp
+
+            if last is not None:
+                end = base + Fraction(duration).limit_denominator(1_000_000) if duration else last_timestamp
+                while index == first_index or index * frame_duration < end:
+                    emit(last, index)
+                    index += 1
+        for packet in output_stream.encode():
+            output_container.mux(packet)
+
+
+def transcode_segment(src: str, dst: str, reference: dict, duration: Optional[float] = None):
+    """
+    把单个分镜转码为基准参数（编码器、分辨率、像素格式、帧率、时间基）
+
+    参数:
+        src: 源分镜路径
+        dst: 输出路径
+        reference: 基准参数（probe_segment 的返回值）
+        duration: 源分镜时长（秒），用于把最后一帧补齐到原时长
+    """
+    _encode_resampled([(src, duration)], dst, reference)
+
+
+def _mux_segment(path: str, output_container, output_stream, offset: Fraction) -> Fraction:
+    """
+    把一个分镜的全部数据包平移到 offset（秒）之后写入输出流
+
+    返回:
+        Fraction: 分镜时长（秒）
+    """
+    import av
+
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        time_base = stream.time_base
+        start = stream.start_time or 0
+        shift = round(offset / time_base) - start
+        end = start
+        for packet in container.demux(stream):
+            # demux 结束时会产生不含数据的 flush 包
+            if packet.dts is None:
+                continue
+            if packet.pts is None:
+                packet.pts = packet.dts
+            end = max(end, packet.pts + (packet.duration or 0))
+            packet.pts += shift
+            packet.dts += shift
+            packet.stream = output_stream
+            output_container.mux(packet)
+    return Fraction(end - start) * time_base
+
+
+def _write_atomically(output_path: str, template_path: str, write):
+    """以 template_path 的视频流为模板写入临时文件，成功后原子替换 output_path"""
+    import av
+
+    tmp_path = _partial_path(output_path)
+    template_container = av.open(template_path)
+    output_container = av.open(tmp_path, mode="w")
+    try:
+        output_stream = _add_stream_from_template(output_container, template_container.streams.video[0])
+        result = write(output_container, output_stream)
+    except BaseException:
+        output_container.close()
+        template_container.close()
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    output_container.close()
+    template_container.close()
+    os.replace(tmp_path, output_path)
+    return result
+
+
+def remux_segments(video_paths: List[str], output_path: str) -> List[float]:
+    """
+    按数据包拼接参数一致的分镜（不解码）
+
+    每个分镜的 pts/dts 平移到前面所有分镜的累计时长之后，写入由第一个分镜
+    复制出的输出流，时间基差异由 PyAV 在写入时换算。
+
+    返回:
+        list: 每个分镜的时长（秒）
+    """
+    def write(output_container, output_stream):
+        durations = []
+        offset = Fraction(0)
+        for path in video_paths:
+            duration = _mux_segment(path, output_container, output_stream, offset)
+            durations.append(float(duration))
+            offset += duration
+        return durations
+
+    return _write_atomically(output_path, video_paths[0], write)
+
+
+def splice_segment(output_path: str, segments: List[dict], index: int, video_path: str) -> dict:
+    """
+    把已合并视频中的第 index 个分镜替换为 video_path（不重新合并其他分镜）
+
+    其他分镜的数据包直接从已合并视频中复制，后续分镜按新旧时长差平移；
+    新分镜参数与已合并视频不一致时先单独转码。
+
+    参数:
+        output_path: 已合并的视频（原地替换）
+        segments: 已合并视频中各分镜的 {"start", "duration"}（秒）
+        index: 要替换的分镜序号
+        video_path: 新的分镜视频
+
+    返回:
+        dict: {"duration": 新分镜时长（秒）, "transcoded": 是否转码}
+    """
+    import av
+
+    reference = probe_segment(output_path)
+    info = probe_segment(video_path)
+    work_dir = _work_dir(output_path)
+    source = video_path
+    transcoded = _signature(info) != _signature(reference)
+    try:
+        if transcoded:
+            print(f"🔁 分镜 {os.path.basename(video_path)} 与已合并视频参数不一致（{_describe_mismatch(info, reference)}），单独转码...")
+            source = os.path.join(work_dir, f"{index:03d}_{os.path.basename(video_path)}")
+            transcode_segment(video_path, source, reference, info["duration"])
+            converted = probe_segment(source)
+            if _signature(converted) != _signature(reference):
+                raise RuntimeError(f"转码后仍与已合并视频不一致（{_describe_mismatch(converted, reference)}）")
+
+        old_start = Fraction(segments[index]["start"]).limit_denominator(1_000_000)
+        old_end = old_start + Fraction(segments[index]["duration"]).limit_denominator(1_000_000)
+
+        def write(output_container, output_stream):
+            with av.open(output_path) as merged:
+                stream = merged.streams.video[0]
+                time_base = stream.time_base
+                # 分镜边界按半帧容差划分，避免浮点起点的舍入误差
+                tolerance = 1 / Fraction(reference["fps"]) / 2
+                lower = round((old_start - tolerance) / time_base)
+                upper = round((old_end - tolerance) / time_base)
+                new_duration = None
+                shift = 0
+                for packet in merged.demux(stream):
+                    if packet.dts is None:
+                        continue
+                    pts = packet.pts if packet.pts is not None else packet.dts
+                    if lower <= pts < upper:
+                        continue
+                    if pts >= upper and new_duration is None:
+                        new_duration = _mux_segment(source, output_container, output_stream, old_start)
+                        shift = round((new_duration - (old_end - old_start)) / time_base)
+                    if pts >= upper:
+                        if packet.pts is None:
+                            packet.pts = packet.dts
+                        packet.pts += shift
+                        packet.dts += shift
+                    packet.stream = output_stream
+                    output_container.mux(packet)
+                if new_duration is None:
+                    # 替换的是最后一个分镜
+                    new_duration = _mux_segment(source, output_container, output_stream, old_start)
+            return new_duration
+
+        duration = _write_atomically(output_path, output_path, write)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {"duration": float(duration), "transcoded": transcoded}
+
+
+def transcode_all(video_paths: List[str], output_path: str, infos: Optional[List[dict]] = None):
+    """整体回退：解码所有分镜并按第一个分镜的参数重新编码（最慢，但不要求分镜参数一致）"""
+    if not infos:
+        infos = [probe_segment(path) for path in video_paths]
+    tmp_path = _partial_path(output_path)
+    try:
+        _encode_resampled(
+            [(path, info["duration"]) for path, info in zip(video_paths, infos)],
+            tmp_path,
+            infos[0],
+        )
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    os.replace(tmp_path, output_path)
+
+
+def _ffmpeg_concat(video_paths: List[str], output_path: str) -> bool:
+    """CLI ffmpeg 的 concat + stream copy"""
+    ffmpeg_cmd = shutil.which("ffmpeg")
+    if not ffmpeg_cmd:
+        print("⚠️ ffmpeg 未找到，无法合并视频")
+        return False
+
+    concat_list_path = os.path.join(os.path.dirname(output_path) or ".",
+                                    f"_concat_list.{os.getpid()}.{threading.get_ident()}.txt")
+    try:
+        with open(concat_list_path, "w", encoding="utf-8") as f:
+            for vp in video_paths:
+                abs_path = os.path.abspath(vp).replace("\\", "/")
+                f.write(f"file '{abs_path}'\n")
+
+        cmd = [
+            ffmpeg_cmd, "-y",
+            "-f", "concat", "-safe", "0",
+            "-i", concat_list_path,
+            "-c", "copy",
+            output_path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+
+        if result.returncode == 0 and os.path.exists(output_path):
+            os.remove(concat_list_path)
+            return True
+        print(f"⚠️ ffmpeg 合并失败: {result.stderr[-300:] if result.stderr else '未知错误'}")
+        return False
+    except Exception as e:
+        print(f"⚠️ 视频合并异常: {e}")
+        return False
+
+
+def _segment_table(video_paths: List[str], durations: List[Optional[float]], transcoded: set) -> List[dict]:
+    segments = []
+    start = 0.0
+    for index, (path, duration) in enumerate(zip(video_paths, durations)):
+        segments.append({
+            "path": path,
+            "start": round(start, 6) if start is not None else None,
+            "duration": round(duration, 6) if duration is not None else None,
+            "transcoded": index in transcoded,
+        })
+        start = start + duration if start is not None and duration is not None else None
+    return segments
+
+
+def merge_videos(video_paths: List[str], output_path: str) -> Optional[dict]:
+    """
+    按顺序合并分镜视频
+
+    参数:
+        video_paths: 按顺序排列的分镜视频路径
+        output_path: 输出文件路径
+
+    返回:
+        dict: {"path", "strategy", "segments", "transcoded", "elapsed"}，失败时返回 None
+            strategy 为 "remux"（按包拼接）/ "transcode"（整体重编码）/ "ffmpeg"
+            segments 为每个分镜在合并视频中的起点和时长（秒）
+    """
+    if not video_paths:
+        return None
+    started = time.perf_counter()
+
+    def result(strategy, durations, transcoded=()):
+        return {
+            "path": output_path,
+            "strategy": strategy,
+            "segments": _segment_table(video_paths, durations, set(transcoded)),
+            "transcoded": len(transcoded),
+            "elapsed": time.perf_counter() - started,
+        }
+
+    try:
+        import av  # noqa: F401
+    except ImportError:
+        print("⚠️ PyAV 未安装，尝试使用 CLI ffmpeg...")
+        if _ffmpeg_concat(video_paths, output_path):
+            return result("ffmpeg", [None] * len(video_paths))
+        return None
+
+    infos = []
+    work_dir = _work_dir(output_path)
+    try:
+        infos = [probe_segment(path) for path in video_paths]
+        # 以出现最多的参数组合为基准，需要转码的分镜最少
+        counts = Counter(_signature(info) for info in infos)
+        reference = max(infos, key=lambda info: counts[_signature(info)])
+
+        sources = []
+        transcoded = []
+        for index, (path, info) in enumerate(zip(video_paths, infos)):
+            if _signature(info) == _signature(reference):
+                sources.append(path)
+                continue
+            print(f"🔁 分镜 {os.path.basename(path)} 与其他分镜参数不一致（{_describe_mismatch(info, reference)}），单独转码...")
+            dst = os.path.join(work_dir, f"{index:03d}_{os.path.basename(path)}")
+            transcode_segment(path, dst, reference, info["duration"])
+            converted = probe_segment(dst)
+            if _signature(converted) != _signature(reference):
+                raise RuntimeError(f"转码后仍与基准不一致（{_describe_mismatch(converted, reference)}）")
+            sources.append(dst)
+            transcoded.append(index)
+
+        durations = remux_segments(sources, output_path)
+        return result("remux", durations, transcoded)
+    except Exception as e:
+        print(f"⚠️ 按包拼接失败: {e}，改为整体重新编码...")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    durations = [info["duration"] for info in infos] if len(infos) == len(video_paths) else [None] * len(video_paths)
+    try:
+        transcode_all(video_paths, output_path, infos if len(infos) == len(video_paths) else None)
+        return result("transcode", durations, range(len(video_paths)))
+    except Exception as e:
+        print(f"⚠️ PyAV 合并失败: {e}，尝试使用 CLI ffmpeg...")
+
+    if _ffmpeg_concat(video_paths, output_path):
+        return result("ffmpeg", durations)
+    return None
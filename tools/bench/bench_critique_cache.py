@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+视觉评估缓存基准测试：内容命中、感知哈希命中与未命中的判定和耗时
+
+先对一个类 manim 的合成视频（黑底上移动的色块和文字条）"评估"一次并写入 CritiqueCache，
+再对以下变体重复查询，输出关键帧 dHash 最大汉明距离、颜色缩略图最大差、判定结果和查询耗时:
+    same         同一文件（内容命中）
+    reencode     同样的画面用不同 CRF 重新编码（字节不同、画面一致 → 感知哈希命中）
+    shift-1px    色块整体右移 1 像素（亚像素级差异 → 感知哈希命中）
+    shift-8px    色块整体右移 8 像素（布局有变化 → 未命中）
+    recolor      色块换色（亮度梯度不变，颜色缩略图变化 → 未命中）
+
+视觉模型调用一次通常需要数秒到数十秒；查询只需要哈希文件和解码 4 帧。
+
+用法:
+    python tools/bench/bench_critique_cache.py --seconds 8
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import av
+import numpy as np
+
+from mathvideo.critique_cache import CritiqueCache, frame_hashes, hash_distance, section_fingerprint
+from mathvideo.frame_sampler import sample_frames
+from mathvideo.segment_manifest import file_sha256
+
+SECTION = {"id": "section_1", "title": "勾股定理", "lecture_lines": ["a² + b² = c²"]}
+VARIANT = "bench"
+
+
+def make_video(path: str, seconds: float, fps: int = 15, width: int = 854, height: int = 480,
+               crf: int = 23, shift: int = 0, color=(88, 196, 221)):
+    """类 manim 画面：黑底、左侧白色文字条、右侧移动的色块"""
+    with av.open(path, mode="w") as container:
+        stream = container.add_stream("libx264", rate=fps, options={"crf": str(crf)})
+        stream.width = width
+        stream.height = height
+        stream.pix_fmt = "yuv420p"
+        frames = max(1, int(seconds * fps))
+        for i in range(frames):
+            image = np.zeros((height, width, 3), dtype=np.uint8)
+            for line in range(5):
+                y = 60 + line * 60
+                image[y:y + 12, 30:30 + 160 + 20 * line] = 230
+            x = 300 + shift + int(400 * i / max(1, frames - 1))
+            image[180:300, x:x + 120] = color
+            frame = av.VideoFrame.from_ndarray(image, format="rgb24")
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+
+
+def lookup(cache: CritiqueCache, video_path: str, slot: str):
+    """与 VisualCritic._lookup 相同的查询顺序：内容键 → 感知哈希 → 未命中"""
+    started = time.perf_counter()
+    key = cache.make_key(file_sha256(video_path), section_fingerprint(SECTION), VARIANT)
+    if cache.get(key) is not None:
+        return "content hit", 0, (time.perf_counter() - started) * 1000
+    hashes = frame_hashes(sample_frames(video_path))
+    matched = cache.match_last(slot, hashes)
+    elapsed = (time.perf_counter() - started) * 1000
+    if matched is not None:
+        return "perceptual hit", matched[1], elapsed
+    return "miss", None, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="视觉评估缓存的命中判定与查询耗时")
+    parser.add_argument("--seconds", type=float, default=8, help="视频时长（秒）")
+    parser.add_argument("--max-distance", type=int, default=4, help="dHash 允许的最大逐帧汉明距离")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="mathvideo-critique-bench-")
+    try:
+        cache = CritiqueCache(os.path.join(workdir, "cache"), max_distance=args.max_distance)
+        # 章节槽位由固定的视频路径决定：每个变体依次复制到这个路径再查询
+        video_path = os.path.join(workdir, "SectionScene.mp4")
+        make_video(video_path, args.seconds)
+        section_fp = section_fingerprint(SECTION)
+        slot = cache.slot_key(video_path, section_fp, VARIANT)
+        base_hashes = frame_hashes(sample_frames(video_path))
+        cache.put(cache.make_key(file_sha256(video_path), section_fp, VARIANT), slot, {
+            "feedback": {"has_issues": False, "issues": [], "suggestion": ""},
+            "provider": "gemini",
+            "model": "bench",
+            "frame_hashes": base_hashes,
+        })
+        base_copy = os.path.join(workdir, "base.mp4")
+        shutil.copyfile(video_path, base_copy)
+
+        variants = {
+            "same": None,
+            "reencode": {"crf": 30},
+            "shift-1px": {"shift": 1},
+            "shift-8px": {"shift": 8},
+            "recolor": {"color": (252, 98, 85)},
+        }
+        print(f"{'variant':<10} {'dhash':>6} {'color':>6} {'result':<15} {'lookup':>9}")
+        for name, options in variants.items():
+            variant_path = os.path.join(workdir, f"{name}.mp4")
+            if options is None:
+                shutil.copyfile(base_copy, variant_path)
+            else:
+                make_video(variant_path, args.seconds, **options)
+            distance = hash_distance(base_hashes, frame_hashes(sample_frames(variant_path)))
+            shutil.copyfile(variant_path, video_path)
+            result, _, elapsed = lookup(cache, video_path, slot)
+            print(f"{name:<10} {distance[0]:>6} {distance[1]:>6} {result:<15} {elapsed:>7.1f}ms")
+        print(f"stats: {cache.stats()}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+视觉评估取帧基准测试：对比旧的全量解码取帧与 seek 采样的耗时
+
+旧流程解码所有帧，每秒一帧缩放后写成 PNG，再从中选 4 帧；
+新流程（mathvideo.frame_sampler）按元数据 seek 到目标帧附近，只解码需要的帧并保存在内存中。
+对不同时长的合成视频分别测量两种方式的耗时和写入磁盘的帧数。
+
+用法:
+    python tools/bench/bench_frame_sampler.py --seconds 5 30 120 --runs 3
+"""
+import argparse
+import glob
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import av
+from PIL import Image
+
+from bench_merge import make_segment
+from mathvideo.frame_sampler import sample_frames
+
+
+def decode_all_frames(video_path: str, frames_dir: str) -> int:
+    """旧流程：全量解码 + 每秒一帧写 PNG + 选 4 帧，返回写入磁盘的帧数"""
+    os.makedirs(frames_dir, exist_ok=True)
+    for f in glob.glob(os.path.join(frames_dir, "frame_*.png")):
+        os.remove(f)
+    container = av.open(video_path)
+    frame_interval = max(1, int(float(container.streams.video[0].average_rate)))
+    saved = 0
+    for index, frame in enumerate(container.decode(video=0)):
+        if index % frame_interval == 0:
+            img = frame.to_image()
+            w, h = img.size
+            img = img.resize((320, int(h * 320 / w)), Image.LANCZOS)
+            img.save(os.path.join(frames_dir, f"frame_{saved:03d}.png"))
+            saved += 1
+    container.close()
+    files = sorted(glob.glob(os.path.join(frames_dir, "frame_*.png")))
+    if len(files) > 4:
+        files = [files[0], files[len(files) // 3], files[2 * len(files) // 3], files[-1]]
+    for path in files:
+        with open(path, "rb") as f:
+            f.read()
+    return saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全量解码取帧与 seek 采样的耗时对比")
+    parser.add_argument("--seconds", type=float, nargs="+", default=[5, 30, 120], help="视频时长（秒）")
+    parser.add_argument("--runs", type=int, default=3, help="每种方式重复次数（取中位数）")
+    parser.add_argument("--fps", type=int, default=15, help="帧率（manim -ql 为 15）")
+    parser.add_argument("--size", default="854x480", help="分辨率（manim -ql 为 854x480）")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    workdir = tempfile.mkdtemp(prefix="mathvideo-sampler-bench-")
+    print(f"{'seconds':>8} {'full decode':>12} {'png writes':>11} {'seek sample':>12} {'speedup':>8}")
+    try:
+        for seconds in args.seconds:
+            video_path = os.path.join(workdir, f"video_{seconds:g}.mp4")
+            make_segment(video_path, seconds, args.fps, width, height, 0)
+
+            full, seek = [], []
+            writes = 0
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                writes = decode_all_frames(video_path, os.path.join(workdir, "frames"))
+                full.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                sample_frames(video_path)
+                seek.append(time.perf_counter() - start)
+
+            full_median = statistics.median(full)
+            seek_median = statistics.median(seek)
+            print(
+                f"{seconds:>8g} {full_median:>11.3f}s {writes:>11} {seek_median:>11.3f}s "
+                f"{full_median / max(seek_median, 1e-6):>7.1f}x"
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+视觉请求对冲基准测试：顺序回退与对冲（mathvideo.hedging）的端到端耗时对比
+
+用模拟的提供商代替真实视觉模型（asyncio.sleep，不发出网络请求）:
+    主提供商  大部分请求耗时 base 秒，按 --tail 的比例卡住 stall 秒后失败（模拟超时）
+    备用提供商  耗时 base × --secondary-factor 秒
+同一组随机耗时分别用 VISION_HEDGE=false（原来的顺序回退）和对冲跑一遍，
+输出 p50 / p90 / p99 / 最大耗时、发出对冲的比例，以及对冲记录的节省时间之和。
+
+用法:
+    python tools/bench/bench_hedging.py --requests 200 --tail 0.1
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import mathvideo.hedging as hedging
+
+
+def make_plan(requests: int, base: float, stall: float, tail: float, factor: float, seed: int = 0) -> list:
+    """每个请求的 (主提供商耗时, 主提供商是否失败, 备用提供商耗时)"""
+    rng = random.Random(seed)
+    plan = []
+    for _ in range(requests):
+        stalled = rng.random() < tail
+        primary = stall if stalled else base * rng.uniform(0.7, 1.3)
+        plan.append((primary, stalled, base * factor * rng.uniform(0.8, 1.2)))
+    return plan
+
+
+async def run(plan: list, hedge: bool, delay: float, concurrency: int = 20):
+    """按计划并发执行请求，返回 (每个请求的耗时, 请求信息列表)"""
+    hedging.VISION_HEDGE = hedge
+    hedging.VISION_HEDGE_DELAY = delay
+    hedging._tracker = hedging.LatencyTracker()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, infos = [], []
+
+    async def one(primary, stalled, secondary):
+        async def call_primary():
+            await asyncio.sleep(primary)
+            return None if stalled else "gemini"
+
+        async def call_secondary():
+            await asyncio.sleep(secondary)
+            return "claude"
+
+        async with semaphore:
+            started = time.perf_counter()
+            _, info = await hedging.ahedged_call(
+                "critic", [("gemini", call_primary), ("claude", call_secondary)], lambda x: x,
+            )
+            latencies.append(time.perf_counter() - started)
+            infos.append(info)
+
+    await asyncio.gather(*(one(*item) for item in plan))
+    return latencies, infos
+
+
+def describe(name: str, latencies: list, infos: list) -> str:
+    ordered = sorted(latencies)
+
+    def pct(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    hedged = sum(1 for info in infos if info.get("hedged"))
+    saved = sum(info.get("saved_s", 0) for info in infos)
+    return (f"{name:<10} {statistics.median(ordered):>6.2f}s {pct(0.9):>6.2f}s {pct(0.99):>6.2f}s "
+            f"{ordered[-1]:>6.2f}s {hedged / len(infos):>7.0%} {saved:>8.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="顺序回退与对冲的视觉请求耗时对比（模拟提供商）")
+    parser.add_argument("--requests", type=int, default=200, help="请求数")
+    parser.add_argument("--base", type=float, default=0.2, help="主提供商正常耗时（秒）")
+    parser.add_argument("--stall", type=float, default=2.0, help="主提供商卡住后失败的耗时（秒，模拟超时）")
+    parser.add_argument("--tail", type=float, default=0.1, help="主提供商卡住的比例")
+    parser.add_argument("--secondary-factor", type=float, default=1.5, help="备用提供商耗时相对主提供商的倍数")
+    parser.add_argument("--delay", type=float, default=0.5, help="样本不足时的对冲等待时间（秒）")
+    args = parser.parse_args()
+
+    # 指标写入需要项目目录，这里不设置，record_hedge 直接跳过
+    plan = make_plan(args.requests, args.base, args.stall, args.tail, args.secondary_factor)
+    print(f"{'mode':<10} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7} {'hedged':>7} {'saved':>9}")
+    for name, hedge in (("sequential", False), ("hedged", True)):
+        latencies, infos = asyncio.run(run(plan, hedge, args.delay))
+        print(describe(name, latencies, infos))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+连接池基准测试：对比裸 requests.post 与共享连接池的握手开销
+
+在本地桩服务器上模拟一次完整 Pipeline 的 LLM 调用次数
+（router + planner + 每个 section 的 coder/fix/refine/critic），
+统计服务器端新建的 TCP 连接数和总耗时。
+
+用法:
+    python tools/bench/bench_http_pool.py --sections 6 --runs 3 --tls
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import requests
+import urllib3
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mathvideo.http_pool import get_session, close_sessions
+from stub_server import start_stub_server
+
+# 自签名证书下关闭证书校验告警
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+PAYLOAD = {
+    "model": "stub",
+    "max_tokens": 16,
+    "messages": [{"role": "user", "content": "ping"}],
+}
+
+
+def _run_pipeline(post, url: str, calls: int) -> float:
+    """按顺序发出 calls 次请求，返回耗时（秒）"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        response = post(url, json=PAYLOAD, timeout=30, verify=False)
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP 连接池握手开销基准")
+    parser.add_argument("--sections", type=int, default=6, help="模拟的 section 数量")
+    parser.add_argument("--runs", type=int, default=3, help="重复运行次数")
+    parser.add_argument("--tls", action="store_true", help="使用 HTTPS（更接近真实 API 的握手成本）")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(tls=args.tls)
+    url = f"{base_url}/v1/messages"
+    # router + planner + 每个 section 的 coder/fix/refine/critic
+    calls = 2 + args.sections * 4
+    print(f"Stub: {base_url}  calls/run: {calls}  runs: {args.runs}")
+
+    results = {}
+    for mode in ("bare", "pooled"):
+        timings = []
+        server.state.reset()
+        for _ in range(args.runs):
+            if mode == "bare":
+                timings.append(_run_pipeline(requests.post, url, calls))
+            else:
+                timings.append(_run_pipeline(get_session("claude").post, url, calls))
+        close_sessions()
+        results[mode] = {
+            "median_s": statistics.median(timings),
+            "connections": server.state.connections,
+            "requests": server.state.requests,
+        }
+
+    for mode, r in results.items():
+        per_run_conns = r["connections"] / args.runs
+        print(
+            f"{mode:>7}: median {r['median_s'] * 1000:8.1f} ms/run, "
+            f"{per_run_conns:5.1f} connections/run, {r['requests']} requests"
+        )
+    saved = results["bare"]["median_s"] - results["pooled"]["median_s"]
+    saved_conns = (results["bare"]["connections"] - results["pooled"]["connections"]) / args.runs
+    print(f"Saved per pipeline run: {saved * 1000:.1f} ms, {saved_conns:.1f} handshakes")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
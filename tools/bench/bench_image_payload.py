@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+视觉请求图片载荷基准测试：对比旧的逐帧 PNG / 原图直传与 mathvideo.image_payload 的编码结果
+
+两个场景:
+1. critic 关键帧：4 帧类 manim 画面（黑底、左侧讲义文字、右侧几何图形），320px 宽
+   - 旧流程：每帧一张 PNG
+   - 新流程：逐帧 JPEG / WebP，以及 4 帧拼成一张联系表
+2. describe_images 输入：一张 4032x3024 的手机照片式图片（JPEG 和 PNG 各一份）
+   - 旧流程：原文件 base64 直传（且一律标为 image/png）
+   - 新流程：按像素预算缩小后编码为 JPEG / WebP（编码耗时包含读取原图）
+
+输出每种方式的图片数、编码后字节数、base64 请求体积、估算图片 token 和编码耗时。
+
+用法:
+    python tools/bench/bench_image_payload.py --quality 85 --runs 5
+"""
+import argparse
+import base64
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from mathvideo.image_payload import build_image_contents, estimate_image_tokens, load_image
+
+
+def manim_like_frame(index: int, width: int = 854, height: int = 480):
+    """类 manim 画面：黑底，左侧白色讲义文字，右侧彩色几何图形（抗锯齿后缩到 320px 宽）"""
+    scale = 2
+    image = Image.new("RGB", (width * scale, height * scale), "black")
+    draw = ImageDraw.Draw(image)
+    for line in range(6):
+        y = (40 + line * 60) * scale
+        color = "yellow" if line == index % 6 else "white"
+        draw.text((30 * scale, y), f"Step {line + 1}: a^2 + b^2 = c^2  ({index})", fill=color)
+        draw.line((30 * scale, y + 30 * scale, 300 * scale, y + 30 * scale), fill="#444444", width=scale)
+    cx, cy, r = 620 * scale, 240 * scale, (80 + index * 15) * scale
+    draw.ellipse((cx - r, cy - r, cx + r, cy + r), outline="#58C4DD", width=4 * scale)
+    draw.polygon([(cx - r, cy + r), (cx + r, cy + r), (cx - r, cy - r)], outline="#FC6255", width=4 * scale)
+    image = image.resize((width, height), Image.LANCZOS)
+    return image.resize((320, int(height * 320 / width)), Image.LANCZOS)
+
+
+def photo_like_image(path: str, width: int = 4032, height: int = 3024):
+    """手机拍摄题目照片式图片：带噪声的渐变纸面 + 深色手写线条，保存为 PNG"""
+    rng = random.Random(0)
+    small = Image.new("RGB", (width // 8, height // 8))
+    pixels = small.load()
+    for y in range(small.height):
+        for x in range(small.width):
+            base = 200 + int(40 * x / small.width) - int(30 * y / small.height)
+            noise = rng.randint(-12, 12)
+            pixels[x, y] = (base + noise, base + noise - 5, base + noise - 15)
+    image = small.resize((width, height), Image.BICUBIC)
+    draw = ImageDraw.Draw(image)
+    for _ in range(60):
+        x, y = rng.randint(0, width), rng.randint(0, height)
+        draw.line((x, y, x + rng.randint(-600, 600), y + rng.randint(-400, 400)), fill=(40, 40, 60), width=8)
+    image = image.filter(ImageFilter.GaussianBlur(1.2))
+    image.save(path, format="PNG")
+
+
+def measure(runs: int, fn):
+    times = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(times)
+
+
+def print_row(name, images, raw_bytes, payload_bytes, claude_tokens, gemini_tokens, encode_ms):
+    print(
+        f"{name:<28} {images:>6} {raw_bytes / 1024:>9.1f}KB {payload_bytes / 1024:>9.1f}KB "
+        f"{claude_tokens:>8} {gemini_tokens:>8} {encode_ms:>9.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="视觉请求图片载荷的体积、token 与编码耗时对比")
+    parser.add_argument("--quality", type=int, default=85, help="JPEG / WebP 质量")
+    parser.add_argument("--max-pixels", type=int, default=1150000, help="单张图片像素预算")
+    parser.add_argument("--runs", type=int, default=5, help="每种方式重复次数（取编码耗时中位数）")
+    args = parser.parse_args()
+
+    header = f"{'strategy':<28} {'images':>6} {'bytes':>11} {'base64':>11} {'claude':>8} {'gemini':>8} {'encode':>11}"
+
+    # 场景 1：critic 关键帧
+    frames = [manim_like_frame(i) for i in range(4)]
+    print("critic keyframes (4 frames, 320px)")
+    print(header)
+
+    def old_png():
+        blobs = []
+        for frame in frames:
+            buffer = io.BytesIO()
+            frame.save(buffer, format="PNG")
+            blobs.append(buffer.getvalue())
+        return blobs
+
+    blobs, ms = measure(args.runs, old_png)
+    tokens = [estimate_image_tokens(*frame.size) for frame in frames]
+    print_row(
+        "png per frame (old)", len(blobs), sum(map(len, blobs)),
+        sum(len(base64.b64encode(b)) for b in blobs),
+        sum(t[0] for t in tokens), sum(t[1] for t in tokens), ms,
+    )
+    for fmt in ("jpeg", "webp"):
+        for tile in (False, True):
+            (contents, stats), ms = measure(
+                args.runs,
+                lambda: build_image_contents(frames, tile=tile, fmt=fmt, quality=args.quality, max_pixels=args.max_pixels, label="bench "),
+            )
+            name = f"{fmt} {'contact sheet' if tile else 'per frame'}"
+            print_row(name, stats["images"], stats["bytes"], stats["payload_bytes"],
+                      stats["claude_tokens"], stats["gemini_tokens"], ms)
+
+    # 场景 2：describe_images 输入照片（手机照片通常是 JPEG，截图通常是 PNG）
+    workdir = tempfile.mkdtemp(prefix="mathvideo-payload-bench-")
+    png_path = os.path.join(workdir, "photo.png")
+    photo_like_image(png_path)
+    jpeg_path = os.path.join(workdir, "photo.jpg")
+    Image.open(png_path).save(jpeg_path, format="JPEG", quality=92)
+    claude, gemini = estimate_image_tokens(4032, 3024)
+    for photo_path in (jpeg_path, png_path):
+        source_format = os.path.splitext(photo_path)[1][1:]
+        print(f"\ndescribe_images input (4032x3024 {source_format})")
+        print(header)
+        with open(photo_path, "rb") as f:
+            raw = f.read()
+        print_row("raw file as image/png (old)", 1, len(raw), len(base64.b64encode(raw)), claude, gemini, 0.0)
+        for fmt in ("jpeg", "webp"):
+            (contents, stats), ms = measure(
+                args.runs,
+                lambda: build_image_contents([load_image(photo_path, max_pixels=args.max_pixels)], fmt=fmt,
+                                             quality=args.quality, max_pixels=args.max_pixels,
+                                             source_bytes=len(raw), label="bench "),
+            )
+            print_row(f"{fmt} within pixel budget", stats["images"], stats["bytes"], stats["payload_bytes"],
+                      stats["claude_tokens"], stats["gemini_tokens"], ms)
+        os.remove(photo_path)
+    os.rmdir(workdir)
+
+if __name__ == "__main__":
+    main()
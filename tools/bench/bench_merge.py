@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+分镜合并基准测试：对比按包拼接（remux）与整体解码重编码（transcode）的合并耗时
+
+用与 manim 相同的编码参数（libx264 / yuv420p / crf 23）生成若干合成分镜，
+按「分镜数量 × 分镜时长」的组合分别合并，输出两种方式的耗时和加速比。
+加 --mismatch 时最后一个分镜使用不同的帧率和分辨率，测试只转码不一致分镜的路径。
+
+用法:
+    python tools/bench/bench_merge.py --sections 3 6 12 --seconds 2 8 --fps 15 --size 854x480
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import av
+import numpy as np
+
+from mathvideo.video_merge import ENCODE_CODEC, ENCODE_OPTIONS, transcode_all, merge_videos
+
+
+def make_segment(path: str, seconds: float, fps: int, width: int, height: int, seed: int):
+    """生成一个移动色块的合成分镜"""
+    rng = np.random.default_rng(seed)
+    color = rng.integers(0, 255, size=3, dtype=np.uint8)
+    with av.open(path, mode="w") as container:
+        stream = container.add_stream(ENCODE_CODEC, rate=fps, options=dict(ENCODE_OPTIONS))
+        stream.width = width
+        stream.height = height
+        stream.pix_fmt = "yuv420p"
+        frames = max(1, int(seconds * fps))
+        box = max(8, height // 6)
+        for i in range(frames):
+            image = np.zeros((height, width, 3), dtype=np.uint8)
+            x = int((width - box) * i / max(1, frames - 1))
+            image[height // 2 - box // 2: height // 2 + box // 2, x: x + box] = color
+            frame = av.VideoFrame.from_ndarray(image, format="rgb24")
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分镜视频按包拼接与整体重编码的耗时对比")
+    parser.add_argument("--sections", type=int, nargs="+", default=[3, 6, 12], help="分镜数量")
+    parser.add_argument("--seconds", type=float, nargs="+", default=[2, 8], help="每个分镜的时长（秒）")
+    parser.add_argument("--fps", type=int, default=15, help="帧率（manim -ql 为 15）")
+    parser.add_argument("--size", default="854x480", help="分辨率（manim -ql 为 854x480）")
+    parser.add_argument("--mismatch", action="store_true", help="最后一个分镜使用不同的帧率和分辨率")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    workdir = tempfile.mkdtemp(prefix="mathvideo-merge-bench-")
+    print(f"{'sections':>8} {'seconds':>8} {'remux':>9} {'transcode':>10} {'speedup':>8}  strategy")
+    try:
+        for seconds in args.seconds:
+            for count in args.sections:
+                case_dir = os.path.join(workdir, f"{count}x{seconds:g}")
+                os.makedirs(case_dir)
+                paths = []
+                for i in range(count):
+                    path = os.path.join(case_dir, f"section_{i}.mp4")
+                    if args.mismatch and i == count - 1:
+                        make_segment(path, seconds, args.fps * 2, width // 2 * 2 + 2, height, i)
+                    else:
+                        make_segment(path, seconds, args.fps, width, height, i)
+                    paths.append(path)
+
+                start = time.perf_counter()
+                info = merge_videos(paths, os.path.join(case_dir, "remux.mp4"))
+                remux_time = time.perf_counter() - start
+                if info is None:
+                    print("❌ 合并失败")
+                    sys.exit(1)
+
+                start = time.perf_counter()
+                transcode_all(paths, os.path.join(case_dir, "transcode.mp4"))
+                transcode_time = time.perf_counter() - start
+
+                strategy = info["strategy"]
+                if info["transcoded"]:
+                    strategy += f" ({info['transcoded']} transcoded)"
+                print(
+                    f"{count:>8} {seconds:>8g} {remux_time:>8.3f}s {transcode_time:>9.3f}s "
+                    f"{transcode_time / max(remux_time, 1e-6):>7.1f}x  {strategy}"
+                )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
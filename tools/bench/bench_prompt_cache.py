@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+提示缓存基准测试：检查 CODER 请求的结构，并对比启用提示缓存前后的延迟和输入用量
+
+在本地桩服务器上为多个模拟章节生成代码请求，校验:
+  1. 静态指令 + Skill 作为带 cache_control 的 system 块发送
+  2. 所有章节的 system 前缀完全相同（章节数据只出现在 user 消息中）
+并统计桩服务器模拟的缓存写入/读取 token 数和每次请求的耗时。
+
+用法:
+    python tools/bench/bench_prompt_cache.py --sections 6 --task-type geometry --prefill-ms 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# 基准只访问本地桩服务器，关闭响应缓存和流式输出以便直接比较请求耗时
+os.environ.setdefault("CLAUDE_API_KEY", "stub")
+os.environ["LLM_CACHE_MODE"] = "off"
+os.environ["LLM_STREAMING"] = "false"
+
+from mathvideo import llm_client
+from mathvideo.agents.coder import _build_code_chain
+from stub_server import start_stub_server
+
+
+def _fake_section(index: int) -> dict:
+    return {
+        "id": f"section_{index}",
+        "title": f"第{index}步",
+        "lecture_lines": [f"步骤{index}说明", "观察图形变化"],
+        "animations": [f"在网格中画出第{index}个对象", "高亮新增的边"],
+    }
+
+
+def _run(url: str, sections: int, task_type: str) -> list:
+    """依次发出 sections 个代码生成请求，返回每次耗时（秒）"""
+    latencies = []
+    for i in range(1, sections + 1):
+        chain, params = _build_code_chain(_fake_section(i), "", task_type)
+        # chain = prompt | llm | parser，把 LLM 指向桩服务器
+        chain.steps[1].api_url = url
+        start = time.perf_counter()
+        chain.invoke(params)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _check_shapes(recorded: list, cache_enabled: bool):
+    """校验请求结构，返回 (是否通过, 说明)"""
+    systems = [body.get("system") for body in recorded]
+    if not systems or any(s is None for s in systems):
+        return False, "缺少 system 字段"
+    if cache_enabled:
+        if not all(isinstance(s, list) and s and s[-1].get("cache_control") for s in systems):
+            return False, "system 块未带 cache_control"
+        texts = ["".join(block.get("text", "") for block in s) for s in systems]
+    else:
+        texts = systems
+    if len(set(map(str, texts))) != 1:
+        return False, "各章节的 system 前缀不一致"
+    return True, "OK"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CODER 提示缓存结构检查与基准")
+    parser.add_argument("--sections", type=int, default=6, help="模拟的 section 数量")
+    parser.add_argument("--task-type", default="geometry", help="加载哪类 Skill（knowledge/geometry/problem/proof）")
+    parser.add_argument("--prefill-ms", type=float, default=200.0, help="桩服务器每 1000 个未缓存输入 token 的预填充延迟（毫秒）")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(prefill_ms_per_ktok=args.prefill_ms)
+    url = f"{base_url}/v1/messages"
+    print(f"Stub: {base_url}  sections: {args.sections}  task_type: {args.task_type}")
+
+    failed = False
+    for cache_enabled in (False, True):
+        llm_client.PROMPT_CACHE_ENABLED = cache_enabled
+        server.state.reset()
+        before = llm_client.get_usage_totals()
+        latencies = _run(url, args.sections, args.task_type)
+        after = llm_client.get_usage_totals()
+        usage = {k: after[k] - before[k] for k in after}
+
+        ok, detail = _check_shapes(server.state.recorded, cache_enabled)
+        failed = failed or not ok
+        label = "prompt cache on " if cache_enabled else "prompt cache off"
+        print(
+            f"{label}: first {latencies[0] * 1000:7.1f} ms  "
+            f"rest median {statistics.median(latencies[1:] or latencies) * 1000:7.1f} ms  "
+            f"input {usage['input_tokens']:6d}  "
+            f"cache write {usage['cache_creation_input_tokens']:6d}  "
+            f"cache read {usage['cache_read_input_tokens']:6d}  "
+            f"shape: {detail}"
+        )
+
+    server.shutdown()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+渲染进程池基准测试：对比每次启动 manim 子进程与常驻渲染进程的单次渲染耗时
+
+生成一个最小的 TeachingScene 场景，先用 `python -m manim -ql` 冷启动渲染 runs 次，
+再通过 RenderPool 渲染 runs 次，输出每次耗时和平均省去的启动时间。
+
+用法:
+    python tools/bench/bench_render_pool.py --runs 5 --workers 1
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from mathvideo.render_pool import RenderPool, _render_subprocess
+
+SCENE_CODE = '''
+from mathvideo.manim_base import TeachingScene
+from manim import *
+
+class BenchScene(TeachingScene):
+    def construct(self):
+        lines = ["第1行", "第2行"]
+        self.setup_layout("渲染基准", lines)
+        self.highlight_line(0)
+        circle = Circle(color=BLUE)
+        self.place_in_area(circle, "C3", "H8")
+        self.play(Create(circle), run_time=0.5)
+        self.wait(0.2)
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常驻渲染进程池与 manim 子进程的耗时对比")
+    parser.add_argument("--runs", type=int, default=5, help="每种方式渲染的次数")
+    parser.add_argument("--workers", type=int, default=1, help="进程池大小")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="mathvideo-render-bench-")
+    script_path = os.path.join(workdir, "bench_scene.py")
+    with open(script_path, "w", encoding="utf-8") as f:
+        f.write(SCENE_CODE)
+    media_dir = os.path.join(workdir, "media")
+
+    cold = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        result = _render_subprocess(script_path, "BenchScene", media_dir, "low_quality", None, str(PROJECT_ROOT))
+        cold.append(time.perf_counter() - start)
+        if not result["ok"]:
+            print(f"❌ 子进程渲染失败:\n{result['error'][-500:]}")
+            sys.exit(1)
+
+    pool = RenderPool(size=args.workers)
+    warm = []
+    saved = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        result = pool.render(script_path, "BenchScene", media_dir)
+        warm.append(time.perf_counter() - start)
+        if result is None or not result["ok"]:
+            print(f"❌ 进程池渲染失败: {pool.unavailable_reason or (result or {}).get('error', '')[-500:]}")
+            sys.exit(1)
+        saved.append(result["startup_saved"])
+    pool.shutdown()
+
+    print(f"subprocess : " + "  ".join(f"{t:6.2f}s" for t in cold) + f"  median {statistics.median(cold):6.2f}s")
+    print(f"render pool: " + "  ".join(f"{t:6.2f}s" for t in warm) + f"  median {statistics.median(warm):6.2f}s")
+    print(f"startup saved per job: " + "  ".join(f"{t:5.2f}s" for t in saved))
+    print(f"median speedup: {statistics.median(cold) / max(statistics.median(warm), 1e-6):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,545 @@
+#!/usr/bin/env python3
+"""
+本地 LLM / 视觉桩服务器（用于离线基准测试）
+
+模拟两类接口，整条 Pipeline（cli.main、后端、重试、并发）都可以在无网络的机器上运行:
+    POST <base>/v1/messages                         Anthropic Messages API（支持 stream=true 的 SSE）
+    POST <base>/v1beta/models/<model>:generateContent  Gemini generateContent
+
+响应来源（按优先级）:
+    1. --recordings 目录中录制的响应：Anthropic 请求按 LLMCache.make_key 查找，
+       可直接使用 LLM_CACHE_MODE=record 录制出的缓存目录；Gemini 请求按请求体哈希查找
+    2. 内置的预设响应：根据提示内容识别路由/分镜/代码/修复/优化/资产/视觉评估/图片描述，
+       返回格式正确、可以渲染的最小结果
+
+故障注入:
+    --latency-ms / --jitter-ms   每个请求的固定/随机附加延迟
+    --chunk-ms                   SSE 每个增量之间的间隔
+    --error-rate                 返回 500 的概率
+    --rate-limit-rate            返回 429（带 retry-after）的概率
+    --overload-rate              返回 529 的概率
+    --prefill-ms                 每 1000 个未缓存输入 token 的模拟预填充延迟
+
+统计服务器端建立的 TCP 连接数，记录每个请求体的结构，并模拟提示缓存：
+带 cache_control 的 system 前缀第一次出现时计为缓存写入，之后计为缓存读取。
+
+用法:
+    python tools/bench/stub_server.py --port 8765 --latency-ms 300 --rate-limit-rate 0.1
+
+    CLAUDE_BASE_URL=http://127.0.0.1:8765/v1 \\
+    GEMINI_NATIVE_BASE_URL=http://127.0.0.1:8765/v1beta \\
+    CLAUDE_API_KEY=stub GEMINI_API_KEY=stub \\
+    python -m mathvideo.cli "勾股定理" --render
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+
+class StubConfig:
+    """故障注入与响应来源配置"""
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        chunk_ms: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        overload_rate: float = 0.0,
+        retry_after: float = 1.0,
+        prefill_ms_per_ktok: float = 0.0,
+        recordings_dir: Optional[str] = None,
+        seed: Optional[int] = None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.chunk_ms = chunk_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.overload_rate = overload_rate
+        self.retry_after = retry_after
+        self.prefill_ms_per_ktok = prefill_ms_per_ktok
+        self.recordings_dir = recordings_dir
+        self.random = random.Random(seed)
+
+
+class StubState:
+    """服务器端计数器（线程安全）"""
+
+    # 最多保留的请求体数量
+    MAX_RECORDED = 200
+
+    def __init__(self, prefill_ms_per_ktok: float = 0.0):
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.recorded = []
+        self.faults = {"500": 0, "429": 0, "529": 0}
+        self.prefill_ms_per_ktok = prefill_ms_per_ktok
+        self._cached_prefixes = set()
+
+    def add_connection(self):
+        with self.lock:
+            self.connections += 1
+
+    def add_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def add_fault(self, status: int):
+        with self.lock:
+            self.faults[str(status)] = self.faults.get(str(status), 0) + 1
+
+    def record(self, body: dict):
+        with self.lock:
+            self.recorded.append(body)
+            del self.recorded[:-self.MAX_RECORDED]
+
+    def simulate_usage(self, body: dict) -> dict:
+        """按请求体估算 token 用量，并模拟 system 前缀的提示缓存"""
+        cached_text = ""
+        other_text = json.dumps(body.get("messages", body.get("contents", [])), ensure_ascii=False)
+        system = body.get("system")
+        if isinstance(system, list):
+            for block in system:
+                if block.get("cache_control"):
+                    cached_text += block.get("text", "")
+                else:
+                    other_text += block.get("text", "")
+        elif isinstance(system, str):
+            other_text += system
+
+        # 粗略估算：约 2 个字符 1 个 token（中英混合）
+        prefix_tokens = len(cached_text) // 2
+        usage = {
+            "input_tokens": len(other_text) // 2,
+            "output_tokens": 1,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+        }
+        if prefix_tokens:
+            digest = hashlib.sha256(cached_text.encode("utf-8")).hexdigest()
+            with self.lock:
+                hit = digest in self._cached_prefixes
+                self._cached_prefixes.add(digest)
+            usage["cache_read_input_tokens" if hit else "cache_creation_input_tokens"] = prefix_tokens
+        return usage
+
+    def prefill_delay(self, usage: dict) -> float:
+        """未命中缓存的输入 token 对应的模拟预填充耗时（秒）"""
+        uncached = usage["input_tokens"] + usage["cache_creation_input_tokens"]
+        return uncached / 1000 * self.prefill_ms_per_ktok / 1000
+
+    def reset(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = 0
+            self.recorded = []
+            self.faults = {"500": 0, "429": 0, "529": 0}
+            self._cached_prefixes = set()
+
+
+# ============================================================================
+# 预设响应
+# ============================================================================
+
+def _request_text(body: dict) -> str:
+    """拼接请求中的全部文本（system + 消息 / Gemini parts），用于识别调用类型"""
+    texts = []
+    system = body.get("system")
+    if isinstance(system, str):
+        texts.append(system)
+    elif isinstance(system, list):
+        texts.extend(block.get("text", "") for block in system)
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            texts.extend(block.get("text", "") for block in content if block.get("type") == "text")
+    for content in body.get("contents", []):
+        texts.extend(part.get("text", "") for part in content.get("parts", []) if "text" in part)
+    return "\n".join(texts)
+
+
+def _user_text(body: dict) -> str:
+    """最后一条用户消息的文本"""
+    for message in reversed(body.get("messages", [])):
+        if message.get("role") == "user":
+            content = message.get("content")
+            if isinstance(content, str):
+                return content
+            return "\n".join(b.get("text", "") for b in content if b.get("type") == "text")
+    return ""
+
+
+def _extract_field(text: str, label: str, default: str) -> str:
+    match = re.search(rf"^{label}:\s*(.+)$", text, re.MULTILINE)
+    return match.group(1).strip() if match else default
+
+
+def _canned_code(title: str, lines_repr: str) -> str:
+    return (
+        "```python\n"
+        "from mathvideo.manim_base import TeachingScene\n"
+        "from manim import *\n"
+        "\n"
+        "class SectionScene(TeachingScene):\n"
+        "    def construct(self):\n"
+        f"        lines = {lines_repr}\n"
+        f"        self.setup_layout({title!r}, lines)\n"
+        "        for i in range(len(lines)):\n"
+        "            self.highlight_line(i)\n"
+        "            circle = Circle(color=BLUE)\n"
+        "            self.place_in_area(circle, 'C3', 'H8')\n"
+        "            self.play(Create(circle), run_time=0.5)\n"
+        "            self.play(FadeOut(circle), run_time=0.3)\n"
+        "        self.wait(0.5)\n"
+        "```\n"
+    )
+
+
+def _canned_storyboard(user_text: str) -> str:
+    topic = _extract_field(user_text, "输入文本", "桩服务器示例")[:12] or "桩服务器示例"
+    sections = [
+        {
+            "id": f"section_{i}",
+            "title": f"第{i}部分",
+            "inherited_objects": [],
+            "new_objects": [],
+            "lecture_lines": [f"要点{i}-1", f"要点{i}-2"],
+            "animations": ["画一个圆", "淡出"],
+        }
+        for i in range(1, 4)
+    ]
+    return json.dumps({"topic": topic, "task_type": "knowledge", "sections": sections}, ensure_ascii=False)
+
+
+def canned_response_text(body: dict) -> str:
+    """根据请求内容返回对应 Agent 期望格式的预设文本"""
+    text = _request_text(body)
+    user = _user_text(body)
+    if "knowledge / geometry / problem / proof" in text:
+        return "knowledge"
+    if '"has_issues"' in text:
+        return json.dumps({"has_issues": False, "issues": [], "suggestion": ""}, ensure_ascii=False)
+    if "请描述这些图片" in text or "描述图片中的数学内容" in text:
+        return "图中是一个直角三角形ABC，直角在C，两直角边分别为3和4，求斜边长度。"
+    if "识别 1-4 个具体的关键词" in text:
+        return "[]"
+    if "请修复下面的 JSON" in text:
+        match = re.search(r"```json\n(.*)\n```", text, re.DOTALL)
+        return match.group(1) if match else "{}"
+    if '"sections"' in text:
+        return _canned_storyboard(user)
+    if "## 原始代码" in text:
+        # 修复 / 优化：原样返回原始代码
+        match = re.search(r"```python\n(.*?)\n```", text, re.DOTALL)
+        return f"```python\n{match.group(1)}\n```\n" if match else _canned_code("章节", "['要点']")
+    if "SectionScene" in text:
+        title = _extract_field(user, "章节标题", "章节")
+        lines_repr = _extract_field(user, "讲义行", "['要点']")
+        return _canned_code(title, lines_repr)
+    return "ok"
+
+
+def _lookup_recording(recordings_dir: Optional[str], key: str) -> Optional[dict]:
+    if not recordings_dir:
+        return None
+    path = os.path.join(recordings_dir, key[:2], f"{key}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("response")
+    except (OSError, ValueError):
+        return None
+
+
+def anthropic_response(body: dict, recordings_dir: Optional[str], usage: dict) -> dict:
+    """构造 Anthropic Messages 响应（优先使用录制的响应）"""
+    if recordings_dir:
+        from mathvideo.llm_cache import LLMCache
+        recorded = _lookup_recording(recordings_dir, LLMCache.make_key(body))
+        if recorded:
+            return recorded
+    text = canned_response_text(body)
+    return {
+        "id": "msg_stub",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "stub"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "usage": dict(usage, output_tokens=max(1, len(text) // 2)),
+    }
+
+
+def gemini_response(body: dict, recordings_dir: Optional[str]) -> dict:
+    """构造 Gemini generateContent 响应（优先使用录制的响应）"""
+    key = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+    recorded = _lookup_recording(recordings_dir, key)
+    if recorded:
+        return recorded
+    text = canned_response_text(body)
+    prompt_tokens = len(json.dumps(body.get("contents", []), ensure_ascii=False)) // 2
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finishReason": "STOP",
+        }],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": max(1, len(text) // 2),
+        },
+    }
+
+
+# ============================================================================
+# HTTP 处理
+# ============================================================================
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 才支持 keep-alive 连接复用
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # 每个 handler 实例对应一个 TCP 连接
+        self.server.state.add_connection()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: Optional[dict] = None):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _inject_fault(self, gemini: bool) -> bool:
+        """按配置的概率返回 500 / 429 / 529，返回是否已发送故障响应"""
+        config = self.server.config
+        roll = config.random.random()
+        faults = (
+            (config.rate_limit_rate, 429, "rate_limit_error", "RESOURCE_EXHAUSTED"),
+            (config.overload_rate, 529, "overloaded_error", "UNAVAILABLE"),
+            (config.error_rate, 500, "api_error", "INTERNAL"),
+        )
+        threshold = 0.0
+        for rate, status, anthropic_type, gemini_status in faults:
+            threshold += rate
+            if roll < threshold:
+                self.server.state.add_fault(status)
+                headers = {"retry-after": f"{config.retry_after:g}"} if status == 429 else None
+                if gemini:
+                    body = {"error": {"code": status, "message": "stub fault", "status": gemini_status}}
+                else:
+                    body = {"type": "error", "error": {"type": anthropic_type, "message": "stub fault"}}
+                self._send_json(status, body, headers)
+                return True
+        return False
+
+    def _sleep_latency(self):
+        config = self.server.config
+        delay = config.latency_ms + config.random.uniform(0, config.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _send_sse(self, response: dict):
+        """把 Anthropic 响应拆成 SSE 事件流发送"""
+        text = "".join(b.get("text", "") for b in response.get("content", []) if b.get("type") == "text")
+        usage = response.get("usage", {})
+        chunk_delay = self.server.config.chunk_ms / 1000
+
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream; charset=utf-8")
+        self.send_header("cache-control", "no-cache")
+        self.send_header("connection", "close")
+        self.end_headers()
+        # SSE 响应没有 content-length，发送完毕后关闭连接
+        self.close_connection = True
+
+        def _event(name: str, data: dict):
+            payload = f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+            self.wfile.write(payload.encode("utf-8"))
+            self.wfile.flush()
+
+        input_usage = {k: v for k, v in usage.items() if k != "output_tokens"}
+        _event("message_start", {"type": "message_start", "message": {
+            "id": response.get("id", "msg_stub"), "type": "message", "role": "assistant",
+            "content": [], "usage": dict(input_usage, output_tokens=1),
+        }})
+        _event("content_block_start", {"type": "content_block_start", "index": 0,
+                                       "content_block": {"type": "text", "text": ""}})
+        try:
+            for start in range(0, len(text), 40):
+                _event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                               "delta": {"type": "text_delta", "text": text[start:start + 40]}})
+                if chunk_delay:
+                    time.sleep(chunk_delay)
+            _event("content_block_stop", {"type": "content_block_stop", "index": 0})
+            _event("message_delta", {"type": "message_delta",
+                                     "delta": {"stop_reason": response.get("stop_reason", "end_turn")},
+                                     "usage": {"output_tokens": usage.get("output_tokens", 1)}})
+            _event("message_stop", {"type": "message_stop"})
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前关闭（代码块闭合后停止生成）
+            pass
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            body = {}
+        state = self.server.state
+        config = self.server.config
+        state.add_request()
+        state.record(body)
+
+        gemini = ":generateContent" in self.path
+        if not gemini and not self.path.rstrip("/").endswith("/messages"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+
+        self._sleep_latency()
+        if self._inject_fault(gemini):
+            return
+
+        if gemini:
+            self._send_json(200, gemini_response(body, config.recordings_dir))
+            return
+
+        usage = state.simulate_usage(body)
+        delay = state.prefill_delay(usage)
+        if delay:
+            time.sleep(delay)
+        response = anthropic_response(body, config.recordings_dir, usage)
+        if body.get("stream"):
+            self._send_sse(response)
+        else:
+            self._send_json(200, response)
+
+
+def _make_self_signed_cert(workdir: str):
+    """使用 openssl CLI 生成自签名证书，返回 (cert_path, key_path)；openssl 不可用时返回 None"""
+    openssl = shutil.which("openssl")
+    if not openssl:
+        return None
+    cert_path = os.path.join(workdir, "stub_cert.pem")
+    key_path = os.path.join(workdir, "stub_key.pem")
+    result = subprocess.run(
+        [openssl, "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+         "-keyout", key_path, "-out", cert_path, "-days", "1", "-subj", "/CN=127.0.0.1"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    if result.returncode != 0:
+        return None
+    return cert_path, key_path
+
+
+def start_stub_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    tls: bool = False,
+    prefill_ms_per_ktok: float = 0.0,
+    config: Optional[StubConfig] = None,
+):
+    """
+    在后台线程启动桩服务器。
+
+    参数:
+        host: 监听地址
+        port: 监听端口（0 表示随机端口）
+        tls: 是否启用 HTTPS（需要 openssl 生成自签名证书）
+        prefill_ms_per_ktok: 每 1000 个未缓存输入 token 的模拟预填充延迟（毫秒）
+        config: 故障注入与响应来源配置，默认无延迟、无故障
+
+    返回:
+        tuple: (server, base_url)，server.state 为 StubState 计数器；
+        Anthropic 接口为 base_url + "/v1/messages"，Gemini 接口为 base_url + "/v1beta"
+    """
+    config = config or StubConfig(prefill_ms_per_ktok=prefill_ms_per_ktok)
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(config.prefill_ms_per_ktok)
+    server.config = config
+    scheme = "http"
+    if tls:
+        cert = _make_self_signed_cert(tempfile.mkdtemp(prefix="mathvideo-stub-"))
+        if cert:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(*cert)
+            server.socket = context.wrap_socket(server.socket, server_side=True)
+            scheme = "https"
+        else:
+            print("⚠️ openssl 不可用，桩服务器回退为 HTTP")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"{scheme}://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MathVideo 本地 LLM / 视觉桩服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tls", action="store_true", help="使用自签名证书启用 HTTPS")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="每个请求的固定附加延迟（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="每个请求的随机附加延迟上限（毫秒）")
+    parser.add_argument("--chunk-ms", type=float, default=0.0, help="SSE 每个增量之间的间隔（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--overload-rate", type=float, default=0.0, help="返回 529 的概率")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应的 retry-after（秒）")
+    parser.add_argument("--prefill-ms", type=float, default=0.0, help="每 1000 个未缓存输入 token 的模拟预填充延迟（毫秒）")
+    parser.add_argument("--recordings", default=None, help="录制响应目录（LLM_CACHE_MODE=record 生成的缓存目录）")
+    parser.add_argument("--seed", type=int, default=None, help="故障注入随机种子（便于复现）")
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        chunk_ms=args.chunk_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        overload_rate=args.overload_rate,
+        retry_after=args.retry_after,
+        prefill_ms_per_ktok=args.prefill_ms,
+        recordings_dir=os.path.expanduser(args.recordings) if args.recordings else None,
+        seed=args.seed,
+    )
+    server, base_url = start_stub_server(args.host, args.port, tls=args.tls, config=config)
+    print(f"Stub server listening on {base_url}")
+    print(f"  CLAUDE_BASE_URL={base_url}/v1")
+    print(f"  GEMINI_NATIVE_BASE_URL={base_url}/v1beta")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        state = server.state
+        print(f"\nrequests: {state.requests}  connections: {state.connections}  faults: {state.faults}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()